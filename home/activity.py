@@ -0,0 +1,185 @@
+import atexit
+import logging
+import threading
+import time
+
+from django.contrib.auth.models import User
+from django.db import (
+    DatabaseError, IntegrityError, OperationalError, close_old_connections, connections, transaction,
+)
+from django.db.models import Case, DateTimeField, F, Value, When
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from .models import UserActivity, UserActivitySummary
+
+
+logger = logging.getLogger(__name__)
+
+# flush once this many events are waiting...
+ACTIVITY_FLUSH_SIZE = 200
+# ...or once the oldest has waited this long (seconds)
+ACTIVITY_FLUSH_INTERVAL = 2.0
+# events kept while the database is unreachable; the oldest go first
+ACTIVITY_MAX_PENDING = 10000
+
+
+class ActivityRecorder:
+    """
+    Collects UserActivity rows in memory and writes them with one
+    bulk_create per batch, so login, logout and signup don't each wait on
+    SQLite's write lock for a single-row INSERT.
+
+    Rows keep the time the event happened, not the time of the flush.
+    With background=True a daemon thread flushes on the size or time
+    threshold; close() runs at interpreter exit, so a gunicorn or uvicorn
+    worker flushes what is pending when it shuts down.
+    """
+
+    def __init__(self, flush_size=ACTIVITY_FLUSH_SIZE, flush_interval=ACTIVITY_FLUSH_INTERVAL, background=True):
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.background = background
+        self._pending = []
+        self._lock = threading.Lock()
+        self._wake = threading.Condition(self._lock)
+        self._thread = None
+        self._closing = False
+
+    def record(self, user, action):
+        with self._lock:
+            self._pending.append(UserActivity(user=user, action=action, timestamp=timezone.now()))
+            if len(self._pending) > ACTIVITY_MAX_PENDING:
+                del self._pending[:len(self._pending) - ACTIVITY_MAX_PENDING]
+            if self.background and self._thread is None:
+                self._start()
+            if len(self._pending) >= self.flush_size:
+                self._wake.notify()
+
+    def flush(self):
+        """Write every pending row now; returns how many were written."""
+        with self._lock:
+            batch, self._pending = self._pending, []
+        if not batch:
+            return 0
+        try:
+            self._write(batch)
+        except OperationalError:
+            # locked or unreachable: worth another try
+            logger.exception("Could not write %d activity rows; keeping them for the next flush", len(batch))
+            with self._lock:
+                self._pending[:0] = batch
+            return 0
+        except IntegrityError:
+            # retrying can't help, but one bad event mustn't sink the rest:
+            # drop events of users deleted since they were recorded
+            live = set(
+                User.objects.filter(pk__in={e.user_id for e in batch}).values_list("pk", flat=True)
+            )
+            kept = [e for e in batch if e.user_id in live]
+            logger.warning("Dropped %d activity rows of deleted users", len(batch) - len(kept))
+            try:
+                self._write(kept)
+            except DatabaseError:
+                logger.exception("Dropped %d activity rows that could not be written", len(kept))
+                return 0
+            return len(kept)
+        except DatabaseError:
+            logger.exception("Dropped %d activity rows that could not be written", len(batch))
+            return 0
+        return len(batch)
+
+    def _write(self, batch):
+        with transaction.atomic():
+            UserActivity.objects.bulk_create(batch, batch_size=self.flush_size)
+            update_summaries(batch)
+
+    def close(self):
+        """Stop the flusher thread and write whatever is still pending."""
+        with self._lock:
+            self._closing = True
+            self._wake.notify()
+            thread = self._thread
+        if thread is not None:
+            thread.join()
+        self.flush()
+
+    def _start(self):
+        self._thread = threading.Thread(target=self._run, name="activity-recorder", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _run(self):
+        while True:
+            with self._lock:
+                self._wake.wait_for(
+                    lambda: self._closing or len(self._pending) >= self.flush_size,
+                    self.flush_interval,
+                )
+                if self._closing:
+                    break
+            if not self.flush() and self._pending:
+                # the write failed; back off instead of retrying in a tight loop
+                time.sleep(self.flush_interval)
+            # this thread outlives requests, so drop connections that went stale
+            close_old_connections()
+        connections.close_all()
+
+
+def _later(field, when):
+    """SQL for the later of the column and when, treating NULL as older."""
+    when = Value(when, output_field=DateTimeField())
+    return Greatest(Coalesce(field, when), when)
+
+
+def update_summaries(events):
+    """
+    Fold newly written UserActivity rows into the per-user summaries, one
+    UPDATE per user. Comparisons happen in SQL, so a batch flushed late by
+    another worker never rolls a newer "last action" back.
+    """
+    per_user = {}
+    for event in events:
+        s = per_user.setdefault(event.user_id, {"user": event.user, "logins": 0, "last_login": None, "last": event})
+        if event.action == "login":
+            s["logins"] += 1
+            s["last_login"] = max(filter(None, [s["last_login"], event.timestamp]))
+        if event.timestamp >= s["last"].timestamp:
+            s["last"] = event
+
+    for user_id, s in per_user.items():
+        last = s["last"]
+        changes = {
+            "login_count": F("login_count") + s["logins"],
+            "last_action": Case(
+                When(last_action_at__gt=last.timestamp, then=F("last_action")),
+                default=Value(last.action),
+            ),
+            "last_action_at": _later("last_action_at", last.timestamp),
+        }
+        if s["last_login"]:
+            changes["last_login_at"] = _later("last_login_at", s["last_login"])
+
+        summary = UserActivitySummary.objects.filter(user_id=user_id)
+        if summary.update(**changes):
+            continue
+        try:
+            with transaction.atomic():
+                UserActivitySummary.objects.create(
+                    user_id=user_id,
+                    signup_at=s["user"].date_joined,
+                    login_count=s["logins"],
+                    last_login_at=s["last_login"],
+                    last_action=last.action,
+                    last_action_at=last.timestamp,
+                )
+        except IntegrityError:
+            # another worker created it first
+            summary.update(**changes)
+
+
+recorder = ActivityRecorder()
+
+
+def record_activity(user, action):
+    recorder.record(user, action)
@@ -1,8 +1,46 @@
 # home/admin.py
 from django.contrib import admin
-from .models import Branch
+from .models import Branch, Closure, OpeningHours, ServiceCapacity
+from .reports import invalidate_reports
+from .schedule import invalidate_schedule
 
 @admin.register(Branch)
 class BranchAdmin(admin.ModelAdmin):
     list_display = ('name','phone','latitude','longitude')
     search_fields = ('name','address','phone')
+
+
+class ScheduleAdmin(admin.ModelAdmin):
+    """Drops the cached slot grid and report series whenever a schedule row changes."""
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        invalidate_schedule()
+        invalidate_reports()
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        invalidate_schedule()
+        invalidate_reports()
+
+    def delete_queryset(self, request, queryset):
+        super().delete_queryset(request, queryset)
+        invalidate_schedule()
+        invalidate_reports()
+
+
+@admin.register(OpeningHours)
+class OpeningHoursAdmin(ScheduleAdmin):
+    list_display = ('weekday','opens','closes','slot_minutes')
+
+
+@admin.register(ServiceCapacity)
+class ServiceCapacityAdmin(ScheduleAdmin):
+    list_display = ('service','daily_limit')
+    search_fields = ('service',)
+
+
+@admin.register(Closure)
+class ClosureAdmin(ScheduleAdmin):
+    list_display = ('date','reason')
+    date_hierarchy = 'date'
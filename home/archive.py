@@ -0,0 +1,85 @@
+import gzip
+import json
+import os
+import re
+from pathlib import Path
+
+from django.conf import settings
+
+
+_FILE_RE = re.compile(r"^activity-(\d{4}-\d{2})\.jsonl\.gz$")
+
+
+def archive_dir(path=None):
+    return Path(path or settings.ACTIVITY_ARCHIVE_DIR)
+
+
+def archive_path(month, path=None):
+    """The archive file for month ("YYYY-MM")."""
+    return archive_dir(path) / f"activity-{month}.jsonl.gz"
+
+
+def activity_record(row):
+    """
+    Archive form of one activity row, from
+    values_list("id", "user_id", "user__username", "user__email", "action", "timestamp").
+    The username and email are copied so the record still reads after the
+    account is gone.
+    """
+    pk, user_id, username, email, action, timestamp = row
+    return {
+        "id": pk,
+        "user_id": user_id,
+        "username": username,
+        "email": email,
+        "action": action,
+        "timestamp": timestamp.isoformat(),
+    }
+
+
+def append_records(month, records, path=None):
+    """
+    Append records to the month's archive as a new gzip member and fsync it,
+    so the caller can delete the rows once this returns.
+    """
+    target = archive_path(month, path)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    with open(target, "ab") as raw:
+        with gzip.GzipFile(fileobj=raw, mode="wb") as gz:
+            for record in records:
+                gz.write((json.dumps(record) + "\n").encode())
+        raw.flush()
+        os.fsync(raw.fileno())
+
+
+def archived_months(path=None):
+    """Months with an archive file, oldest first, as "YYYY-MM" strings."""
+    folder = archive_dir(path)
+    if not folder.is_dir():
+        return []
+    return sorted(m.group(1) for m in map(_FILE_RE.match, os.listdir(folder)) if m)
+
+
+def read_archived_activity(month, action=None, user=None, path=None):
+    """
+    Yield the archived activity records for month ("YYYY-MM") in the order
+    they were archived, optionally only one action and/or one user (matched
+    against username or email, case-insensitively).
+
+    A run interrupted between writing a chunk and deleting its rows writes
+    that chunk again next time, so records are de-duplicated by id.
+    Raises FileNotFoundError when the month has no archive.
+    """
+    user = user.lower() if user else None
+    seen = set()
+    with gzip.open(archive_path(month, path), "rt", encoding="utf-8") as f:
+        for line in f:
+            record = json.loads(line)
+            if record["id"] in seen:
+                continue
+            seen.add(record["id"])
+            if action and record["action"] != action:
+                continue
+            if user and user not in ((record["username"] or "").lower(), (record["email"] or "").lower()):
+                continue
+            yield record
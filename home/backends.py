@@ -0,0 +1,66 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.db.models import BooleanField, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Lower
+
+from .hashing import acheck_password, amake_password
+
+
+UserModel = get_user_model()
+
+# auth_user_email_lower_uniq only covers rows WHERE email <> '', and SQLite
+# uses a partial index only when the query repeats that condition with the
+# literal; exclude(email="") would send the '' as a parameter
+_HAS_EMAIL = RawSQL('"auth_user"."email" <> \'\'', [], output_field=BooleanField())
+
+
+def with_email_lower(users):
+    """
+    users narrowed to accounts with an email and annotated with email_lower,
+    so filters and ordering on email_lower run on auth_user_email_lower_uniq.
+    """
+    return users.filter(_HAS_EMAIL).annotate(email_lower=Lower("email"))
+
+
+class EmailBackend(ModelBackend):
+    """
+    Authenticates authenticate(request, email=..., password=...) calls, as
+    made by login_user. The user is fetched in one query on
+    auth_user_email_lower_uniq, with both sides lowered by SQLite so the
+    match is exactly the unique index's, and its password is checked on
+    that same row.
+
+    Calls without an email fall through to the next backend (username login
+    for admin_login). aauthenticate does the same with the hashing on
+    home.hashing's pool.
+    """
+
+    def _lookup(self, email):
+        return with_email_lower(UserModel._default_manager.all()).filter(email_lower=Lower(Value(email)))
+
+    def authenticate(self, request, email=None, password=None, **kwargs):
+        if email is None or password is None:
+            return None
+        try:
+            user = self._lookup(email).get()
+        except (UserModel.DoesNotExist, UserModel.MultipleObjectsReturned):
+            # hash the password anyway so an unknown email takes as long to
+            # reject as a wrong password (as ModelBackend does for usernames)
+            UserModel().set_password(password)
+            return None
+        if user.check_password(password) and self.user_can_authenticate(user):
+            return user
+        return None
+
+    async def aauthenticate(self, request, email=None, password=None, **kwargs):
+        if email is None or password is None:
+            return None
+        try:
+            user = await self._lookup(email).aget()
+        except (UserModel.DoesNotExist, UserModel.MultipleObjectsReturned):
+            await amake_password(password)
+            return None
+        if await acheck_password(user, password) and self.user_can_authenticate(user):
+            return user
+        return None
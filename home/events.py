@@ -0,0 +1,87 @@
+import asyncio
+import threading
+from collections import Counter
+
+
+# open event streams one worker process will hold; more get a 503
+SLOT_EVENTS_MAX_SUBSCRIBERS = 1000
+
+# open event streams one client address may hold in one worker process, so
+# a single client can't take every place; a few tabs stay well under it
+SLOT_EVENTS_MAX_PER_CLIENT = 10
+
+# events queued for a stream that isn't reading; later ones are dropped and
+# the modal falls back to the 409 from create_appointment
+SUBSCRIBER_QUEUE_SIZE = 100
+
+
+class SlotBroadcast:
+    """
+    In-process fan-out of "slot taken" events to the open SSE streams,
+    keyed by date.
+
+    Each subscriber is an asyncio.Queue plus the event loop it belongs to,
+    and publishers hand events over with call_soon_threadsafe, so a booking
+    taken on any thread or loop of this process reaches every stream.
+    Other worker processes are not reached; their modals still get a 409.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_date = {}
+        self._by_client = Counter()
+        self._count = 0
+
+    def subscribe(self, dates, client=""):
+        """
+        A queue receiving events for the given dates, or None when this
+        process or the client (its address) already has its most streams.
+        """
+        queue = asyncio.Queue(SUBSCRIBER_QUEUE_SIZE)
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._count >= SLOT_EVENTS_MAX_SUBSCRIBERS or self._by_client[client] >= SLOT_EVENTS_MAX_PER_CLIENT:
+                return None
+            self._count += 1
+            self._by_client[client] += 1
+            for d in dates:
+                self._by_date.setdefault(d, {})[queue] = loop
+        return queue
+
+    def unsubscribe(self, queue, dates, client=""):
+        with self._lock:
+            self._count -= 1
+            self._by_client[client] -= 1
+            if not self._by_client[client]:
+                del self._by_client[client]
+            for d in dates:
+                subscribers = self._by_date.get(d)
+                if subscribers is None:
+                    continue
+                subscribers.pop(queue, None)
+                if not subscribers:
+                    del self._by_date[d]
+
+    def publish(self, d, event):
+        with self._lock:
+            subscribers = list(self._by_date.get(d, {}).items())
+        for queue, loop in subscribers:
+            try:
+                loop.call_soon_threadsafe(_offer, queue, event)
+            except RuntimeError:
+                # that stream's loop has already closed
+                pass
+
+
+def _offer(queue, event):
+    try:
+        queue.put_nowait(event)
+    except asyncio.QueueFull:
+        pass
+
+
+slot_events = SlotBroadcast()
+
+
+def publish_slot_taken(d, t):
+    slot_events.publish(d, {"date": d.isoformat(), "time": t.strftime("%H:%M")})
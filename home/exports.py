@@ -0,0 +1,211 @@
+import csv
+import json
+import re
+import zipfile
+from xml.sax.saxutils import escape
+
+from .models import Appointment
+
+
+EXPORT_FORMATS = ("csv", "ndjson")
+
+REPORT_EXPORT_FORMATS = ("csv", "xlsx")
+
+XLSX_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+# worksheet rows written between flushes of the compressed stream
+XLSX_FLUSH_ROWS = 500
+
+# rows fetched per database round trip while streaming
+EXPORT_CHUNK_SIZE = 2000
+
+APPOINTMENT_EXPORT_FIELDS = [
+    "id", "name", "first_name", "last_name", "service", "date", "time",
+    "dob", "postcode", "email", "phone", "nhs", "note", "created_at",
+]
+
+
+def appointment_row(a):
+    return {
+        "id": a.id,
+        "name": f"{a.first_name} {a.last_name}",
+        "first_name": a.first_name,
+        "last_name": a.last_name,
+        "service": a.service,
+        "date": a.date.strftime("%d-%m-%Y"),
+        "time": a.time.strftime("%H:%M"),
+        "dob": a.dob,
+        "postcode": a.postcode,
+        "email": a.email,
+        "phone": a.phone,
+        "nhs": a.nhs_number,
+        "note": a.note or "",
+        "created_at": a.created_at.strftime("%d-%m-%Y %H:%M:%S"),
+    }
+
+
+# spreadsheet apps run a CSV cell starting with one of these as a formula
+_FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+# characters XML 1.0 doesn't allow at all, even escaped
+_XML_INVALID = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f\ud800-\udfff\ufffe\uffff]")
+
+
+def csv_safe(value):
+    """
+    Quote free text that a spreadsheet would otherwise run as a formula
+    ("=HYPERLINK(...)" -> "'=HYPERLINK(...)"). Numbers are left alone.
+    """
+    if isinstance(value, str) and value.startswith(_FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+class _Echo:
+    """File-like object whose write() hands the line back to the caller."""
+
+    def write(self, value):
+        return value
+
+
+def stream_appointments(fmt, queryset=None):
+    """
+    Yield every appointment as CSV or NDJSON lines, oldest first, reading
+    the table in chunks so memory stays flat however many rows there are.
+    """
+    if queryset is None:
+        queryset = Appointment.objects.all()
+    rows = (
+        appointment_row(a)
+        for a in queryset.order_by("created_at", "id").iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    )
+
+    if fmt == "ndjson":
+        for row in rows:
+            yield json.dumps(row) + "\n"
+        return
+
+    writer = csv.DictWriter(_Echo(), fieldnames=APPOINTMENT_EXPORT_FIELDS)
+    yield writer.writeheader()
+    for row in rows:
+        yield writer.writerow({field: csv_safe(value) for field, value in row.items()})
+
+
+def stream_csv_rows(rows):
+    """Yield each row (a list of values) as a CSV line."""
+    writer = csv.writer(_Echo())
+    for row in rows:
+        yield writer.writerow([csv_safe(value) for value in row])
+
+
+_XLSX_PARTS = {
+    "[Content_Types].xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    "_rels/.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    "xl/_rels/workbook.xml.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/>'
+        '</Relationships>'
+    ),
+}
+
+_XLSX_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="{name}" sheetId="1" r:id="rId1"/></sheets>'
+    '</workbook>'
+)
+
+_XLSX_SHEET_START = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+)
+_XLSX_SHEET_END = '</sheetData></worksheet>'
+
+
+class _ZipStream:
+    """
+    Write-only, unseekable file for zipfile: it collects the compressed
+    bytes until the generator hands them on with take().
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _xlsx_column(i):
+    letters = ""
+    i += 1
+    while i:
+        i, rem = divmod(i - 1, 26)
+        letters = chr(65 + rem) + letters
+    return letters
+
+
+def _xlsx_row(number, row):
+    cells = []
+    for i, value in enumerate(row):
+        ref = f"{_xlsx_column(i)}{number}"
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            cells.append(f'<c r="{ref}"><v>{value}</v></c>')
+        else:
+            text = escape(_XML_INVALID.sub("", str(value)))
+            cells.append(f'<c r="{ref}" t="inlineStr"><is><t>{text}</t></is></c>')
+    return f'<row r="{number}">{"".join(cells)}</row>'
+
+
+def stream_xlsx_rows(rows, sheet_name="Report"):
+    """
+    Yield a single-sheet XLSX workbook holding the rows, as bytes.
+
+    The worksheet is deflated straight into the response as rows arrive;
+    zipfile writes data descriptors when the output can't seek, so only
+    the rows since the last flush are ever held in memory.
+    """
+    out = _ZipStream()
+    with zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED) as workbook:
+        for name, xml in _XLSX_PARTS.items():
+            workbook.writestr(name, xml)
+        workbook.writestr("xl/workbook.xml", _XLSX_WORKBOOK.format(name=escape(sheet_name, {'"': "&quot;"})))
+
+        with workbook.open("xl/worksheets/sheet1.xml", "w", force_zip64=True) as sheet:
+            sheet.write(_XLSX_SHEET_START.encode())
+            for number, row in enumerate(rows, start=1):
+                sheet.write(_xlsx_row(number, row).encode())
+                if number % XLSX_FLUSH_ROWS == 0:
+                    yield out.take()
+            sheet.write(_XLSX_SHEET_END.encode())
+        yield out.take()
+    yield out.take()
@@ -0,0 +1,40 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password, verify_password
+
+
+def pool_size():
+    return getattr(settings, "PASSWORD_HASHING_WORKERS", None) or min(4, os.cpu_count() or 1)
+
+
+# PBKDF2 and scrypt run in OpenSSL with the GIL released, so threads are
+# enough to use every core; the pool size caps how many hashes run at once
+_pool = ThreadPoolExecutor(max_workers=pool_size(), thread_name_prefix="password-hashing")
+
+
+async def _offload(func, *args):
+    return await asyncio.get_running_loop().run_in_executor(_pool, func, *args)
+
+
+async def amake_password(password):
+    """make_password on the hashing pool."""
+    return await _offload(make_password, password)
+
+
+async def acheck_password(user, password):
+    """
+    user.check_password on the hashing pool, so a login doesn't hold the
+    event loop (or, under ASGI, the single thread sync views share) for the
+    length of a hash.
+
+    Like check_password, a correct password stored with an older hasher or
+    weaker parameters than PASSWORD_HASHERS[0] is re-hashed and saved.
+    """
+    is_correct, must_update = await _offload(verify_password, password, user.password)
+    if is_correct and must_update:
+        user.password = await amake_password(password)
+        await user.asave(update_fields=["password"])
+    return is_correct
@@ -0,0 +1,170 @@
+import csv
+import json
+import sys
+import time as clock
+from itertools import islice
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, transaction
+
+
+# how many times a batch is re-checked if a live write takes one of its
+# rows between the clash query and the insert
+MAX_BATCH_ATTEMPTS = 3
+
+
+class BatchImportCommand(BaseCommand):
+    """
+    Base for commands that bulk-insert rows from a CSV or JSONL file.
+
+    Rows are streamed in --batch-size batches. Each row goes through
+    _build(row), which returns (obj, None) or (None, reason); each batch's
+    objects go through _insert_batch(valid, batch_size) inside a
+    transaction, which returns (created, clashes). A batch that hits an
+    IntegrityError is retried MAX_BATCH_ATTEMPTS times and then rejected
+    as a whole, so one busy batch never aborts the rest of the file.
+    Rejected rows are written as JSONL to the rejects file.
+    """
+
+    # "appointments", "accounts": used in the summary and default rejects path
+    noun = "rows"
+    # past tense for the summary: "Imported 10 appointments"
+    done = "Imported"
+    # reason given to the rows of a batch that kept clashing
+    clash_reason = "batch kept clashing with live writes"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV or JSONL file to import, or - for stdin")
+        parser.add_argument("--format", choices=["csv", "jsonl"], help="Input format (default: from file extension)")
+        parser.add_argument(
+            "--batch-size", type=int, default=1000,
+            help=f"{self.noun.capitalize()} per INSERT transaction (default: 1000)",
+        )
+        parser.add_argument("--rejects", help="Where to write rejected rows as JSONL (default: <path>.rejects.jsonl)")
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        fmt = options["format"] or ("jsonl" if path.endswith((".jsonl", ".ndjson")) else "csv")
+        batch_size = options["batch_size"]
+        if batch_size < 1:
+            raise CommandError("--batch-size must be at least 1")
+
+        rejects_path = options["rejects"] or (
+            f"{self.noun}.rejects.jsonl" if path == "-" else f"{path}.rejects.jsonl"
+        )
+
+        if path == "-":
+            source = sys.stdin
+        else:
+            try:
+                source = open(path, newline="", encoding="utf-8")
+            except OSError as exc:
+                raise CommandError(f"Cannot open {path}: {exc}")
+
+        created = rejected = 0
+        started = clock.monotonic()
+
+        with source, open(rejects_path, "w", encoding="utf-8") as rejects:
+            rows = enumerate(self._read_rows(source, fmt), start=1)
+            while True:
+                batch = list(islice(rows, batch_size))
+                if not batch:
+                    break
+
+                valid = []
+                for line_no, row in batch:
+                    obj, reason = (None, "invalid JSON") if "_raw" in row else self._build(row)
+                    if obj is None:
+                        self._reject(rejects, line_no, row, reason)
+                        rejected += 1
+                    else:
+                        valid.append((line_no, row, obj))
+
+                inserted, clashes = self._insert_with_retries(valid, batch_size)
+                for line_no, row, reason in clashes:
+                    self._reject(rejects, line_no, row, reason)
+                created += inserted
+                rejected += len(clashes)
+
+                if options["verbosity"] > 1:
+                    elapsed = clock.monotonic() - started
+                    self.stdout.write(
+                        f"{created + rejected} rows read, {created} {self.done.lower()}, {rejected} rejected "
+                        f"({created / elapsed if elapsed else 0:.0f} rows/s)"
+                    )
+
+        elapsed = clock.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"{self.done} {created} {self.noun} in {elapsed:.2f}s "
+            f"({created / elapsed if elapsed else 0:.0f} rows/s)."
+        ))
+        if rejected:
+            self.stdout.write(self.style.WARNING(f"{rejected} rows rejected, see {rejects_path}"))
+        elif path != "-":
+            Path(rejects_path).unlink(missing_ok=True)
+
+    def _read_rows(self, source, fmt):
+        if fmt == "csv":
+            yield from csv.DictReader(source)
+            return
+
+        for line in source:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = {"_raw": line}
+            yield row if isinstance(row, dict) else {"_raw": line}
+
+    def _check_fields(self, row, required, text):
+        """
+        The reason to reject row if a required field is empty or a text
+        field isn't a string (JSONL can carry numbers, lists or objects
+        where text belongs), else None.
+        """
+        for f in required:
+            if not row.get(f):
+                return f"{f} is required"
+        for f in text:
+            if row.get(f) is not None and not isinstance(row[f], str):
+                return f"{f} must be a string"
+        return None
+
+    def _insert_with_retries(self, valid, batch_size):
+        if not valid:
+            return 0, []
+        for _ in range(MAX_BATCH_ATTEMPTS):
+            try:
+                with transaction.atomic():
+                    created, clashes = self._insert_batch(valid, batch_size)
+            except IntegrityError:
+                continue
+            self._committed(created)
+            return len(created), clashes
+
+        # leave the batch's rows for a rerun rather than abandon the file
+        return 0, [(line_no, row, self.clash_reason) for line_no, row, _ in valid]
+
+    def _build(self, row):
+        raise NotImplementedError
+
+    def _insert_batch(self, valid, batch_size):
+        """
+        Insert what can be inserted of one batch of (line_no, row, obj),
+        inside the caller's transaction. Returns (created objects, clashes)
+        where clashes are (line_no, row, reason).
+        """
+        raise NotImplementedError
+
+    def _committed(self, created):
+        """Called with the created objects once their transaction commits."""
+
+    def _rejected_row(self, row):
+        """The row as written to the rejects file."""
+        return row
+
+    def _reject(self, rejects, line_no, row, reason):
+        rejects.write(json.dumps({"line": line_no, "reason": reason, "row": self._rejected_row(row)}) + "\n")
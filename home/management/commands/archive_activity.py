@@ -0,0 +1,62 @@
+import time as clock
+from datetime import timedelta
+from itertools import groupby
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from home.archive import activity_record, append_records, archive_dir
+from home.models import UserActivity
+
+
+class Command(BaseCommand):
+    help = (
+        "Move UserActivity rows older than --days into gzipped monthly JSONL archives, "
+        "deleting them in small chunks so the live table is never locked for long."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=365, help="Archive rows older than this many days (default: 365)")
+        parser.add_argument("--chunk-size", type=int, default=5000, help="Rows archived and deleted per transaction (default: 5000)")
+        parser.add_argument("--pause", type=float, default=0.05, help="Seconds to wait between chunks (default: 0.05)")
+        parser.add_argument("--archive-dir", help="Where to write the archives (default: settings.ACTIVITY_ARCHIVE_DIR)")
+        parser.add_argument("--dry-run", action="store_true", help="Only count the rows that would be archived")
+
+    def handle(self, *args, **options):
+        if options["days"] < 1 or options["chunk_size"] < 1:
+            raise CommandError("--days and --chunk-size must be positive")
+
+        cutoff = timezone.now() - timedelta(days=options["days"])
+        old = UserActivity.objects.filter(timestamp__lt=cutoff)
+        if options["dry_run"]:
+            self.stdout.write(f"{old.count()} activity rows older than {cutoff:%Y-%m-%d %H:%M} would be archived.")
+            return
+
+        folder = archive_dir(options["archive_dir"])
+        archived = 0
+        while True:
+            chunk = list(
+                old.order_by("timestamp", "id")
+                .values_list("id", "user_id", "user__username", "user__email", "action", "timestamp")
+                [:options["chunk_size"]]
+            )
+            if not chunk:
+                break
+
+            # the file is written and synced before the rows go, so a crash
+            # can at worst archive a chunk twice, never lose it
+            for month, rows in groupby(chunk, key=lambda r: f"{r[5]:%Y-%m}"):
+                append_records(month, map(activity_record, rows), folder)
+            with transaction.atomic():
+                UserActivity.objects.filter(id__in=[r[0] for r in chunk]).delete()
+
+            archived += len(chunk)
+            if options["verbosity"] > 1:
+                self.stdout.write(f"{archived} rows archived, up to {chunk[-1][5]:%Y-%m-%d}")
+            if len(chunk) < options["chunk_size"]:
+                break
+            # let bookings and logins take the write lock between chunks
+            clock.sleep(options["pause"])
+
+        self.stdout.write(self.style.SUCCESS(f"Archived {archived} activity rows to {folder}."))
@@ -0,0 +1,86 @@
+import threading
+import time as clock
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from home.activity import ActivityRecorder
+from home.models import UserActivity
+
+
+BENCH_USERNAME = "activity-bench"
+
+
+class Command(BaseCommand):
+    help = (
+        "Simulate a login storm against the configured database and compare the time each "
+        "login spends recording its UserActivity row: one INSERT per login versus the "
+        "buffered recorder. Rows are written for a throwaway user that is deleted afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=50, help="Concurrent logins (default: 50)")
+        parser.add_argument("--events", type=int, default=20, help="Logins per thread (default: 20)")
+
+    def handle(self, *args, **options):
+        threads, events = options["threads"], options["events"]
+        if threads < 1 or events < 1:
+            raise CommandError("--threads and --events must be positive")
+
+        user, _ = User.objects.get_or_create(username=BENCH_USERNAME, defaults={"email": "bench@example.com"})
+        try:
+            self.stdout.write(f"{threads} threads x {events} logins")
+            self.stdout.write(f"{'mode':>9} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8} {'total s':>8}")
+
+            direct = self._storm(threads, events, lambda: UserActivity.objects.create(user=user, action="login"))
+            self._report("direct", direct)
+
+            recorder = ActivityRecorder()
+            buffered = self._storm(threads, events, lambda: recorder.record(user, "login"))
+            started = clock.perf_counter()
+            recorder.close()
+            buffered["total"] += clock.perf_counter() - started
+            self._report("buffered", buffered)
+
+            written = UserActivity.objects.filter(user=user).count()
+            if written != 2 * threads * events:
+                self.stderr.write(self.style.WARNING(f"Expected {2 * threads * events} rows, found {written}"))
+        finally:
+            user.delete()
+
+    def _storm(self, threads, events, record):
+        latencies, lock = [], threading.Lock()
+        start = threading.Barrier(threads)
+
+        def login():
+            start.wait()
+            mine = []
+            for _ in range(events):
+                began = clock.perf_counter()
+                record()
+                mine.append(clock.perf_counter() - began)
+            with lock:
+                latencies.extend(mine)
+            connection.close()
+
+        workers = [threading.Thread(target=login) for _ in range(threads)]
+        began = clock.perf_counter()
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+        total = clock.perf_counter() - began
+
+        latencies.sort()
+        return {
+            "p50": latencies[len(latencies) // 2] * 1000,
+            "p99": latencies[min(len(latencies) - 1, len(latencies) * 99 // 100)] * 1000,
+            "max": latencies[-1] * 1000,
+            "total": total,
+        }
+
+    def _report(self, mode, result):
+        self.stdout.write(
+            f"{mode:>9} {result['p50']:>8.2f} {result['p99']:>8.2f} {result['max']:>8.2f} {result['total']:>8.2f}"
+        )
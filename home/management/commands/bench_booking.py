@@ -0,0 +1,124 @@
+import asyncio
+import json
+import time as clock
+from datetime import date, timedelta
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+from home import schedule
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test the booking endpoints of a running server and report requests/s "
+        "and latency percentiles per concurrency level. Start the server under test "
+        "first, e.g. `gunicorn pharmacy_project.wsgi -w 4` for the WSGI path or "
+        "`uvicorn pharmacy_project.asgi:application --workers 4` for ASGI, then run "
+        "this against each with the same settings."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--url", default="http://127.0.0.1:8000", help="Base URL of the server under test")
+        parser.add_argument(
+            "--endpoint", choices=["booked", "create"], default="booked",
+            help="booked: GET /appointments/booked/; create: POST /appointments/create/ (writes rows!)",
+        )
+        parser.add_argument(
+            "--concurrency", default="50,100,250,500",
+            help="Comma-separated numbers of concurrent clients (default: 50,100,250,500)",
+        )
+        parser.add_argument("--requests", type=int, default=2000, help="Requests per concurrency level (default: 2000)")
+        parser.add_argument("--date", help="First booking date, YYYY-MM-DD (default: 400 days from today)")
+
+    def handle(self, *args, **options):
+        parts = urlsplit(options["url"])
+        if parts.scheme != "http" or not parts.hostname:
+            raise CommandError("--url must be a plain http:// URL")
+        try:
+            levels = [int(c) for c in options["concurrency"].split(",")]
+        except ValueError:
+            raise CommandError("--concurrency must be a comma-separated list of integers")
+        if options["requests"] < 1 or any(c < 1 for c in levels):
+            raise CommandError("--requests and --concurrency must be positive")
+
+        start = (
+            date.fromisoformat(options["date"]) if options["date"]
+            else date.today() + timedelta(days=400)
+        )
+        requests = self._requests(options["endpoint"], start, options["requests"] * len(levels))
+
+        self.stdout.write(f"{options['endpoint']} against {options['url']}")
+        self.stdout.write(f"{'clients':>8} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+        for level in levels:
+            batch = [next(requests) for _ in range(options["requests"])]
+            result = asyncio.run(self._run(parts.hostname, parts.port or 80, batch, level))
+            self.stdout.write(
+                f"{level:>8} {result['rps']:>9.0f} {result['p50']:>8.1f} "
+                f"{result['p99']:>8.1f} {result['errors']:>7}"
+            )
+
+    def _requests(self, endpoint, start, total):
+        """Raw HTTP/1.1 requests; bookings walk forward through free slots so they don't clash."""
+        if endpoint == "booked":
+            while True:
+                yield (
+                    f"GET /appointments/booked/?date={start.isoformat()} HTTP/1.1\r\n"
+                    "Host: bench\r\nConnection: close\r\n\r\n"
+                ).encode()
+
+        days = schedule.day_slots(start, start + timedelta(days=total))
+        slots = ((d, t) for d, day in days.items() for t in day)
+        for n, (d, t) in enumerate(slots):
+            body = json.dumps({
+                "service": "Benchmark", "date": d.isoformat(), "time": t,
+                "first_name": "Bench", "last_name": f"Client{n}", "dob": "1990-01-01",
+                "postcode": "AB1 2CD", "email": f"bench{n}@example.com",
+                "phone": "07000000000", "nhs_number": "0000000000",
+            }).encode()
+            yield (
+                "POST /appointments/create/ HTTP/1.1\r\nHost: bench\r\n"
+                "Content-Type: application/json\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n"
+            ).encode() + body
+        raise CommandError("Ran out of open slots; pass an earlier --date or fewer --requests")
+
+    async def _run(self, host, port, batch, concurrency):
+        queue = iter(batch)
+        latencies, errors = [], 0
+
+        async def client():
+            nonlocal errors
+            for raw in queue:
+                began = clock.perf_counter()
+                try:
+                    reader, writer = await asyncio.open_connection(host, port)
+                    writer.write(raw)
+                    await writer.drain()
+                    status = await reader.readline()
+                    await reader.read()
+                    writer.close()
+                except OSError:
+                    errors += 1
+                    continue
+                latencies.append(clock.perf_counter() - began)
+                if not status.startswith(b"HTTP/1.1 2"):
+                    errors += 1
+
+        began = clock.perf_counter()
+        await asyncio.gather(*(client() for _ in range(concurrency)))
+        elapsed = clock.perf_counter() - began
+
+        latencies.sort()
+        return {
+            "rps": len(latencies) / elapsed,
+            "p50": _percentile(latencies, 0.50),
+            "p99": _percentile(latencies, 0.99),
+            "errors": errors,
+        }
+
+
+def _percentile(sorted_seconds, p):
+    if not sorted_seconds:
+        return 0.0
+    return sorted_seconds[min(len(sorted_seconds) - 1, int(len(sorted_seconds) * p))] * 1000
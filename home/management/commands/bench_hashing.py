@@ -0,0 +1,63 @@
+import os
+import time as clock
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.hashers import PBKDF2PasswordHasher, ScryptPasswordHasher
+from django.core.management.base import BaseCommand, CommandError
+
+from home.hashing import pool_size
+
+
+# (label, hasher) pairs; the first is what backup_data.json's users are on
+CONFIGURATIONS = [
+    ("pbkdf2_sha256 1000000", type("PBKDF2", (PBKDF2PasswordHasher,), {"iterations": 1_000_000})),
+    ("pbkdf2_sha256 600000", type("PBKDF2", (PBKDF2PasswordHasher,), {"iterations": 600_000})),
+    ("scrypt n=2^14", ScryptPasswordHasher),
+    # 32 MiB of scratch memory, past OpenSSL's default limit
+    ("scrypt n=2^15", type("Scrypt", (ScryptPasswordHasher,), {"work_factor": 2 ** 15, "maxmem": 64 * 1024 * 1024})),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure password verifications per second (the CPU cost of a login) for each hasher "
+        "configuration, run inline and on a pool of hashing threads, and report the rate per core. "
+        "No database access."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--logins", type=int, default=24, help="Verifications per configuration (default: 24)")
+        parser.add_argument("--workers", type=int, help="Hashing threads (default: PASSWORD_HASHING_WORKERS)")
+
+    def handle(self, *args, **options):
+        logins, workers = options["logins"], options["workers"] or pool_size()
+        if logins < 1 or workers < 1:
+            raise CommandError("--logins and --workers must be positive")
+        cores = min(workers, os.cpu_count() or 1)
+
+        self.stdout.write(f"{logins} logins per configuration, {workers} hashing threads on {os.cpu_count()} cores")
+        self.stdout.write(
+            f"{'hasher':<22} {'ms/login':>9} {'inline/s':>9} {'pool/s':>9} {'pool/s/core':>12}"
+        )
+        for label, hasher_class in CONFIGURATIONS:
+            hasher = hasher_class()
+            encoded = hasher.encode("correct horse battery staple", hasher.salt())
+
+            def verify(_):
+                return hasher.verify("correct horse battery staple", encoded)
+
+            began = clock.perf_counter()
+            for i in range(logins):
+                verify(i)
+            inline = clock.perf_counter() - began
+
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                began = clock.perf_counter()
+                if not all(pool.map(verify, range(logins))):
+                    raise CommandError(f"{label}: verification failed")
+                pooled = clock.perf_counter() - began
+
+            self.stdout.write(
+                f"{label:<22} {inline / logins * 1000:>9.1f} {logins / inline:>9.1f} "
+                f"{logins / pooled:>9.1f} {logins / pooled / cores:>12.1f}"
+            )
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from home.exports import EXPORT_FORMATS, stream_appointments
+
+
+class Command(BaseCommand):
+    help = "Stream every appointment as CSV or NDJSON, in constant memory."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--format", choices=EXPORT_FORMATS, default="csv", help="Output format (default: csv)")
+        parser.add_argument("-o", "--output", help="File to write to (default: stdout)")
+
+    def handle(self, *args, **options):
+        fmt = options["format"]
+        if not options["output"]:
+            for line in stream_appointments(fmt):
+                self.stdout.write(line, ending="")
+            return
+
+        count = -1 if fmt == "csv" else 0  # don't count the CSV header
+        with open(options["output"], "w", newline="", encoding="utf-8") as out:
+            for line in stream_appointments(fmt):
+                out.write(line)
+                count += 1
+        self.stderr.write(self.style.SUCCESS(f"Exported {count} appointments to {options['output']}"))
@@ -0,0 +1,95 @@
+from collections import Counter
+
+from django.core.exceptions import ValidationError
+from django.utils import timezone
+
+from home import schedule
+from home.management.batch_import import BatchImportCommand
+from home.models import Appointment, ServiceDailyCount
+from home.rollups import record_created
+from home.slots import invalidate_booked_times
+
+
+class Command(BatchImportCommand):
+    help = (
+        "Bulk-import appointments from a CSV or JSONL file, rejecting invalid rows and taken slots. "
+        "Rows from today on are also checked against the schedule like online bookings (opening hours, "
+        "closures and daily service limits); past rows, e.g. from an older system, are not, since "
+        "today's schedule says nothing about when bookings used to be taken."
+    )
+    noun = "appointments"
+    clash_reason = "batch kept clashing with live bookings"
+
+    def _build(self, row):
+        required = Appointment.BOOKING_REQUIRED_FIELDS
+        reason = self._check_fields(row, required, [*required, "note"])
+        if reason:
+            return None, reason
+
+        try:
+            appt = Appointment(
+                service=row["service"],
+                date=Appointment._meta.get_field("date").to_python(row["date"]),
+                time=Appointment._meta.get_field("time").to_python(row["time"]),
+                first_name=row["first_name"],
+                last_name=row["last_name"],
+                dob=row["dob"],
+                postcode=row["postcode"],
+                email=row["email"],
+                phone=row["phone"],
+                nhs_number=row["nhs_number"],
+                note=row.get("note") or "",
+            )
+        except ValidationError as exc:
+            return None, "; ".join(exc.messages)
+        return appt, None
+
+    def _insert_batch(self, valid, batch_size):
+        """
+        Insert one batch, rejecting rows whose slot is taken either in the
+        database or earlier in the same batch and, from today on, rows
+        outside opening hours or that would take a service past its daily
+        limit.
+        """
+        dates = {a.date for _, _, a in valid}
+        upcoming = {d for d in dates if d >= timezone.localdate()}
+        limits = schedule.service_limits()
+        slots = schedule.day_slots(min(upcoming), max(upcoming)) if upcoming else {}
+        taken = set(
+            Appointment.objects
+            .filter(date__in=dates, time__in={a.time for _, _, a in valid})
+            .order_by()
+            .values_list("date", "time")
+        )
+        counts = (
+            ServiceDailyCount.objects
+            .filter(date__in=dates, service__in=limits)
+            .values_list("date", "service", "booked")
+        )
+        booked = Counter({(d, service): n for d, service, n in counts})
+
+        to_create, clashes = [], []
+        for line_no, row, appt in valid:
+            slot = (appt.date, appt.time)
+            capped = [s for s in Appointment.service_names(appt.service) if s in limits]
+            full = next((s for s in capped if booked[(appt.date, s)] >= limits[s]), None)
+            label = schedule.slot_label(appt.time)
+            if label is None:
+                clashes.append((line_no, row, "time is not on a whole minute"))
+            elif appt.date in slots and label not in slots[appt.date]:
+                clashes.append((line_no, row, "outside opening hours"))
+            elif slot in taken:
+                clashes.append((line_no, row, "slot already booked"))
+            elif full and appt.date in slots:
+                clashes.append((line_no, row, f"{full} is fully booked on this day"))
+            else:
+                taken.add(slot)
+                booked.update((appt.date, s) for s in capped)
+                to_create.append(appt)
+
+        Appointment.objects.bulk_create(to_create, batch_size=batch_size)
+        record_created(to_create)
+        return to_create, clashes
+
+    def _committed(self, created):
+        invalidate_booked_times(*{appt.date for appt in created})
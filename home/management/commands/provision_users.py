@@ -0,0 +1,90 @@
+from django.contrib.auth.hashers import UNUSABLE_PASSWORD_PREFIX, identify_hasher, make_password
+from django.contrib.auth.models import User
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from home.backends import with_email_lower
+from home.management.batch_import import BatchImportCommand
+
+
+class Command(BatchImportCommand):
+    help = (
+        "Bulk-create patient accounts from a CSV or JSONL file of username, email and an already "
+        "hashed password (any hasher in PASSWORD_HASHERS; older ones are upgraded on first login). "
+        "Rows with a taken username or email, or a plaintext password, are rejected."
+    )
+    noun = "accounts"
+    done = "Created"
+    clash_reason = "batch kept clashing with new signups"
+
+    def _build(self, row):
+        required = ("username", "email", "password")
+        reason = self._check_fields(row, required, [*required, "first_name", "last_name", "date_joined"])
+        if reason:
+            return None, reason
+
+        # passwords must arrive hashed; "!" (Django's unusable-password
+        # prefix) marks an account that can't log in until it is reset
+        password = row["password"]
+        if password.startswith(UNUSABLE_PASSWORD_PREFIX):
+            password = make_password(None)
+        else:
+            try:
+                identify_hasher(password)
+            except ValueError:
+                return None, "password is not a hash from PASSWORD_HASHERS"
+
+        user = User(
+            username=User.normalize_username(row["username"]),
+            email=User.objects.normalize_email(row["email"]),
+            password=password,
+            first_name=row.get("first_name") or "",
+            last_name=row.get("last_name") or "",
+        )
+        if row.get("date_joined"):
+            try:
+                user.date_joined = parse_datetime(row["date_joined"])
+            except ValueError:
+                user.date_joined = None
+            if user.date_joined is None:
+                return None, "date_joined is not an ISO 8601 datetime"
+            if timezone.is_naive(user.date_joined):
+                user.date_joined = timezone.make_aware(user.date_joined)
+
+        if len(user.username) > User._meta.get_field("username").max_length:
+            return None, "username is too long"
+        return user, None
+
+    def _insert_batch(self, valid, batch_size):
+        """
+        Insert one batch, rejecting rows whose username or email (ignoring
+        case) is taken in the database or earlier in the same batch.
+        """
+        taken_usernames = set(
+            User.objects.filter(username__in={u.username for _, _, u in valid})
+            .values_list("username", flat=True)
+        )
+        taken_emails = set(
+            with_email_lower(User.objects.all())
+            .filter(email_lower__in={u.email.lower() for _, _, u in valid})
+            .values_list("email_lower", flat=True)
+        )
+
+        to_create, clashes = [], []
+        for line_no, row, user in valid:
+            if user.username in taken_usernames:
+                clashes.append((line_no, row, "username already exists"))
+            elif user.email.lower() in taken_emails:
+                clashes.append((line_no, row, "email already registered"))
+            else:
+                taken_usernames.add(user.username)
+                taken_emails.add(user.email.lower())
+                to_create.append(user)
+
+        User.objects.bulk_create(to_create, batch_size=batch_size)
+        return to_create, clashes
+
+    def _rejected_row(self, row):
+        if row.get("password"):
+            row = {**row, "password": "(redacted)"}
+        return row
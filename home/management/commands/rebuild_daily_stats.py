@@ -0,0 +1,25 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from home import rollups
+
+
+class Command(BaseCommand):
+    help = "Rebuild the daily booking rollup used by the reports page from the appointments table."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--start", help="First date to rebuild, YYYY-MM-DD (default: all)")
+        parser.add_argument("--end", help="Last date to rebuild, YYYY-MM-DD (default: all)")
+
+    def handle(self, *args, **options):
+        try:
+            start = date.fromisoformat(options["start"]) if options["start"] else None
+            end = date.fromisoformat(options["end"]) if options["end"] else None
+        except ValueError:
+            raise CommandError("--start and --end must be YYYY-MM-DD")
+        if start and end and end < start:
+            raise CommandError("--end must not be before --start")
+
+        written = rollups.rebuild(start, end)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {written} daily stat rows."))
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.6 on 2026-10-18 17:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0004_alter_appointment_options_alter_appointment_time'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='appointment',
+            constraint=models.UniqueConstraint(fields=('date', 'time'), name='unique_appointment_slot'),
+        ),
+    ]
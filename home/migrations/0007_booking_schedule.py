@@ -0,0 +1,50 @@
+# Generated by Django 5.2.6 on 2026-10-18 17:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0006_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Closure',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+                ('reason', models.CharField(blank=True, max_length=200)),
+            ],
+            options={
+                'ordering': ['date'],
+            },
+        ),
+        migrations.CreateModel(
+            name='OpeningHours',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('weekday', models.PositiveSmallIntegerField(choices=[(0, 'Monday'), (1, 'Tuesday'), (2, 'Wednesday'), (3, 'Thursday'), (4, 'Friday'), (5, 'Saturday'), (6, 'Sunday')], unique=True)),
+                ('opens', models.TimeField()),
+                ('closes', models.TimeField(help_text='Last slot starts before this time.')),
+                ('slot_minutes', models.PositiveSmallIntegerField(default=5)),
+            ],
+            options={
+                'verbose_name_plural': 'opening hours',
+                'ordering': ['weekday'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ServiceCapacity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('service', models.CharField(max_length=200, unique=True)),
+                ('daily_limit', models.PositiveIntegerField(help_text='Most bookings of this service per day.')),
+            ],
+            options={
+                'verbose_name_plural': 'service capacities',
+                'ordering': ['service'],
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.6 on 2026-10-18 17:55
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill(apps, schema_editor):
+    Appointment = apps.get_model('home', 'Appointment')
+    AppointmentDailyStat = apps.get_model('home', 'AppointmentDailyStat')
+    counts = Appointment.objects.order_by().values_list('date', 'service').annotate(n=Count('id'))
+    AppointmentDailyStat.objects.bulk_create(
+        [AppointmentDailyStat(date=d, service=service, booked=n) for d, service, n in counts],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0007_booking_schedule'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AppointmentDailyStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('service', models.CharField(max_length=200)),
+                ('booked', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['date', 'service'],
+                'constraints': [models.UniqueConstraint(fields=('date', 'service'), name='unique_daily_stat')],
+            },
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
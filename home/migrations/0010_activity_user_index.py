@@ -0,0 +1,25 @@
+# Generated by Django 5.2.6 on 2026-10-18 18:07
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0009_activity_event_timestamp'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='useractivity',
+            index=models.Index(fields=['user', 'timestamp'], name='activity_user_ts_idx'),
+        ),
+        # auth_user belongs to contrib.auth, so its case-insensitive email
+        # lookup index is created here
+        migrations.RunSQL(
+            'CREATE INDEX auth_user_email_lower_idx ON auth_user (LOWER(email))',
+            'DROP INDEX auth_user_email_lower_idx',
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.6 on 2026-10-18 18:09
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max, OuterRef, Q, Subquery
+
+
+def backfill(apps, schema_editor):
+    UserActivity = apps.get_model('home', 'UserActivity')
+    UserActivitySummary = apps.get_model('home', 'UserActivitySummary')
+    latest_action = UserActivity.objects.filter(user=OuterRef('user')).order_by('-timestamp', '-id').values('action')[:1]
+    rows = (
+        UserActivity.objects.order_by()
+        .values('user')
+        .annotate(
+            signup_at=Max('user__date_joined'),
+            login_count=Count('id', filter=Q(action='login')),
+            last_login_at=Max('timestamp', filter=Q(action='login')),
+            last_action_at=Max('timestamp'),
+            last_action=Subquery(latest_action),
+        )
+    )
+    UserActivitySummary.objects.bulk_create(
+        [UserActivitySummary(user_id=r.pop('user'), **r) for r in rows.iterator()],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('home', '0010_activity_user_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserActivitySummary',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='activity_summary', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('signup_at', models.DateTimeField()),
+                ('login_count', models.PositiveIntegerField(default=0)),
+                ('last_login_at', models.DateTimeField(blank=True, null=True)),
+                ('last_action', models.CharField(choices=[('signup', 'Signup'), ('login', 'Login'), ('logout', 'Logout')], max_length=10)),
+                ('last_action_at', models.DateTimeField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['last_action_at', 'user'], name='activity_summary_recent_idx')],
+            },
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,50 @@
+from django.conf import settings
+from django.db import migrations
+from django.db.models import Count
+from django.db.models.functions import Lower
+
+
+def check_duplicate_emails(apps, schema_editor):
+    """
+    Stop before the unique index if two accounts share an email (ignoring
+    case), naming them, rather than failing half-way through with a bare
+    IntegrityError. Accounts have to be merged or corrected by hand.
+    """
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split("."))
+    duplicates = list(
+        User.objects.exclude(email="")
+        .annotate(email_lower=Lower("email"))
+        .values("email_lower")
+        .annotate(n=Count("id"))
+        .filter(n__gt=1)
+        .values_list("email_lower", flat=True)[:20]
+    )
+    if duplicates:
+        raise RuntimeError(
+            "Cannot make user emails unique; these are shared by more than one account: "
+            + ", ".join(duplicates)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0011_activity_summary'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(check_duplicate_emails, migrations.RunPython.noop),
+        # partial, so accounts without an email (e.g. from createsuperuser)
+        # don't collide. Email lookups repeat the WHERE (see
+        # home.backends.with_email_lower) and use this index, so the plain
+        # one from 0010 goes.
+        migrations.RunSQL(
+            "CREATE UNIQUE INDEX auth_user_email_lower_uniq ON auth_user (LOWER(email)) WHERE email <> ''",
+            'DROP INDEX auth_user_email_lower_uniq',
+        ),
+        migrations.RunSQL(
+            'DROP INDEX auth_user_email_lower_idx',
+            'CREATE INDEX auth_user_email_lower_idx ON auth_user (LOWER(email))',
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.6 on 2026-10-18 18:34
+
+from collections import Counter
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill(apps, schema_editor):
+    Appointment = apps.get_model('home', 'Appointment')
+    ServiceDailyCount = apps.get_model('home', 'ServiceDailyCount')
+    counts = Counter()
+    for d, service, n in Appointment.objects.order_by().values_list('date', 'service').annotate(n=Count('id')):
+        # same split as Appointment.service_names, which historical models don't carry
+        for name in filter(None, (part.strip() for part in service.split('+'))):
+            counts[(d, name)] += n
+    ServiceDailyCount.objects.bulk_create(
+        [ServiceDailyCount(date=d, service=name, booked=n) for (d, name), n in counts.items()],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0012_unique_user_email'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ServiceDailyCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('service', models.CharField(max_length=200)),
+                ('booked', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['date', 'service'],
+                'constraints': [models.UniqueConstraint(fields=('date', 'service'), name='unique_service_daily_count')],
+            },
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
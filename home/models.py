@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.models import User
 
 
@@ -22,14 +23,47 @@ class UserActivity(models.Model):
 
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     action = models.CharField(max_length=10, choices=ACTION_CHOICES)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # set when the event happens; rows may be written a moment later in a batch
+    timestamp = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["action", "timestamp"], name="activity_action_ts_idx"),
+            models.Index(fields=["timestamp"], name="activity_ts_idx"),
+            models.Index(fields=["user", "timestamp"], name="activity_user_ts_idx"),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.action} at {self.timestamp:%Y-%m-%d %H:%M}"
 
 
+# one row per user, kept current by home.activity as events are written
+class UserActivitySummary(models.Model):
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name="activity_summary")
+    signup_at = models.DateTimeField()
+    login_count = models.PositiveIntegerField(default=0)
+    last_login_at = models.DateTimeField(null=True, blank=True)
+    last_action = models.CharField(max_length=10, choices=UserActivity.ACTION_CHOICES)
+    last_action_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["last_action_at", "user"], name="activity_summary_recent_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username}: {self.login_count} logins, last {self.last_action} at {self.last_action_at:%Y-%m-%d %H:%M}"
+
+
 # ✅ APPOINTMENT MODEL (FIXED)
 class Appointment(models.Model):
+    # fields a booking must carry, whether it comes from the modal or an import
+    BOOKING_REQUIRED_FIELDS = [
+        "service", "date", "time",
+        "first_name", "last_name", "dob",
+        "postcode", "email", "phone", "nhs_number"
+    ]
+
     service = models.CharField(max_length=200)
 
     date = models.DateField()
@@ -49,6 +83,101 @@ class Appointment(models.Model):
 
     class Meta:
         ordering = ["-created_at"]
+        constraints = [
+            # one booking per slot, enforced by the database so concurrent
+            # requests cannot double-book
+            models.UniqueConstraint(fields=["date", "time"], name="unique_appointment_slot"),
+        ]
+        # (date, time) lookups are served by the unique constraint's index
+        indexes = [
+            models.Index(fields=["created_at", "id"], name="appointment_created_idx"),
+        ]
+
+    @staticmethod
+    def service_names(service):
+        """The individual services in a booking's service field: "A + B" -> ["A", "B"]."""
+        return [name for name in (part.strip() for part in service.split("+")) if name]
 
     def __str__(self):
         return f"{self.service} - {self.first_name} {self.last_name} ({self.date} {self.time})"
+
+
+# ✅ DAILY BOOKING ROLLUP (kept in step with Appointment by home.rollups)
+class AppointmentDailyStat(models.Model):
+    date = models.DateField()
+    service = models.CharField(max_length=200)
+    booked = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ["date", "service"]
+        constraints = [
+            models.UniqueConstraint(fields=["date", "service"], name="unique_daily_stat"),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.service}: {self.booked}"
+
+
+# ✅ PER-SERVICE DAILY COUNTS (a booking of "A + B" counts once for each;
+# kept by home.rollups, and what ServiceCapacity limits are checked against)
+class ServiceDailyCount(models.Model):
+    date = models.DateField()
+    service = models.CharField(max_length=200)
+    booked = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ["date", "service"]
+        constraints = [
+            models.UniqueConstraint(fields=["date", "service"], name="unique_service_daily_count"),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.service}: {self.booked}"
+
+
+# ✅ BOOKING SCHEDULE (single source of truth for slot capacity)
+class OpeningHours(models.Model):
+    WEEKDAY_CHOICES = [
+        (0, "Monday"),
+        (1, "Tuesday"),
+        (2, "Wednesday"),
+        (3, "Thursday"),
+        (4, "Friday"),
+        (5, "Saturday"),
+        (6, "Sunday"),
+    ]
+
+    weekday = models.PositiveSmallIntegerField(choices=WEEKDAY_CHOICES, unique=True)
+    opens = models.TimeField()
+    closes = models.TimeField(help_text="Last slot starts before this time.")
+    slot_minutes = models.PositiveSmallIntegerField(default=5)
+
+    class Meta:
+        ordering = ["weekday"]
+        verbose_name_plural = "opening hours"
+
+    def __str__(self):
+        return f"{self.get_weekday_display()} {self.opens:%H:%M}-{self.closes:%H:%M} ({self.slot_minutes} min)"
+
+
+class ServiceCapacity(models.Model):
+    service = models.CharField(max_length=200, unique=True)
+    daily_limit = models.PositiveIntegerField(help_text="Most bookings of this service per day.")
+
+    class Meta:
+        ordering = ["service"]
+        verbose_name_plural = "service capacities"
+
+    def __str__(self):
+        return f"{self.service}: {self.daily_limit}/day"
+
+
+class Closure(models.Model):
+    date = models.DateField(unique=True)
+    reason = models.CharField(max_length=200, blank=True)
+
+    class Meta:
+        ordering = ["date"]
+
+    def __str__(self):
+        return f"{self.date} {self.reason}".strip()
@@ -0,0 +1,287 @@
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db.models import Count, DurationField, ExpressionWrapper, F, Sum
+from django.db.models.functions import ExtractHour, ExtractIsoWeekDay, TruncDate, TruncMonth, TruncWeek
+
+from . import schedule
+from .models import Appointment, AppointmentDailyStat, Closure
+
+
+REPORT_BUCKETS = ("day", "week", "month")
+
+# longest window charted one point per day
+REPORT_MAX_DAYS = 366
+
+# longest window for week/month series and the aggregate-only reports
+# (heatmap, lead times)
+REPORT_HISTORY_MAX_DAYS = 3 * 366
+
+WEEKDAY_LABELS = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+
+LEAD_TIME_PERCENTILES = (50, 75, 90, 95)
+
+# Cached series are keyed by a generation number that every booking change
+# and schedule edit bumps, so the TTL only bounds how long another worker's
+# local cache can lag behind.
+REPORTS_TTL = 120
+
+_GENERATION_KEY = "reports:generation"
+
+# "01".."31", indexed by day of month
+_DAY_LABELS = [f"{n:02d}" for n in range(32)]
+
+
+def invalidate_reports():
+    try:
+        cache.incr(_GENERATION_KEY)
+    except ValueError:
+        cache.set(_GENERATION_KEY, 1, None)
+
+
+def _generation():
+    cache.add(_GENERATION_KEY, 0, None)
+    return cache.get(_GENERATION_KEY, 0)
+
+
+def _cached(build, *args):
+    """build(*args), cached under the current reports generation."""
+    key = f"reports:{build.__name__}:{_generation()}:" + ":".join(map(str, args))
+    value = cache.get(key)
+    if value is None:
+        value = build(*args)
+        cache.set(key, value, REPORTS_TTL)
+    return value
+
+
+def daily_totals(start, end):
+    """Bookings per date from start to end inclusive, as {date: count}; empty days are absent."""
+    return dict(
+        AppointmentDailyStat.objects
+        .filter(date__range=[start, end])
+        .order_by("date")
+        .values("date")
+        .annotate(total=Sum("booked"))
+        .values_list("date", "total")
+    )
+
+
+def _day_labels(start, end):
+    """"dd-mm-YYYY" for every day in the window, formatting once per month."""
+    labels = []
+    month = start.replace(day=1)
+    while month <= end:
+        next_month = (month.replace(day=28) + timedelta(days=4)).replace(day=1)
+        first = max(month, start).day
+        last = min(next_month - timedelta(days=1), end).day
+        suffix = f"-{month.month:02d}-{month.year}"
+        labels.extend(day + suffix for day in _DAY_LABELS[first:last + 1])
+        month = next_month
+    return labels
+
+
+def _day_capacity(start, n):
+    """Open slots per day for n days from start, from the weekly grid and closures."""
+    week = schedule.weekly_slots()
+    per_weekday = [len(week[wd]) for wd in range(7)]
+    offset = start.weekday()
+    capacity = [per_weekday[(offset + i) % 7] for i in range(n)]
+
+    end = start + timedelta(days=n - 1)
+    for d in Closure.objects.filter(date__range=[start, end]).values_list("date", flat=True):
+        capacity[(d - start).days] = 0
+    return capacity
+
+
+def _bucket_start(d, bucket):
+    if bucket == "week":
+        return d - timedelta(days=d.weekday())
+    if bucket == "month":
+        return d.replace(day=1)
+    return d
+
+
+def _next_bucket(d, bucket):
+    if bucket == "day":
+        return d + timedelta(days=1)
+    if bucket == "week":
+        return d + timedelta(days=7)
+    return (d.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def _bucketed_totals(start, end, bucket):
+    """Bookings per week or month, summed by the database: {bucket start date: count}."""
+    trunc = {"week": TruncWeek, "month": TruncMonth}[bucket]
+    return dict(
+        AppointmentDailyStat.objects
+        .filter(date__range=[start, end])
+        .annotate(bucket=trunc("date"))
+        .order_by("bucket")
+        .values("bucket")
+        .annotate(total=Sum("booked"))
+        .values_list("bucket", "total")
+    )
+
+
+def _series(start, end, bucket):
+    n = (end - start).days + 1
+    capacity = _day_capacity(start, n)
+
+    if bucket == "day":
+        booked = [0] * n
+        for d, total in daily_totals(start, end).items():
+            booked[(d - start).days] = total
+        return {
+            "labels": _day_labels(start, end),
+            "booked": booked,
+            "open": [max(c - b, 0) for c, b in zip(capacity, booked)],
+        }
+
+    totals = _bucketed_totals(start, end, bucket)
+    labels, booked, open_slots = [], [], []
+    first = _bucket_start(start, bucket)
+    while first <= end:
+        following = _next_bucket(first, bucket)
+        # the first and last buckets may only partly overlap the window
+        lo = (max(first, start) - start).days
+        hi = (min(following, end + timedelta(days=1)) - start).days
+        n_booked = totals.get(first, 0)
+
+        labels.append(first.strftime("%d-%m-%Y" if bucket == "week" else "%m-%Y"))
+        booked.append(n_booked)
+        open_slots.append(max(sum(capacity[lo:hi]) - n_booked, 0))
+        first = following
+    return {"labels": labels, "booked": booked, "open": open_slots}
+
+
+def report_series(start, end, bucket="day"):
+    """
+    Chart series from start to end inclusive, one point per day, week
+    (labelled by its Monday) or month:
+    {"labels": [...], "booked": [...], "open": [...]}.
+
+    Week and month totals are summed by the database over the daily
+    rollup. Served from the cache while no booking or schedule change has
+    happened.
+    """
+    return _cached(_series, start, end, bucket)
+
+
+def report_rows(start, end, bucket="day"):
+    """
+    Yield the report as table rows for export: a header
+    ["period", "booked", "open", <service>...], then one row per bucket
+    with the same figures as report_series() plus bookings per service.
+
+    The per-service counts are streamed from the rollup in bucket order
+    and merged with the series as they arrive.
+    """
+    series = report_series(start, end, bucket)
+    services = list(
+        AppointmentDailyStat.objects
+        .filter(date__range=[start, end], booked__gt=0)
+        .order_by("service")
+        .values_list("service", flat=True)
+        .distinct()
+    )
+    column = {service: i for i, service in enumerate(services)}
+    yield ["period", "booked", "open", *services]
+
+    stats = AppointmentDailyStat.objects.filter(date__range=[start, end], booked__gt=0)
+    if bucket == "day":
+        per_service = stats.order_by("date", "service").values_list("date", "service", "booked")
+    else:
+        trunc = {"week": TruncWeek, "month": TruncMonth}[bucket]
+        per_service = (
+            stats
+            .annotate(bucket=trunc("date"))
+            .order_by("bucket", "service")
+            .values_list("bucket", "service")
+            .annotate(total=Sum("booked"))
+        )
+    per_service = per_service.iterator(chunk_size=2000)
+    pending = next(per_service, None)
+
+    first = _bucket_start(start, bucket)
+    for label, booked, open_slots in zip(series["labels"], series["booked"], series["open"]):
+        counts = [0] * len(services)
+        while pending is not None and pending[0] == first:
+            # a service first booked after the header was written has no
+            # column; its bookings still count in the booked total
+            if pending[1] in column:
+                counts[column[pending[1]]] = pending[2]
+            pending = next(per_service, None)
+        yield [label, booked, open_slots, *counts]
+        first = _next_bucket(first, bucket)
+
+
+def _booking_heatmap(start, end):
+    counts = (
+        Appointment.objects
+        .filter(date__range=[start, end])
+        .annotate(weekday=ExtractIsoWeekDay("date"), hour=ExtractHour("time"))
+        .order_by()
+        .values_list("service", "weekday", "hour")
+        .annotate(n=Count("id"))
+    )
+
+    hours = {int(h["time"][:2]) for h in schedule.calendar_hours()}
+    cells = {}
+    for service, weekday, hour, n in counts:
+        cells[(service, weekday - 1, hour)] = n
+        hours.add(hour)
+    hours = sorted(hours)
+
+    services = []
+    for service in sorted({s for s, _, _ in cells}):
+        grid = [[cells.get((service, wd, h), 0) for h in hours] for wd in range(7)]
+        services.append({"service": service, "total": sum(map(sum, grid)), "cells": grid})
+    services.sort(key=lambda s: -s["total"])
+    return {"weekdays": WEEKDAY_LABELS, "hours": hours, "services": services}
+
+
+def booking_heatmap(start, end):
+    """
+    Bookings per service x weekday x hour for appointments dated start..end,
+    from one GROUP BY query:
+    {"weekdays": [...], "hours": [9, 10, ...],
+     "services": [{"service": ..., "total": n, "cells": [[n per hour] per weekday]}]}.
+    Services are ordered busiest first.
+    """
+    return _cached(_booking_heatmap, start, end)
+
+
+def _lead_times(start, end):
+    lead = ExpressionWrapper(F("date") - TruncDate("created_at"), output_field=DurationField())
+    histogram = (
+        Appointment.objects
+        .filter(date__range=[start, end])
+        .annotate(lead=lead)
+        .order_by("lead")
+        .values_list("lead")
+        .annotate(n=Count("id"))
+    )
+
+    rows = [(delta.days, n) for delta, n in histogram]
+    total = sum(n for _, n in rows)
+    result = {"count": total}
+    for p in LEAD_TIME_PERCENTILES:
+        # nearest-rank percentile over the per-day histogram
+        rank, seen, value = max(1, -(-total * p // 100)), 0, None
+        for days, n in rows:
+            seen += n
+            if seen >= rank:
+                value = days
+                break
+        result[f"p{p}"] = value
+    return result
+
+
+def lead_times(start, end):
+    """
+    Days between booking and appointment for appointments dated start..end:
+    {"count": n, "p50": days, "p75": ..., "p90": ..., "p95": ...}, with None
+    percentiles when there are no bookings. The database groups bookings
+    by lead time, so Python only walks one row per distinct day count.
+    """
+    return _cached(_lead_times, start, end)
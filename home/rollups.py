@@ -0,0 +1,123 @@
+from collections import Counter
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+from django.db.models.functions import Greatest
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .models import Appointment, AppointmentDailyStat, ServiceDailyCount
+from .reports import invalidate_reports
+
+
+def _apply_counts(model, deltas):
+    for (d, service), n in deltas.items():
+        rows = model.objects.filter(date=d, service=service)
+        change = {"booked": Greatest(F("booked") + n, 0)}
+        if rows.update(**change):
+            continue
+        try:
+            with transaction.atomic():
+                model.objects.create(date=d, service=service, booked=max(n, 0))
+        except IntegrityError:
+            # another booking created the row first
+            rows.update(**change)
+
+
+def _per_service(deltas):
+    """Booking deltas split into one delta per individual service."""
+    per_service = Counter()
+    for (d, service), n in deltas.items():
+        for name in Appointment.service_names(service):
+            per_service[(d, name)] += n
+    return {key: n for key, n in per_service.items() if n}
+
+
+def record_bookings(deltas):
+    """
+    Apply booking count changes to the rollups, e.g.
+    record_bookings({(date, "Flu Vaccination"): 1}): AppointmentDailyStat
+    per booked service string and ServiceDailyCount per individual service.
+
+    Each change is an UPDATE ... SET booked = booked + n, so concurrent
+    bookings on the same day never lose an increment; the first booking of
+    a (date, service) inserts the row instead. Counts never go below zero:
+    if the rollup has drifted (rows changed by .update() or raw SQL, which
+    send no signals) a delete still succeeds, and rebuild_daily_stats puts
+    the numbers right.
+    """
+    deltas = {key: n for key, n in deltas.items() if n}
+    if not deltas:
+        return
+    transaction.on_commit(invalidate_reports)
+    _apply_counts(AppointmentDailyStat, deltas)
+    _apply_counts(ServiceDailyCount, _per_service(deltas))
+
+
+def record_created(appointments):
+    """Count appointments inserted without signals, e.g. by bulk_create()."""
+    record_bookings(Counter((a.date, a.service) for a in appointments))
+
+
+def rebuild(start=None, end=None):
+    """
+    Recompute both rollups from Appointment, for all dates or just
+    start..end. Returns the number of AppointmentDailyStat rows written.
+    """
+    appointments = Appointment.objects.order_by()
+    stats = AppointmentDailyStat.objects.all()
+    per_service = ServiceDailyCount.objects.all()
+    if start:
+        appointments = appointments.filter(date__gte=start)
+        stats = stats.filter(date__gte=start)
+        per_service = per_service.filter(date__gte=start)
+    if end:
+        appointments = appointments.filter(date__lte=end)
+        stats = stats.filter(date__lte=end)
+        per_service = per_service.filter(date__lte=end)
+
+    with transaction.atomic():
+        stats.delete()
+        per_service.delete()
+        counts = {
+            (d, service): n
+            for d, service, n in appointments.values_list("date", "service").annotate(n=Count("id"))
+        }
+        rows = [AppointmentDailyStat(date=d, service=service, booked=n) for (d, service), n in counts.items()]
+        AppointmentDailyStat.objects.bulk_create(rows, batch_size=1000)
+        ServiceDailyCount.objects.bulk_create(
+            [ServiceDailyCount(date=d, service=name, booked=n) for (d, name), n in _per_service(counts).items()],
+            batch_size=1000,
+        )
+        transaction.on_commit(invalidate_reports)
+    return len(rows)
+
+
+# bulk_create() sends no signals, so bulk inserts call record_created()
+# themselves. Saves and deletes run these receivers inside the caller's
+# transaction; deletes are always wrapped in one by Django.
+
+@receiver(pre_save, sender=Appointment)
+def _remember_previous_slot(sender, instance, raw, **kwargs):
+    if instance._state.adding or raw:
+        instance._rollup_previous = None
+        return
+    instance._rollup_previous = (
+        Appointment.objects.filter(pk=instance.pk).values_list("date", "service").first()
+    )
+
+
+@receiver(post_save, sender=Appointment)
+def _count_saved(sender, instance, created, **kwargs):
+    deltas = Counter()
+    previous = getattr(instance, "_rollup_previous", None)
+    if previous:
+        deltas[previous] -= 1
+    if created or previous:
+        deltas[(instance.date, instance.service)] += 1
+    record_bookings(deltas)
+
+
+@receiver(post_delete, sender=Appointment)
+def _count_deleted(sender, instance, **kwargs):
+    record_bookings({(instance.date, instance.service): -1})
@@ -0,0 +1,247 @@
+from datetime import date as date_cls, datetime, time, timedelta
+
+from django.core.cache import cache
+
+from .models import Appointment, Closure, OpeningHours, ServiceCapacity, ServiceDailyCount
+from .slots import booked_times_range
+
+
+# Used for every weekday until opening hours are entered in the admin; it
+# matches the 09:00-12:00 five-minute grid the booking modal has always shown.
+DEFAULT_OPENS = time(9, 0)
+DEFAULT_CLOSES = time(12, 0)
+DEFAULT_SLOT_MINUTES = 5
+
+# schedule rows change rarely; the admin clears these keys on every edit
+SCHEDULE_TTL = 300
+
+_WEEK_KEY = "schedule:week"
+_LIMITS_KEY = "schedule:service_limits"
+
+
+def _build_slots(opens, closes, slot_minutes):
+    start = datetime.combine(date_cls.min, opens)
+    end = datetime.combine(date_cls.min, closes)
+    step = timedelta(minutes=slot_minutes)
+    slots = []
+    while start < end:
+        slots.append(start.strftime("%H:%M"))
+        start += step
+    return tuple(slots)
+
+
+def weekly_slots():
+    """
+    Precomputed slot list per weekday (0 = Monday), e.g. {0: ("09:00", ...)}.
+
+    Built once from OpeningHours and cached; weekdays without a row are
+    closed, unless there are no rows at all, in which case every day uses
+    the default grid.
+    """
+    week = cache.get(_WEEK_KEY)
+    if week is not None:
+        return week
+
+    rows = list(OpeningHours.objects.all())
+    if rows:
+        week = {wd: () for wd in range(7)}
+        for r in rows:
+            week[r.weekday] = _build_slots(r.opens, r.closes, r.slot_minutes)
+    else:
+        default = _build_slots(DEFAULT_OPENS, DEFAULT_CLOSES, DEFAULT_SLOT_MINUTES)
+        week = {wd: default for wd in range(7)}
+
+    cache.set(_WEEK_KEY, week, SCHEDULE_TTL)
+    return week
+
+
+def service_limits():
+    limits = cache.get(_LIMITS_KEY)
+    if limits is None:
+        limits = dict(ServiceCapacity.objects.values_list("service", "daily_limit"))
+        cache.set(_LIMITS_KEY, limits, SCHEDULE_TTL)
+    return limits
+
+
+def invalidate_schedule():
+    cache.delete_many([_WEEK_KEY, _LIMITS_KEY])
+
+
+def slots_per_day():
+    """Slot count of the busiest regular day, for headline capacity figures."""
+    return max(len(s) for s in weekly_slots().values())
+
+
+def calendar_hours():
+    """
+    Whole hours spanned by the opening schedule, as calendar rows:
+    [{"time": "09:00", "label": "9 AM"}, ...].
+    """
+    hours = sorted({int(s[:2]) for day in weekly_slots().values() for s in day})
+    return [
+        {"time": f"{h:02d}:00", "label": f"{(h + 11) % 12 + 1} {'AM' if h < 12 else 'PM'}"}
+        for h in hours
+    ]
+
+
+def day_slots(start, end):
+    """
+    Slot lists for every day from start to end inclusive, keyed by date.
+    Closures come back as an empty tuple.
+    """
+    week = weekly_slots()
+    closed = set(Closure.objects.filter(date__range=[start, end]).values_list("date", flat=True))
+    days = {}
+    d = start
+    while d <= end:
+        days[d] = () if d in closed else week[d.weekday()]
+        d += timedelta(days=1)
+    return days
+
+
+def _capped(services, limits):
+    """The individual services in `services` ("A + B" strings) that have a daily limit."""
+    return {name for s in services for name in Appointment.service_names(s) if name in limits}
+
+
+def _services_at_limit(start, end, services):
+    """Dates in the window where any of the given services is fully booked."""
+    limits = service_limits()
+    capped = _capped(services, limits)
+    if not capped:
+        return set()
+    counts = (
+        ServiceDailyCount.objects
+        .filter(date__range=[start, end], service__in=capped)
+        .values_list("date", "service", "booked")
+    )
+    return {d for d, service, booked in counts if booked >= limits[service]}
+
+
+def availability(start, end, services=()):
+    """
+    Slots, booked times and free times for every day in the window:
+    {"YYYY-MM-DD": {"slots": [...], "booked": [...], "free": [...]}}.
+
+    Free times are a set difference between the day's precomputed slots and
+    the booked times; a day where a requested service has reached its daily
+    limit has no free times.
+    """
+    slots = day_slots(start, end)
+    booked = booked_times_range(start, end)
+    full = _services_at_limit(start, end, services)
+
+    days = {}
+    for d, day in slots.items():
+        key = d.isoformat()
+        taken = {t[:5] for t in booked[key]}
+        free = [] if d in full else sorted(set(day) - taken)
+        days[key] = {"slots": list(day), "booked": sorted(taken), "free": free}
+    return days
+
+
+def slot_label(t):
+    """
+    "HH:MM" for a time on a whole minute, else None. Slots never carry
+    seconds, and 10:00:30 must not pass as 10:00: it would be stored as a
+    different time and slip past the unique (date, time) constraint.
+    """
+    if t.second or t.microsecond:
+        return None
+    return t.strftime("%H:%M")
+
+
+def is_open_slot(d, t):
+    """Whether t (a time) is one of the schedule's slots on date d."""
+    label = slot_label(t)
+    return label is not None and label in day_slots(d, d)[d]
+
+
+class ServiceFull(Exception):
+    """A booking would take one of its services past its daily limit."""
+
+    def __init__(self, service):
+        super().__init__(service)
+        self.service = service
+
+
+def _first_over(d, service, allowed_over):
+    limits = service_limits()
+    capped = sorted(_capped([service], limits))
+    if not capped:
+        return None
+    booked = dict(ServiceDailyCount.objects.filter(date=d, service__in=capped).values_list("service", "booked"))
+    return next((name for name in capped if booked.get(name, 0) > limits[name] + allowed_over), None)
+
+
+def service_at_limit(d, service):
+    """
+    The first of the booked services ("A + B") that has already reached its
+    daily limit on date d, or None.
+    """
+    return _first_over(d, service, -1)
+
+
+def claim_capacity(d, service):
+    """
+    Call inside a booking's transaction, after its INSERT: raises ServiceFull,
+    rolling the booking back, if it took one of its services past the daily
+    limit.
+
+    The INSERT's rollup has already run UPDATE ... SET booked = booked + 1
+    on each service's ServiceDailyCount row, and that row stays write-locked
+    until the transaction ends. So the counts read here include every
+    booking committed before this one, and no other booking for the same
+    service and day can commit in between: two requests for the last place
+    can't both get it.
+    """
+    full = _first_over(d, service, 0)
+    if full:
+        raise ServiceFull(full)
+
+
+# how far ahead next_free_slots looks before giving up
+NEXT_SLOTS_HORIZON_DAYS = 180
+
+
+def next_free_slots(start, n, services=(), now=None, horizon_days=NEXT_SLOTS_HORIZON_DAYS):
+    """
+    The first n free slots on or after start, as [(date, "HH:MM"), ...].
+
+    Walks the days in order alongside one streamed query of bookings over
+    the horizon, so it stops reading as soon as n slots have been found.
+    Slots earlier than now (a datetime) on its own day are skipped, as are
+    days where one of the given services has reached its daily limit.
+    """
+    end = start + timedelta(days=horizon_days - 1)
+    week = weekly_slots()
+    closed = set(Closure.objects.filter(date__range=[start, end]).values_list("date", flat=True))
+    full = _services_at_limit(start, end, services)
+
+    bookings = (
+        Appointment.objects
+        .filter(date__range=[start, end])
+        .order_by("date", "time")
+        .values_list("date", "time")
+        .iterator(chunk_size=500)
+    )
+    pending = next(bookings, None)
+
+    found = []
+    d = start
+    while d <= end and len(found) < n:
+        taken = set()
+        while pending is not None and pending[0] <= d:
+            if pending[0] == d:
+                taken.add(pending[1].strftime("%H:%M"))
+            pending = next(bookings, None)
+
+        if d not in closed and d not in full:
+            free = sorted(set(week[d.weekday()]) - taken)
+            if now is not None and d == now.date():
+                free = [t for t in free if t > now.strftime("%H:%M")]
+            found.extend((d, t) for t in free[:n - len(found)])
+        d += timedelta(days=1)
+
+    bookings.close()
+    return found
@@ -0,0 +1,83 @@
+import hashlib
+from datetime import timedelta
+
+from django.core.cache import cache
+
+from .models import Appointment
+
+
+# Each gunicorn worker has its own local-memory cache, so an invalidation
+# only reaches the worker that took the booking. The TTL bounds how long
+# another worker can serve a stale list; create_appointment's 409 is still
+# the final word on whether a slot is free.
+BOOKED_SLOTS_TTL = 60
+
+
+def _booked_key(d):
+    return f"booked_slots:{d}"
+
+
+def _booked_rows(d):
+    return Appointment.objects.filter(date=d).order_by("time").values_list("time", "created_at")
+
+
+def _booked_entry(rows):
+    times = [t.isoformat() for t, _ in rows]
+    return {
+        "times": times,
+        "etag": hashlib.md5(",".join(times).encode()).hexdigest(),
+        "last_modified": max((created for _, created in rows), default=None),
+    }
+
+
+def booked_times(d):
+    """
+    Booked times for one date, answered from the cache when possible.
+
+    Returns a dict with "times" (list of "HH:MM:SS" strings), "etag" and
+    "last_modified" (datetime of the newest booking, or None).
+    """
+    key = _booked_key(d)
+    entry = cache.get(key)
+    if entry is None:
+        entry = _booked_entry(list(_booked_rows(d)))
+        cache.set(key, entry, BOOKED_SLOTS_TTL)
+    return entry
+
+
+async def abooked_times(d):
+    """Async version of booked_times() for the ASGI booking views."""
+    key = _booked_key(d)
+    entry = await cache.aget(key)
+    if entry is None:
+        entry = _booked_entry([row async for row in _booked_rows(d)])
+        await cache.aset(key, entry, BOOKED_SLOTS_TTL)
+    return entry
+
+
+def invalidate_booked_times(*dates):
+    cache.delete_many([_booked_key(d) for d in dates])
+
+
+async def ainvalidate_booked_times(*dates):
+    await cache.adelete_many([_booked_key(d) for d in dates])
+
+
+def booked_times_range(start, end):
+    """
+    Booked times for every day from start to end (inclusive), from a single
+    query. Returns {"YYYY-MM-DD": ["HH:MM:SS", ...]}; free days map to [].
+    """
+    days = {
+        (start + timedelta(days=i)).isoformat(): []
+        for i in range((end - start).days + 1)
+    }
+    rows = (
+        Appointment.objects
+        .filter(date__range=[start, end])
+        .order_by("date", "time")
+        .values_list("date", "time")
+    )
+    for d, t in rows:
+        days[d.isoformat()].append(t.isoformat())
+    return days
@@ -1,3 +1,1456 @@
-from django.test import TestCase
+import asyncio
+import base64
+import csv
+import json
+import re
+import secrets
+import tempfile
+import threading
+import zipfile
+from datetime import date, datetime, time, timedelta
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.contrib.auth import authenticate
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import IntegrityError, OperationalError, connection, transaction
+from django.db.models.functions import Lower
+from django.test import Client, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.http import HttpResponse
+from django.urls import reverse
+from django.utils import timezone
+
+from . import activity, archive, backends, events, exports, hashing, reports, throttle, views
+from .middleware import AsyncWhiteNoiseMiddleware
+from .models import (
+    Appointment, AppointmentDailyStat, Closure, OpeningHours, ServiceCapacity, ServiceDailyCount, UserActivity,
+    UserActivitySummary,
+)
+
+
+# tests post far more logins and bookings than the production rates allow;
+# ThrottleTests switches throttling back on with its own rates
+_no_throttling = override_settings(THROTTLE_RATES={})
+
+
+def setUpModule():
+    _no_throttling.enable()
+
+
+def tearDownModule():
+    _no_throttling.disable()
+
+
+def _booking_payload(**overrides):
+    data = {
+        "service": "Flu Vaccination (NHS)",
+        "date": "2030-01-07",
+        "time": "10:00",
+        "first_name": "Test",
+        "last_name": "Patient",
+        "dob": "01/01/1990",
+        "postcode": "DL1 1AA",
+        "email": "patient@example.com",
+        "phone": "07400123456",
+        "nhs_number": "1234567890",
+    }
+    data.update(overrides)
+    return data
+
+
+def _post_booking(client, **overrides):
+    return client.post(
+        reverse("create_appointment"),
+        data=json.dumps(_booking_payload(**overrides)),
+        content_type="application/json",
+    )
+
+
+class CreateAppointmentTests(TestCase):
+    def test_second_booking_for_same_slot_conflicts(self):
+        self.assertEqual(_post_booking(self.client).status_code, 200)
+
+        res = _post_booking(self.client, first_name="Other")
+        self.assertEqual(res.status_code, 409)
+        self.assertEqual(res.json()["status"], "error")
+        self.assertEqual(Appointment.objects.count(), 1)
+
+    def test_times_off_the_minute_cannot_double_book_a_slot(self):
+        self.assertEqual(_post_booking(self.client, time="10:00").status_code, 200)
+        for t in ("10:00:30", "10:00:59.5", "10:05:01"):
+            with self.subTest(time=t):
+                self.assertEqual(_post_booking(self.client, time=t).status_code, 400)
+        self.assertEqual(_post_booking(self.client, time=5).status_code, 400)
+        self.assertEqual(Appointment.objects.count(), 1)
+
+    def test_missing_field_is_rejected(self):
+        res = _post_booking(self.client, email="")
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(res.json()["message"], "email is required")
+
+    async def test_books_and_conflicts_through_the_async_client(self):
+        def post(**overrides):
+            return self.async_client.post(
+                reverse("create_appointment"),
+                data=json.dumps(_booking_payload(**overrides)),
+                content_type="application/json",
+            )
+
+        self.assertEqual((await post()).status_code, 200)
+        self.assertEqual((await post(first_name="Other")).status_code, 409)
+        res = await self.async_client.get(reverse("booked_slots"), {"date": "2030-01-07"})
+        self.assertEqual(res.json()["times"], ["10:00:00"])
+
+
+class BookedSlotsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def get_booked(self, **headers):
+        return self.client.get(reverse("booked_slots"), {"date": "2030-01-07"}, **headers)
+
+    def test_lists_booked_times_and_serves_repeat_reads_from_cache(self):
+        _post_booking(self.client, time="10:00")
+
+        res = self.get_booked()
+        self.assertEqual(res.json()["times"], ["10:00:00"])
+        with self.assertNumQueries(0):
+            self.get_booked()
+
+    def test_booking_invalidates_cached_times(self):
+        self.assertEqual(self.get_booked().json()["times"], [])
+
+        _post_booking(self.client, time="10:05")
+        self.assertEqual(self.get_booked().json()["times"], ["10:05:00"])
+
+    def test_conditional_get_returns_304_until_a_booking_lands(self):
+        _post_booking(self.client, time="10:00")
+        etag = self.get_booked()["ETag"]
+
+        self.assertEqual(self.get_booked(HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        _post_booking(self.client, time="10:05")
+        res = self.get_booked(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, 200)
+        self.assertNotEqual(res["ETag"], etag)
+
+
+class SlotEventsTests(TestCase):
+    async def test_open_stream_receives_slot_taken_for_its_dates_only(self):
+        res = await self.async_client.get(reverse("slot_events"), {"date": ["2030-01-07", "2030-01-08"]})
+        self.assertEqual(res["Content-Type"], "text/event-stream")
+        stream = aiter(res.streaming_content)
+        self.assertEqual(await anext(stream), b"retry: 5000\n\n")
+
+        events.publish_slot_taken(date(2030, 1, 9), time(9, 0))  # not watched
+        await self.async_client.post(
+            reverse("create_appointment"),
+            data=json.dumps(_booking_payload(date="2030-01-08", time="09:15")),
+            content_type="application/json",
+        )
+        chunk = await asyncio.wait_for(anext(stream), 5)
+        self.assertEqual(
+            chunk,
+            b'event: slot-taken\ndata: {"date": "2030-01-08", "time": "09:15"}\n\n',
+        )
+
+    async def test_broadcast_unsubscribes_and_caps_streams(self):
+        broadcast = events.SlotBroadcast()
+        monday = date(2030, 1, 7)
+        queue = broadcast.subscribe([monday])
+        broadcast.publish(monday, {"time": "09:00"})
+        self.assertEqual(await asyncio.wait_for(queue.get(), 5), {"time": "09:00"})
+
+        broadcast.unsubscribe(queue, [monday])
+        self.assertEqual(broadcast._by_date, {})
+        with mock.patch.object(events, "SLOT_EVENTS_MAX_SUBSCRIBERS", 1):
+            self.assertIsNotNone(broadcast.subscribe([monday]))
+            self.assertIsNone(broadcast.subscribe([monday]))
+
+    async def test_broadcast_caps_streams_per_client(self):
+        broadcast = events.SlotBroadcast()
+        monday = date(2030, 1, 7)
+        with mock.patch.object(events, "SLOT_EVENTS_MAX_PER_CLIENT", 2):
+            first = broadcast.subscribe([monday], "203.0.113.5")
+            self.assertIsNotNone(broadcast.subscribe([monday], "203.0.113.5"))
+            self.assertIsNone(broadcast.subscribe([monday], "203.0.113.5"))
+            self.assertIsNotNone(broadcast.subscribe([monday], "198.51.100.7"))
+
+            broadcast.unsubscribe(first, [monday], "203.0.113.5")
+            self.assertIsNotNone(broadcast.subscribe([monday], "203.0.113.5"))
+
+    async def test_stream_cap_counts_the_forwarded_client(self):
+        def open_stream(forwarded_for):
+            return self.async_client.get(
+                reverse("slot_events"), {"date": "2030-01-07"}, headers={"x-forwarded-for": forwarded_for},
+            )
+
+        with mock.patch.object(events, "slot_events", events.SlotBroadcast()), \
+                mock.patch.object(events, "SLOT_EVENTS_MAX_PER_CLIENT", 1):
+            statuses = [(await open_stream(ip)).status_code for ip in ("203.0.113.5", "203.0.113.5", "198.51.100.7")]
+        self.assertEqual(statuses, [200, 503, 200])
+
+    async def test_rejects_missing_or_bad_dates(self):
+        url = reverse("slot_events")
+        self.assertEqual((await self.async_client.get(url)).status_code, 400)
+        self.assertEqual((await self.async_client.get(url, {"date": "soon"})).status_code, 400)
+
+    def test_wsgi_requests_are_told_not_to_reconnect(self):
+        self.assertEqual(self.client.get(reverse("slot_events"), {"date": "2030-01-07"}).status_code, 204)
+
+
+class AsyncWhiteNoiseMiddlewareTests(TestCase):
+    async def test_only_static_urls_are_looked_up_in_a_thread(self):
+        async def view(request):
+            return HttpResponse("view")
+
+        with override_settings(WHITENOISE_AUTOREFRESH=True):
+            middleware = AsyncWhiteNoiseMiddleware(view)
+        with mock.patch.object(middleware, "find_file", return_value=None) as find_file:
+            res = await middleware(RequestFactory().get("/appointments/booked/"))
+            self.assertEqual(res.content, b"view")
+            find_file.assert_not_called()
+
+            await middleware(RequestFactory().get(settings.STATIC_URL + "css/site.css"))
+            find_file.assert_called_once_with(settings.STATIC_URL + "css/site.css")
+
+
+class BookedSlotsRangeTests(TestCase):
+    def test_month_returns_every_day_from_one_query(self):
+        _post_booking(self.client, date="2030-01-07", time="10:00")
+        _post_booking(self.client, date="2030-01-07", time="09:05")
+        _post_booking(self.client, date="2030-01-20", time="11:00")
+
+        with self.assertNumQueries(1):
+            res = self.client.get(reverse("booked_slots_range"), {"month": "2030-01"})
+
+        days = res.json()["days"]
+        self.assertEqual(len(days), 31)
+        self.assertEqual(days["2030-01-07"], ["09:05:00", "10:00:00"])
+        self.assertEqual(days["2030-01-20"], ["11:00:00"])
+        self.assertEqual(days["2030-01-08"], [])
+
+    def test_rejects_oversized_or_inverted_windows(self):
+        url = reverse("booked_slots_range")
+        self.assertEqual(self.client.get(url, {"start": "2030-01-01", "end": "2031-01-01"}).status_code, 400)
+        self.assertEqual(self.client.get(url, {"start": "2030-01-10", "end": "2030-01-01"}).status_code, 400)
+        self.assertEqual(self.client.get(url).status_code, 400)
+
+
+class AdminAppointmentsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser("admin", "admin@example.com", "pw")
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def get_page(self, **params):
+        res = self.client.get(reverse("admin_appointments"), params)
+        self.assertEqual(res.status_code, 200)
+        return res.json()
+
+    def test_keyset_pages_cover_every_row_once(self):
+        for minute in range(0, 25, 5):
+            _post_booking(self.client, time=f"09:{minute:02d}")
+
+        seen, cursor = [], None
+        while True:
+            params = {"limit": 2}
+            if cursor:
+                params["cursor"] = cursor
+            page = self.get_page(**params)
+            seen += [a["id"] for a in page["appointments"]]
+            cursor = page["next_cursor"]
+            if not cursor:
+                break
+
+        self.assertEqual(seen, list(Appointment.objects.order_by("-created_at", "-id").values_list("id", flat=True)))
+
+    def test_filters_by_service_date_and_text(self):
+        _post_booking(self.client, service="MMR Vaccine + DTP Vaccine", time="09:00")
+        _post_booking(self.client, service="Earwax Removal", time="09:05", last_name="Smith")
+        _post_booking(self.client, service="Earwax Removal", date="2030-02-01")
+
+        self.assertEqual(len(self.get_page(service="DTP Vaccine")["appointments"]), 1)
+        self.assertEqual(len(self.get_page(date_from="2030-01-01", date_to="2030-01-31")["appointments"]), 2)
+        self.assertEqual(self.get_page(q="smith")["appointments"][0]["last_name"], "Smith")
+
+    def test_bad_cursor_is_rejected(self):
+        res = self.client.get(reverse("admin_appointments"), {"cursor": "nope"})
+        self.assertEqual(res.status_code, 400)
+
+
+class ExportAppointmentsTests(TestCase):
+    def test_streams_csv_and_ndjson_with_dashboard_fields(self):
+        admin = User.objects.create_superuser("admin", "admin@example.com", "pw")
+        self.client.force_login(admin)
+        _post_booking(self.client, time="09:00")
+        _post_booking(self.client, time="09:05", note="needs, commas")
+
+        res = self.client.get(reverse("export_appointments"), {"format": "ndjson"})
+        self.assertTrue(res.streaming)
+        rows = [json.loads(line) for line in b"".join(res.streaming_content).decode().splitlines()]
+        self.assertEqual([r["time"] for r in rows], ["09:00", "09:05"])
+        self.assertEqual(rows[1]["nhs"], "1234567890")
+
+        out = StringIO()
+        call_command("export_appointments", format="csv", stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertTrue(lines[0].startswith("id,name,first_name"))
+        self.assertIn('"needs, commas"', lines[2])
+
+    def test_csv_cells_cannot_start_a_formula(self):
+        _post_booking(self.client, first_name="@SUM(A1)", note="=HYPERLINK(\"http://example.com\")")
+
+        out = StringIO()
+        call_command("export_appointments", format="csv", stdout=out)
+        row = next(csv.DictReader(StringIO(out.getvalue())))
+        self.assertEqual(row["first_name"], "'@SUM(A1)")
+        self.assertEqual(row["name"], "'@SUM(A1) Patient")
+        self.assertEqual(row["note"], "'=HYPERLINK(\"http://example.com\")")
+        self.assertEqual(row["nhs"], "1234567890")
+
+        out = StringIO()
+        call_command("export_appointments", format="ndjson", stdout=out)
+        self.assertEqual(json.loads(out.getvalue())["first_name"], "@SUM(A1)")
+
+    async def test_asgi_export_is_pulled_in_pieces_not_read_up_front(self):
+        admin = await User.objects.acreate(username="admin", is_superuser=True, is_staff=True)
+        await self.async_client.aforce_login(admin)
+        produced = []
+
+        def rows(fmt):
+            for i in range(5):
+                produced.append(i)
+                yield f"{i}\n"
+
+        with mock.patch.object(views, "stream_appointments", rows), mock.patch.object(views, "STREAM_HOP_CHUNKS", 2):
+            res = await self.async_client.get(reverse("export_appointments"), {"format": "ndjson"})
+            stream = aiter(res)  # as the ASGI handler reads it
+            self.assertEqual(await anext(stream), b"0\n")
+            self.assertEqual(produced, [0, 1])
+            self.assertEqual([c async for c in stream], [b"1\n", b"2\n", b"3\n", b"4\n"])
+
+    def test_requires_superuser(self):
+        res = self.client.get(reverse("export_appointments"))
+        self.assertEqual(res.status_code, 302)
+
+
+class HotQueryPlanTests(TestCase):
+    """
+    Runs EXPLAIN QUERY PLAN over every statement a hot endpoint issues,
+    with the parameters it was sent with (SQLite can't use a partial index
+    on the strength of a bound value), and fails unless each table named in `uses` is read through the index
+    meant for it (or by primary key), or on any full table scan or sort
+    that an index should have served.
+    """
+
+    PLAN_ROW = re.compile(r"(?:SCAN|SEARCH) (\w+)(?: USING (?:COVERING )?INDEX (\w+)| USING (INTEGER PRIMARY KEY))?")
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser("admin", "admin@example.com", "pw")
+        for action in ("signup", "login", "logout"):
+            UserActivity.objects.create(user=cls.admin, action=action)
+        activity.update_summaries(UserActivity.objects.select_related("user").order_by("timestamp"))
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.admin)
+        _post_booking(self.client)
+
+    def assertIndexedPlans(self, url, params=None, *, uses):
+        statements = []
+
+        def record(execute, sql, sql_params, many, context):
+            if sql.startswith("SELECT"):
+                statements.append((sql, sql_params))
+            return execute(sql, sql_params, many, context)
+
+        with connection.execute_wrapper(record):
+            self.assertEqual(self.client.get(url, params or {}).status_code, 200)
+
+        self.assertTrue(statements)
+        seen = set()
+        with connection.cursor() as cursor:
+            for sql, sql_params in statements:
+                cursor.execute("EXPLAIN QUERY PLAN " + sql, sql_params)
+                for row in cursor.fetchall():
+                    detail = row[-1]
+                    with self.subTest(sql=sql, plan=detail):
+                        self.assertFalse(
+                            detail.startswith("SCAN") and "USING" not in detail,
+                            "full table scan",
+                        )
+                        self.assertNotIn("TEMP B-TREE", detail)
+                        match = self.PLAN_ROW.match(detail)
+                        if not match or match[1] not in uses or match[3]:
+                            continue
+                        self.assertEqual(match[2], uses[match[1]], f"{match[1]} read without its index")
+                        seen.add(match[1])
+        self.assertEqual(seen, set(uses), "expected index never used")
+
+    def test_booked_slots(self):
+        self.assertIndexedPlans(
+            reverse("booked_slots"), {"date": "2030-01-07"},
+            uses={"home_appointment": "sqlite_autoindex_home_appointment_1"},
+        )
+
+    def test_booked_slots_range(self):
+        self.assertIndexedPlans(
+            reverse("booked_slots_range"), {"month": "2030-01"},
+            uses={"home_appointment": "sqlite_autoindex_home_appointment_1"},
+        )
+
+    def test_admin_reports_data(self):
+        self.assertIndexedPlans(reverse("admin_reports_data"), {"days": 30}, uses={
+            "home_closure": "sqlite_autoindex_home_closure_1",
+            "home_appointmentdailystat": "sqlite_autoindex_home_appointmentdailystat_1",
+        })
+
+    def test_admin_appointments(self):
+        self.assertIndexedPlans(reverse("admin_appointments"), uses={"home_appointment": "appointment_created_idx"})
+
+    def test_user_history(self):
+        self.assertIndexedPlans(
+            reverse("user_history"), uses={"home_useractivitysummary": "activity_summary_recent_idx"},
+        )
+
+    def test_activity_log(self):
+        self.assertIndexedPlans(reverse("activity_log"), uses={"home_useractivity": "activity_ts_idx"})
+
+    def test_admin_users(self):
+        cursor = base64.urlsafe_b64encode(b'["a", 1]').decode()
+        for params, index in (
+            ({}, "sqlite_autoindex_auth_user_1"),
+            ({"q": "ad", "cursor": cursor}, "sqlite_autoindex_auth_user_1"),
+            ({"by": "email", "q": "AD", "cursor": cursor}, "auth_user_email_lower_uniq"),
+        ):
+            with self.subTest(params=params):
+                self.assertIndexedPlans(reverse("admin_users"), params, uses={"auth_user": index})
+
+    def test_activity_log_filtered(self):
+        cursor = views._encode_cursor(timezone.now(), 10**6)
+        for params, uses in (
+            ({"action": "login", "cursor": cursor}, {"home_useractivity": "activity_action_ts_idx"}),
+            ({"user": "admin", "cursor": cursor}, {
+                "home_useractivity": "activity_user_ts_idx", "auth_user": "sqlite_autoindex_auth_user_1",
+            }),
+            ({"email": "admin@example.com", "action": "logout"}, {
+                "home_useractivity": "activity_user_ts_idx", "auth_user": "auth_user_email_lower_uniq",
+            }),
+            ({"date_from": "2020-01-01", "date_to": "2030-01-01"}, {"home_useractivity": "activity_ts_idx"}),
+        ):
+            with self.subTest(params=params):
+                self.assertIndexedPlans(reverse("activity_log"), params, uses=uses)
+
+
+class ScheduleTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        # don't leak this test's schedule into later tests
+        self.addCleanup(cache.clear)
+
+    def get_days(self, **params):
+        res = self.client.get(reverse("availability"), params)
+        self.assertEqual(res.status_code, 200)
+        return res.json()["days"]
+
+    def test_default_grid_and_free_slots_are_a_set_difference(self):
+        _post_booking(self.client, time="09:05")
+
+        day = self.get_days(start="2030-01-07", end="2030-01-07")["2030-01-07"]
+        self.assertEqual(len(day["slots"]), 36)
+        self.assertEqual(day["slots"][:2], ["09:00", "09:05"])
+        self.assertEqual(day["booked"], ["09:05"])
+        self.assertNotIn("09:05", day["free"])
+        self.assertEqual(len(day["free"]), 35)
+
+    def test_opening_hours_and_closures_drive_slots_and_bookings(self):
+        OpeningHours.objects.create(weekday=0, opens=time(14, 0), closes=time(15, 0), slot_minutes=30)
+        Closure.objects.create(date=date(2030, 1, 14), reason="Bank holiday")
+
+        days = self.get_days(start="2030-01-07", end="2030-01-14")
+        self.assertEqual(days["2030-01-07"]["slots"], ["14:00", "14:30"])
+        self.assertEqual(days["2030-01-08"]["slots"], [])   # Tuesday has no opening hours
+        self.assertEqual(days["2030-01-14"]["slots"], [])   # closed
+
+        self.assertEqual(_post_booking(self.client, time="10:00").status_code, 400)
+        self.assertEqual(_post_booking(self.client, date="2030-01-14", time="14:00").status_code, 400)
+        self.assertEqual(_post_booking(self.client, time="14:30").status_code, 200)
+
+    def test_service_daily_limit(self):
+        ServiceCapacity.objects.create(service="MMR Vaccine", daily_limit=1)
+        self.assertEqual(_post_booking(self.client, service="MMR Vaccine + DTP Vaccine", time="09:00").status_code, 200)
+
+        res = _post_booking(self.client, service="MMR Vaccine", time="09:05")
+        self.assertEqual(res.status_code, 409)
+        self.assertIn("MMR Vaccine", res.json()["message"])
+
+        day = self.get_days(start="2030-01-07", end="2030-01-07", service="MMR Vaccine")["2030-01-07"]
+        self.assertEqual(day["free"], [])
+        # the rejected booking left nothing behind
+        self.assertEqual(Appointment.objects.count(), 1)
+        self.assertEqual(ServiceDailyCount.objects.get(date=date(2030, 1, 7), service="MMR Vaccine").booked, 1)
+
+    def test_service_limits_match_whole_service_names(self):
+        ServiceCapacity.objects.create(service="Flu Vaccination", daily_limit=1)
+        self.assertEqual(_post_booking(self.client, service="Flu Vaccination (NHS)", time="09:00").status_code, 200)
+        self.assertEqual(_post_booking(self.client, service="Flu Vaccination", time="09:05").status_code, 200)
+        self.assertEqual(_post_booking(self.client, service="Flu Vaccination", time="09:10").status_code, 409)
+
+        day = self.get_days(start="2030-01-07", end="2030-01-07", service="Flu Vaccination (NHS)")["2030-01-07"]
+        self.assertNotEqual(day["free"], [])
+
+    def test_next_available_skips_booked_closed_and_capped_days(self):
+        OpeningHours.objects.create(weekday=0, opens=time(9, 0), closes=time(10, 0), slot_minutes=30)
+        OpeningHours.objects.create(weekday=1, opens=time(9, 0), closes=time(10, 0), slot_minutes=30)
+        Closure.objects.create(date=date(2030, 1, 8))
+        ServiceCapacity.objects.create(service="MMR Vaccine", daily_limit=1)
+        ServiceCapacity.objects.create(service="Flu Vaccination", daily_limit=1)
+        _post_booking(self.client, time="09:00")
+        _post_booking(self.client, service="MMR Vaccine", time="09:30", date="2030-01-14")
+
+        def next_slots(**params):
+            res = self.client.get(reverse("next_available"), {"from": "2030-01-07", **params})
+            return [(x["date"], x["time"]) for x in res.json()["slots"]]
+
+        self.assertEqual(
+            next_slots(n=3),
+            [("2030-01-07", "09:30"), ("2030-01-14", "09:00"), ("2030-01-15", "09:00")],
+        )
+        self.assertEqual(
+            next_slots(n=2, service="MMR Vaccine"),
+            [("2030-01-07", "09:30"), ("2030-01-15", "09:00")],
+        )
+
+        # limits match whole service names, including inside "A + B" bookings
+        _post_booking(self.client, service="Flu Vaccination (NHS)", time="09:00", date="2030-01-15")
+        _post_booking(self.client, service="Flu Vaccination + MMR Vaccine", time="09:00", date="2030-01-21")
+        self.assertEqual(
+            next_slots(n=2, service="Flu Vaccination", **{"from": "2030-01-15"}),
+            [("2030-01-15", "09:30"), ("2030-01-22", "09:00")],
+        )
+
+    def test_reports_use_schedule_capacity(self):
+        admin = User.objects.create_superuser("admin", "admin@example.com", "pw")
+        self.client.force_login(admin)
+        today = date.today()
+        Closure.objects.create(date=today + timedelta(days=1))
+
+        data = self.client.get(reverse("admin_reports_data"), {"days": 3}).json()
+        self.assertEqual(data["total_slots_per_day"], 36)
+        self.assertEqual(data["open"], [36, 0, 36])
+
+
+class DailyStatRollupTests(TestCase):
+    def stats(self):
+        return list(AppointmentDailyStat.objects.filter(booked__gt=0).values_list("date", "service", "booked"))
+
+    def test_bookings_edits_and_deletes_keep_the_rollup_current(self):
+        _post_booking(self.client, time="10:00")
+        _post_booking(self.client, time="10:05")
+        _post_booking(self.client, time="10:10", service="Blood Pressure Check")
+        monday = date(2030, 1, 7)
+        self.assertEqual(self.stats(), [
+            (monday, "Blood Pressure Check", 1),
+            (monday, "Flu Vaccination (NHS)", 2),
+        ])
+
+        appt = Appointment.objects.get(time=time(10, 5))
+        appt.date = monday + timedelta(days=1)
+        appt.save()
+        Appointment.objects.filter(service="Blood Pressure Check").delete()
+        self.assertEqual(self.stats(), [
+            (monday, "Flu Vaccination (NHS)", 1),
+            (monday + timedelta(days=1), "Flu Vaccination (NHS)", 1),
+        ])
+
+    def test_rebuild_matches_incremental_counts(self):
+        _post_booking(self.client, time="10:00")
+        _post_booking(self.client, date="2030-01-08", time="10:00")
+        before = self.stats()
+
+        AppointmentDailyStat.objects.update(booked=99)
+        call_command("rebuild_daily_stats", stdout=StringIO())
+        self.assertEqual(self.stats(), before)
+
+    def test_delete_survives_a_drifted_rollup(self):
+        _post_booking(self.client, time="10:00")
+        # a bulk update sends no signals, so the rollup has missed a change
+        AppointmentDailyStat.objects.update(booked=0)
+        Appointment.objects.get().delete()
+        self.assertEqual(AppointmentDailyStat.objects.get().booked, 0)
+
+    def test_reports_read_booked_counts_from_the_rollup(self):
+        admin = User.objects.create_superuser("admin", "admin@example.com", "pw")
+        self.client.force_login(admin)
+        tomorrow = date.today() + timedelta(days=1)
+        AppointmentDailyStat.objects.create(date=tomorrow, service="A", booked=2)
+        AppointmentDailyStat.objects.create(date=tomorrow, service="B", booked=3)
+
+        data = self.client.get(reverse("admin_reports_data"), {"days": 3}).json()
+        self.assertEqual(data["booked"], [0, 5, 0])
+
+
+class ReportSeriesTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.client.force_login(User.objects.create_superuser("admin", "admin@example.com", "pw"))
+
+    def get_report(self, days):
+        return self.client.get(reverse("admin_reports_data"), {"days": days})
+
+    def test_window_is_validated_and_clamped(self):
+        self.assertEqual(self.get_report("lots").status_code, 400)
+
+        data = self.get_report(1000000).json()
+        self.assertEqual(data["days"], reports.REPORT_MAX_DAYS)
+        self.assertEqual(len(data["labels"]), reports.REPORT_MAX_DAYS)
+        self.assertEqual(len(self.get_report(-5).json()["labels"]), 1)
+
+    def test_labels_span_month_and_year_boundaries(self):
+        self.assertEqual(
+            reports._day_labels(date(2029, 12, 30), date(2030, 1, 2)),
+            ["30-12-2029", "31-12-2029", "01-01-2030", "02-01-2030"],
+        )
+
+    def test_week_and_month_buckets_over_an_explicit_window(self):
+        # 2030-01-07 is a Monday; the default grid has 36 slots every day
+        AppointmentDailyStat.objects.create(date=date(2030, 1, 7), service="A", booked=2)
+        AppointmentDailyStat.objects.create(date=date(2030, 1, 12), service="B", booked=3)
+        AppointmentDailyStat.objects.create(date=date(2030, 2, 1), service="A", booked=1)
+        window = {"start": "2030-01-03", "end": "2030-02-01"}
+
+        week = self.client.get(reverse("admin_reports_data"), {**window, "bucket": "week"}).json()
+        self.assertEqual(week["labels"], ["31-12-2029", "07-01-2030", "14-01-2030", "21-01-2030", "28-01-2030"])
+        self.assertEqual(week["booked"], [0, 5, 0, 0, 1])
+        # the first and last weeks only count the days inside the window
+        self.assertEqual(week["open"], [4 * 36, 7 * 36 - 5, 7 * 36, 7 * 36, 5 * 36 - 1])
+
+        month = self.client.get(reverse("admin_reports_data"), {**window, "bucket": "month"}).json()
+        self.assertEqual(month["labels"], ["01-2030", "02-2030"])
+        self.assertEqual(month["booked"], [5, 1])
+        self.assertEqual(month["open"], [29 * 36 - 5, 36 - 1])
+
+    def test_long_histories_need_a_coarse_bucket(self):
+        three_years = {"start": "2027-01-01", "end": "2029-12-31"}
+        self.assertEqual(self.client.get(reverse("admin_reports_data"), three_years).status_code, 400)
+
+        data = self.client.get(reverse("admin_reports_data"), {**three_years, "bucket": "month"}).json()
+        self.assertEqual(len(data["labels"]), 36)
+        self.assertEqual(self.client.get(reverse("admin_reports_data"), {"bucket": "year"}).status_code, 400)
+
+    def test_series_is_cached_until_a_booking_lands(self):
+        tomorrow = date.today() + timedelta(days=1)
+        self.assertEqual(self.get_report(3).json()["booked"], [0, 0, 0])
+        with self.assertNumQueries(2):  # session and user only
+            self.get_report(3)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            _post_booking(self.client, date=tomorrow.isoformat(), time="10:00")
+        self.assertEqual(self.get_report(3).json()["booked"], [0, 1, 0])
+
+
+class ReportExportTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.client.force_login(User.objects.create_superuser("admin", "admin@example.com", "pw"))
+        AppointmentDailyStat.objects.create(date=date(2030, 1, 7), service="Flu", booked=2)
+        AppointmentDailyStat.objects.create(date=date(2030, 1, 7), service="Travel", booked=1)
+        AppointmentDailyStat.objects.create(date=date(2030, 2, 4), service="Travel", booked=4)
+
+    def export(self, **params):
+        params = {"start": "2030-01-01", "end": "2030-02-28", **params}
+        return self.client.get(reverse("admin_reports_export"), params)
+
+    def test_csv_has_the_series_and_a_column_per_service(self):
+        res = self.export(bucket="month", format="csv")
+        self.assertEqual(res["Content-Type"], "text/csv")
+        self.assertIn("bookings_2030-01-01_2030-02-28_month.csv", res["Content-Disposition"])
+        lines = b"".join(res.streaming_content).decode().splitlines()
+        self.assertEqual(lines, [
+            "period,booked,open,Flu,Travel",
+            f"01-2030,3,{31 * 36 - 3},2,1",
+            f"02-2030,4,{28 * 36 - 4},0,4",
+        ])
+
+    def test_xlsx_is_a_valid_workbook(self):
+        res = self.export(format="xlsx")
+        with zipfile.ZipFile(BytesIO(b"".join(res.streaming_content))) as workbook:
+            self.assertIsNone(workbook.testzip())
+            sheet = workbook.read("xl/worksheets/sheet1.xml").decode()
+        self.assertIn("<t>period</t>", sheet)
+        self.assertIn('<row r="60">', sheet)  # header + 59 days
+        self.assertIn('<c r="A7" t="inlineStr"><is><t>06-01-2030</t></is></c>', sheet)
+        self.assertIn('<c r="B8"><v>3</v></c>', sheet)
+
+    def test_large_sheets_are_streamed_in_pieces(self):
+        # random text so the deflate stream can't shrink it to nothing
+        rows = ([i, f"<{secrets.token_hex(64)}>"] for i in range(3 * exports.XLSX_FLUSH_ROWS))
+        chunks = [c for c in exports.stream_xlsx_rows(rows) if c]
+        self.assertGreater(len(chunks), 3)
+        self.assertLess(max(map(len, chunks)), sum(map(len, chunks)) / 2)
+        with zipfile.ZipFile(BytesIO(b"".join(chunks))) as workbook:
+            self.assertIn('<row r="1500"><c r="A1500"><v>1499</v></c><c r="B1500" t="inlineStr"><is><t>&lt;',
+                          workbook.read("xl/worksheets/sheet1.xml").decode())
+
+    def test_service_first_booked_mid_export_is_skipped(self):
+        rows = reports.report_rows(date(2030, 1, 7), date(2030, 1, 7))
+        self.assertEqual(next(rows), ["period", "booked", "open", "Flu", "Travel"])
+        AppointmentDailyStat.objects.create(date=date(2030, 1, 7), service="Zoster", booked=1)
+        self.assertEqual(list(rows), [["07-01-2030", 3, 33, 2, 1]])
+
+    def test_free_text_cannot_become_a_formula_or_break_the_sheet(self):
+        AppointmentDailyStat.objects.create(date=date(2030, 1, 7), service="=HYPERLINK(\"x\")", booked=1)
+        AppointmentDailyStat.objects.create(date=date(2030, 1, 7), service="Zoster\x0b\x01", booked=1)
+
+        header = b"".join(self.export(format="csv").streaming_content).decode().split("\r\n")[0]
+        self.assertEqual(header, 'period,booked,open,"\'=HYPERLINK(""x"")",Flu,Travel,Zoster\x0b\x01')
+
+        with zipfile.ZipFile(BytesIO(b"".join(self.export(format="xlsx").streaming_content))) as workbook:
+            sheet = workbook.read("xl/worksheets/sheet1.xml").decode()
+        self.assertIn("<t>Zoster</t>", sheet)
+
+    def test_rejects_unknown_format(self):
+        self.assertEqual(self.export(format="pdf").status_code, 400)
+
+
+class ReportHeatmapTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.client.force_login(User.objects.create_superuser("admin", "admin@example.com", "pw"))
+
+    def book(self, day, at, service, booked_days_before):
+        _post_booking(self.client, date=day, time=at, service=service)
+        appt = Appointment.objects.get(date=day, time=at)
+        created = timezone.make_aware(datetime.combine(appt.date - timedelta(days=booked_days_before), time(12)))
+        Appointment.objects.filter(pk=appt.pk).update(created_at=created)
+
+    def test_heatmap_and_lead_times_come_from_two_aggregate_queries(self):
+        self.book("2030-01-07", "09:00", "Flu", 1)   # Monday
+        self.book("2030-01-07", "09:05", "Flu", 2)
+        self.book("2030-01-08", "11:30", "Flu", 3)   # Tuesday
+        self.book("2030-01-09", "10:00", "Travel", 10)
+
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.get(reverse("admin_reports_heatmap"), {"start": "2030-01-01", "end": "2030-01-31"})
+        appointment_queries = [q for q in ctx.captured_queries if '"home_appointment"' in q["sql"]]
+        self.assertEqual(len(appointment_queries), 2)
+
+        data = res.json()
+        heatmap = data["heatmap"]
+        self.assertEqual(heatmap["hours"], [9, 10, 11])
+        self.assertEqual([s["service"] for s in heatmap["services"]], ["Flu", "Travel"])
+        flu = heatmap["services"][0]
+        self.assertEqual(flu["total"], 3)
+        self.assertEqual(flu["cells"][0], [2, 0, 0])
+        self.assertEqual(flu["cells"][1], [0, 0, 1])
+        self.assertEqual(heatmap["services"][1]["cells"][2], [0, 1, 0])
+        self.assertEqual(data["lead_time_days"], {"count": 4, "p50": 2, "p75": 3, "p90": 10, "p95": 10})
+
+    def test_rejects_bad_or_oversized_windows(self):
+        url = reverse("admin_reports_heatmap")
+        self.assertEqual(self.client.get(url, {"start": "nope"}).status_code, 400)
+        self.assertEqual(self.client.get(url, {"start": "2020-01-01", "end": "2030-01-01"}).status_code, 400)
+        self.assertEqual(self.client.get(url).json()["lead_time_days"]["p50"], None)
+
+
+class ImportAppointmentsCommandTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def import_rows(self, rows, **options):
+        with tempfile.TemporaryDirectory() as tmp:
+            src = Path(tmp) / "bookings.jsonl"
+            src.write_text("".join(json.dumps(r) + "\n" for r in rows))
+            call_command("import_appointments", str(src), stdout=StringIO(), **options)
+            rejects = Path(f"{src}.rejects.jsonl")
+            return [(r["line"], r["reason"]) for r in map(json.loads, rejects.read_text().splitlines())] \
+                if rejects.exists() else []
+
+    def test_imports_valid_rows_and_writes_rejects(self):
+        _post_booking(self.client, date="2030-01-07", time="10:00")
+        rows = [
+            _booking_payload(time="09:00"),
+            _booking_payload(time="10:00"),                   # clashes with the live booking
+            _booking_payload(time="09:00", first_name="Dup"),  # clashes within the file
+            _booking_payload(time="09:05", email=""),
+            _booking_payload(time="09:10"),
+        ]
+
+        with tempfile.TemporaryDirectory() as tmp:
+            src = Path(tmp) / "bookings.jsonl"
+            src.write_text("".join(json.dumps(r) + "\n" for r in rows) + "not json\n")
+
+            call_command("import_appointments", str(src), batch_size=2, stdout=StringIO())
+
+            rejects = [json.loads(line) for line in Path(f"{src}.rejects.jsonl").read_text().splitlines()]
+
+        self.assertEqual(
+            [t.strftime("%H:%M") for t in Appointment.objects.order_by("time").values_list("time", flat=True)],
+            ["09:00", "09:10", "10:00"],
+        )
+        self.assertEqual(
+            [(r["line"], r["reason"]) for r in rejects],
+            [(2, "slot already booked"), (4, "email is required"), (3, "slot already booked"), (6, "invalid JSON")],
+        )
+        self.assertEqual(
+            sum(AppointmentDailyStat.objects.values_list("booked", flat=True)),
+            Appointment.objects.count(),
+        )
+
+    def test_rows_are_checked_against_the_schedule(self):
+        Closure.objects.create(date=date(2030, 1, 8))
+        ServiceCapacity.objects.create(service="MMR Vaccine", daily_limit=1)
+        _post_booking(self.client, service="MMR Vaccine", time="09:00")
+
+        rejects = self.import_rows([
+            _booking_payload(time="13:00"),
+            _booking_payload(date="2030-01-08"),
+            _booking_payload(service="Flu Vaccination + MMR Vaccine", time="09:05"),
+            _booking_payload(service="MMR Vaccine", date="2030-01-09", time="09:05"),
+            _booking_payload(service="MMR Vaccine", date="2030-01-09", time="09:10"),
+            _booking_payload(date=20300107),
+            _booking_payload(service="MMR Vaccine", time="09:00:30"),
+            _booking_payload(service=["Flu Vaccination"], time="09:15"),
+            _booking_payload(note={"text": "hi"}, time="09:20"),
+            _booking_payload(time="09:25"),
+        ])
+
+        self.assertEqual(rejects, [
+            (6, "date must be a string"),
+            (8, "service must be a string"),
+            (9, "note must be a string"),
+            (1, "outside opening hours"),
+            (2, "outside opening hours"),
+            (3, "MMR Vaccine is fully booked on this day"),
+            (5, "MMR Vaccine is fully booked on this day"),
+            (7, "time is not on a whole minute"),
+        ])
+        self.assertEqual(Appointment.objects.count(), 3)
+
+    def test_past_rows_skip_the_schedule_checks(self):
+        ServiceCapacity.objects.create(service="MMR Vaccine", daily_limit=1)
+        past = date.today() - timedelta(days=30)
+        Closure.objects.create(date=past)
+
+        rejects = self.import_rows([
+            _booking_payload(service="MMR Vaccine", date=past.isoformat(), time="14:00"),
+            _booking_payload(service="MMR Vaccine", date=past.isoformat(), time="15:00"),
+            _booking_payload(service="MMR Vaccine", date=past.isoformat(), time="15:00"),
+            _booking_payload(date=past.isoformat(), time="16:00:30"),
+        ])
+
+        self.assertEqual(rejects, [(3, "slot already booked"), (4, "time is not on a whole minute")])
+        self.assertEqual(Appointment.objects.filter(date=past).count(), 2)
+
+    def test_batch_that_keeps_clashing_is_rejected_and_the_import_goes_on(self):
+        # BatchImportCommand's retries, shared with provision_users
+        bulk_create = Appointment.objects.bulk_create
+        calls = []
+
+        def clash_first_batch(objs, **kwargs):
+            calls.append(len(objs))
+            if len(calls) <= 3:
+                raise IntegrityError("UNIQUE constraint failed")
+            return bulk_create(objs, **kwargs)
+
+        with mock.patch.object(Appointment.objects, "bulk_create", side_effect=clash_first_batch):
+            rejects = self.import_rows(
+                [_booking_payload(time=t) for t in ("09:00", "09:05", "09:10")], batch_size=2,
+            )
+
+        self.assertEqual(rejects, [(1, "batch kept clashing with live bookings"),
+                                   (2, "batch kept clashing with live bookings")])
+        self.assertEqual([t.strftime("%H:%M") for t in Appointment.objects.values_list("time", flat=True)], ["09:10"])
+
+
+class SignupTests(TestCase):
+    def setUp(self):
+        # keep the signup's activity row out of the database
+        patcher = mock.patch.object(activity, "recorder", activity.ActivityRecorder(background=False))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def signup(self, username="sam", email="sam@example.com"):
+        return self.client.post(reverse("signup_user"), {"username": username, "email": email, "password": "pw"}).json()
+
+    def test_account_is_created_by_one_insert_without_checks(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(self.signup()["status"], "ok")
+        user_sql = [q["sql"] for q in ctx.captured_queries if '"auth_user"' in q["sql"]]
+        self.assertTrue(user_sql[0].startswith('INSERT INTO "auth_user"'))
+        self.assertEqual(sum(sql.startswith('INSERT INTO "auth_user"') for sql in user_sql), 1)
+
+    def test_conflicts_keep_their_messages(self):
+        self.signup()
+        self.client.logout()
+        self.assertEqual(self.signup(email="other@example.com")["message"], "Username already exists.")
+        self.assertEqual(self.signup(username="sam2", email="SAM@example.com")["message"], "Email already registered.")
+        self.assertEqual(User.objects.count(), 1)
+
+
+class ProvisionUsersCommandTests(TestCase):
+    def provision(self, rows, **options):
+        with tempfile.TemporaryDirectory() as tmp:
+            src = Path(tmp) / "users.jsonl"
+            src.write_text("".join(json.dumps(r) + "\n" for r in rows))
+            call_command("provision_users", str(src), stdout=StringIO(), **options)
+            rejects = Path(f"{src}.rejects.jsonl").read_text().splitlines()
+            return [(r["line"], r["reason"]) for r in map(json.loads, rejects)]
+
+    def test_creates_accounts_with_their_hashes_and_writes_rejects(self):
+        User.objects.create_user("taken", "taken@example.com", "pw")
+        pbkdf2 = make_password("secret", hasher="pbkdf2_sha256")
+        rows = [
+            {"username": "ann", "email": "ann@example.com", "password": pbkdf2, "date_joined": "2024-05-01T09:00:00"},
+            {"username": "taken", "email": "new@example.com", "password": pbkdf2},
+            {"username": "bea", "email": "TAKEN@example.com", "password": pbkdf2},
+            {"username": "cal", "email": "Ann@Example.com", "password": pbkdf2},   # clashes within the file
+            {"username": "dee", "email": "dee@example.com", "password": "secret"},  # plaintext
+            {"username": "eve", "email": "eve@example.com", "password": "!"},
+        ]
+
+        with tempfile.TemporaryDirectory() as tmp:
+            src = Path(tmp) / "users.jsonl"
+            src.write_text("".join(json.dumps(r) + "\n" for r in rows) + "not json\n")
+
+            with CaptureQueriesContext(connection) as ctx:
+                call_command("provision_users", str(src), batch_size=2, stdout=StringIO())
+
+            rejects = [json.loads(line) for line in Path(f"{src}.rejects.jsonl").read_text().splitlines()]
+
+        self.assertEqual(
+            [(r["line"], r["reason"]) for r in rejects],
+            [
+                (2, "username already exists"),
+                (3, "email already registered"),
+                (4, "email already registered"),
+                (5, "password is not a hash from PASSWORD_HASHERS"),
+                (7, "invalid JSON"),
+            ],
+        )
+        self.assertNotIn("secret", json.dumps(rejects))
+        # one bulk INSERT per batch that had accounts to create
+        self.assertEqual(sum(q["sql"].startswith('INSERT INTO "auth_user"') for q in ctx.captured_queries), 2)
+        self.assertEqual(sorted(User.objects.values_list("username", flat=True)), ["ann", "eve", "taken"])
+
+        ann = User.objects.get(username="ann")
+        self.assertEqual(ann.password, pbkdf2)
+        self.assertEqual(ann.date_joined.year, 2024)
+        self.assertIsNotNone(authenticate(email="ann@example.com", password="secret"))
+        self.assertFalse(User.objects.get(username="eve").has_usable_password())
+
+    def test_non_string_fields_are_rejected(self):
+        pbkdf2 = make_password("secret", hasher="pbkdf2_sha256")
+        ok = {"username": "ann", "email": "ann@example.com", "password": pbkdf2}
+        rejects = self.provision([
+            {**ok, "password": 12345},
+            {**ok, "username": ["ann"]},
+            {**ok, "email": {"address": "ann@example.com"}},
+            {**ok, "date_joined": 1714554000},
+            {**ok, "first_name": 7},
+            {**ok, "last_name": None},
+        ])
+        self.assertEqual(rejects, [
+            (1, "password must be a string"),
+            (2, "username must be a string"),
+            (3, "email must be a string"),
+            (4, "date_joined must be a string"),
+            (5, "first_name must be a string"),
+        ])
+        self.assertEqual(list(User.objects.values_list("username", flat=True)), ["ann"])
+
+
+class EmailLoginTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("pat", "Pat@Example.com", "pw")
+        # keep the login's activity row out of the database
+        recorder = activity.ActivityRecorder(background=False)
+        patcher = mock.patch.object(activity, "recorder", recorder)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def post_login(self, email, password="pw"):
+        return self.client.post(reverse("login_user"), {"username": email, "password": password}).json()
+
+    def test_user_is_resolved_and_checked_in_one_query(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(self.post_login("pat@example.com")["status"], "ok")
+        lookups = [q["sql"] for q in ctx.captured_queries if q["sql"].startswith('SELECT') and '"auth_user"' in q["sql"]]
+        self.assertEqual(len(lookups), 1)
+        self.assertIn("LOWER", lookups[0])
+
+    def test_wrong_password_and_unknown_email_both_hash(self):
+        with mock.patch("django.contrib.auth.hashers.ScryptPasswordHasher.encode", autospec=True,
+                        side_effect=lambda *a, **kw: "scrypt$salt$16384$8$1$hash") as encode:
+            self.assertEqual(self.post_login("nobody@example.com")["status"], "error")
+        self.assertEqual(encode.call_count, 1)
+        self.assertEqual(self.post_login("pat@example.com", "wrong")["status"], "error")
+
+    def test_hashing_runs_on_the_pool(self):
+        threads = []
+
+        def verify(*args):
+            threads.append(threading.current_thread().name)
+            return real_verify(*args)
+
+        real_verify = hashing.verify_password
+        with mock.patch.object(hashing, "verify_password", verify):
+            self.assertEqual(self.post_login("pat@example.com")["status"], "ok")
+        self.assertEqual(len(threads), 1)
+        self.assertTrue(threads[0].startswith("password-hashing"))
+
+    def test_pbkdf2_hash_is_upgraded_to_scrypt_on_login(self):
+        self.user.password = make_password("pw", hasher="pbkdf2_sha256")
+        self.user.save()
+        self.assertEqual(self.post_login("pat@example.com")["status"], "ok")
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith("scrypt$"))
+        self.client.logout()
+        self.assertEqual(self.post_login("pat@example.com")["status"], "ok")
+
+    def test_signup_hashes_with_scrypt_and_logs_in(self):
+        res = self.client.post(reverse("signup_user"), {"username": "sam", "email": "sam@example.com", "password": "pw"})
+        self.assertEqual(res.json()["status"], "ok")
+        sam = User.objects.get(username="sam")
+        self.assertTrue(sam.password.startswith("scrypt$"))
+        self.assertTrue(sam.check_password("pw"))
+        self.assertEqual(int(self.client.session["_auth_user_id"]), sam.pk)
+
+    def test_admin_login_still_uses_the_username(self):
+        User.objects.create_superuser("boss", "boss@example.com", "pw")
+        res = self.client.post(reverse("admin_login"), {"username": "boss", "password": "pw"})
+        self.assertRedirects(res, reverse("admin_dashboard"))
+
+    def test_emails_are_unique_ignoring_case(self):
+        res = self.client.post(reverse("signup_user"), {"username": "pat2", "email": "PAT@example.com", "password": "pw"})
+        self.assertEqual(res.json()["message"], "Email already registered.")
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            User.objects.create_user("pat3", "pat@EXAMPLE.com", "pw")
+        # accounts without an email don't collide
+        User.objects.create_user("nomail1")
+        User.objects.create_user("nomail2")
+
+    def test_lookup_runs_on_the_partial_unique_index(self):
+        sql, params = backends.EmailBackend()._lookup("PAT@example.com").query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+            plan = " ".join(row[-1] for row in cursor.fetchall())
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'auth_user'")
+            indexes = {row[0] for row in cursor.fetchall()}
+        self.assertIn("USING INDEX auth_user_email_lower_uniq", plan)
+        self.assertNotIn("auth_user_email_lower_idx", indexes)
+        self.assertEqual(backends.EmailBackend()._lookup("PAT@example.com").get(), self.user)
+
+
+@override_settings(THROTTLE_RATES={
+    "login": {"ip": (5, 60), "identifier": (2, 60)},
+    "booking": {"ip": (10, 60), "identifier": (3, 60)},
+})
+class ThrottleTests(TestCase):
+    def setUp(self):
+        caches[throttle.THROTTLE_CACHE].clear()
+        self.now = 1_000_000 * 60.0  # the start of a window
+        patcher = mock.patch.object(throttle.time, "time", lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def post_login(self, email, ip="10.0.0.1"):
+        return self.client.post(reverse("login_user"), {"username": email, "password": "pw"}, REMOTE_ADDR=ip)
+
+    def test_identifier_window_rejects_before_any_query(self):
+        for _ in range(2):
+            self.assertEqual(self.post_login("Pat@example.com").status_code, 200)
+        with self.assertNumQueries(0):
+            res = self.post_login("pat@example.com ")
+        self.assertEqual(res.status_code, 429)
+        self.assertEqual(res["Retry-After"], "60")
+        self.assertEqual(res.json()["status"], "error")
+        # another account from the same address is still let through
+        self.assertEqual(self.post_login("sam@example.com").status_code, 200)
+
+    def test_ip_window_spans_identifiers(self):
+        for i in range(5):
+            self.assertEqual(self.post_login(f"user{i}@example.com").status_code, 200)
+        self.assertEqual(self.post_login("user9@example.com").status_code, 429)
+        self.assertEqual(self.post_login("user9@example.com", ip="10.0.0.2").status_code, 200)
+
+    def test_clients_behind_the_proxy_get_their_own_windows(self):
+        def post_login(email, forwarded_for):
+            return self.client.post(
+                reverse("login_user"), {"username": email, "password": "pw"},
+                REMOTE_ADDR="10.9.9.9", HTTP_X_FORWARDED_FOR=forwarded_for,
+            )
+
+        for i in range(5):
+            self.assertEqual(post_login(f"user{i}@example.com", "203.0.113.5").status_code, 200)
+        self.assertEqual(post_login("user9@example.com", "203.0.113.5").status_code, 429)
+        # a spoofed leftmost entry doesn't change the address the proxy saw
+        self.assertEqual(post_login("user9@example.com", "198.51.100.1, 203.0.113.5").status_code, 429)
+        self.assertEqual(post_login("user9@example.com", "198.51.100.7").status_code, 200)
+
+    def test_client_ip_counts_trusted_hops_from_the_right(self):
+        request = RequestFactory().get("/", REMOTE_ADDR="10.9.9.9", HTTP_X_FORWARDED_FOR="1.1.1.1, 2.2.2.2, 3.3.3.3")
+        for hops, expected in ((0, "10.9.9.9"), (1, "3.3.3.3"), (2, "2.2.2.2"), (4, "10.9.9.9")):
+            with self.subTest(hops=hops), override_settings(TRUSTED_PROXIES=hops):
+                self.assertEqual(throttle.client_ip(request), expected)
+
+    def test_window_slides(self):
+        for _ in range(2):
+            self.post_login("pat@example.com")
+        # half-way into the next window the two earlier hits still count as one
+        self.now += 90
+        self.assertEqual(self.post_login("pat@example.com").status_code, 200)
+        self.assertEqual(self.post_login("pat@example.com").status_code, 429)
+        self.now += 60
+        self.assertEqual(self.post_login("pat@example.com").status_code, 200)
+
+    def test_bookings_are_throttled_by_email_and_counted(self):
+        before = throttle.counters()
+        for i in range(3):
+            self.assertEqual(_post_booking(self.client, time=f"{9 + i:02d}:00").status_code, 200)
+        self.assertEqual(_post_booking(self.client, time="14:00", email="PATIENT@example.com").status_code, 429)
+        self.assertEqual(Appointment.objects.count(), 3)
+        # GETs aren't counted
+        self.assertEqual(self.client.get(reverse("create_appointment")).status_code, 405)
+
+        after = throttle.counters()
+        self.assertEqual(after.get("booking.allowed", 0) - before.get("booking.allowed", 0), 3)
+        self.assertEqual(after.get("booking.throttled.identifier", 0) - before.get("booking.throttled.identifier", 0), 1)
+
+        self.client.force_login(User.objects.create_superuser("admin", "admin@example.com", "pw"))
+        stats = self.client.get(reverse("throttle_stats")).json()
+        self.assertEqual(stats["counters"]["booking.allowed"], after["booking.allowed"])
+        self.assertEqual(stats["rates"]["login"]["identifier"], [2, 60])
+
+
+class ActivityRecorderTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("pat", "pat@example.com", "pw")
+
+    def test_events_are_written_in_one_batch_with_their_own_timestamps(self):
+        recorder = activity.ActivityRecorder(background=False)
+        recorder.record(self.user, "login")
+        first_seen = timezone.now()
+        recorder.record(self.user, "logout")
+        self.assertFalse(UserActivity.objects.exists())
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(recorder.flush(), 2)
+        inserts = [q for q in ctx.captured_queries if q["sql"].startswith('INSERT INTO "home_useractivity" ')]
+        self.assertEqual(len(inserts), 1)
+        rows = list(UserActivity.objects.order_by("timestamp"))
+        self.assertEqual([r.action for r in rows], ["login", "logout"])
+        self.assertLessEqual(rows[0].timestamp, first_seen)
+
+    def test_login_and_logout_go_through_the_recorder(self):
+        recorder = activity.ActivityRecorder(background=False)
+        with mock.patch.object(activity, "recorder", recorder):
+            res = self.client.post(reverse("login_user"), {"username": "pat@example.com", "password": "pw"})
+            self.assertEqual(res.json()["status"], "ok")
+            self.client.get(reverse("logout"))
+        self.assertFalse(UserActivity.objects.exists())
+
+        recorder.flush()
+        self.assertEqual(list(UserActivity.objects.order_by("timestamp").values_list("action", flat=True)),
+                         ["login", "logout"])
+
+
+class UserActivitySummaryTests(TestCase):
+    def setUp(self):
+        self.pat = User.objects.create_user("pat", "pat@example.com", "pw")
+        self.sam = User.objects.create_user("sam", "sam@example.com", "pw")
+        self.recorder = activity.ActivityRecorder(background=False)
+
+    def test_flushes_keep_counts_and_latest_action(self):
+        for user, action in [(self.pat, "signup"), (self.pat, "login"), (self.sam, "login"), (self.pat, "logout")]:
+            self.recorder.record(user, action)
+        self.recorder.flush()
+        self.recorder.record(self.pat, "login")
+        self.recorder.flush()
+
+        pat = UserActivitySummary.objects.get(user=self.pat)
+        self.assertEqual((pat.login_count, pat.last_action), (2, "login"))
+        self.assertEqual(pat.last_login_at, UserActivity.objects.filter(user=self.pat).latest("timestamp").timestamp)
+        self.assertEqual(pat.signup_at, self.pat.date_joined)
+
+    def test_a_late_batch_does_not_roll_back_the_last_action(self):
+        late = activity.ActivityRecorder(background=False)
+        late.record(self.pat, "login")
+        self.recorder.record(self.pat, "logout")
+        self.recorder.flush()
+        late.flush()
+
+        pat = UserActivitySummary.objects.get(user=self.pat)
+        self.assertEqual((pat.login_count, pat.last_action), (1, "logout"))
+
+    def test_user_history_lists_users_by_recent_activity_without_touching_events(self):
+        self.recorder.record(self.sam, "login")
+        self.recorder.record(self.pat, "login")
+        self.recorder.flush()
+        admin = User.objects.create_superuser("admin", "admin@example.com", "pw")
+        self.client.force_login(admin)
+
+        with CaptureQueriesContext(connection) as ctx:
+            data = self.client.get(reverse("user_history"), {"limit": 1}).json()
+        self.assertFalse([q for q in ctx.captured_queries if "home_useractivity\"" in q["sql"]])
+        self.assertEqual([r["username"] for r in data["history"]], ["pat"])
+        self.assertEqual(data["history"][0]["login_count"], 1)
+
+        data = self.client.get(reverse("user_history"), {"cursor": data["next_cursor"]}).json()
+        self.assertEqual([r["username"] for r in data["history"]], ["sam"])
+        self.assertIsNone(data["next_cursor"])
+
+
+class ActivityRecorderThreadTests(TransactionTestCase):
+    def test_flushes_on_size_and_time_thresholds_and_on_close(self):
+        user = User.objects.create_user("pat", "pat@example.com", "pw")
+        by_size = activity.ActivityRecorder(flush_size=3, flush_interval=60)
+        by_time = activity.ActivityRecorder(flush_size=1000, flush_interval=0.1)
+        self.addCleanup(by_size.close)
+        self.addCleanup(by_time.close)
+
+        for _ in range(3):
+            by_size.record(user, "login")
+        by_time.record(user, "signup")
+        for action, expected in (("login", 3), ("signup", 1)):
+            with self.subTest(action=action):
+                for _ in range(100):
+                    if UserActivity.objects.filter(action=action).count() == expected:
+                        break
+                    threading.Event().wait(0.05)
+                self.assertEqual(UserActivity.objects.filter(action=action).count(), expected)
+
+        by_size.record(user, "logout")
+        by_size.close()
+        self.assertEqual(UserActivity.objects.filter(action="logout").count(), 1)
+
+
+class ActivityRecorderFailureTests(TransactionTestCase):
+    def setUp(self):
+        self.pat = User.objects.create_user("pat", "pat@example.com", "pw")
+        self.sam = User.objects.create_user("sam", "sam@example.com", "pw")
+        self.recorder = activity.ActivityRecorder(background=False)
+
+    def test_events_of_a_deleted_user_are_dropped_not_retried(self):
+        self.recorder.record(self.pat, "login")
+        self.recorder.record(self.sam, "login")
+        User.objects.filter(pk=self.pat.pk).delete()  # e.g. by an admin, in another request
+
+        with self.assertLogs("home.activity", "WARNING"):
+            self.assertEqual(self.recorder.flush(), 1)
+        self.recorder.record(self.sam, "logout")
+        self.assertEqual(self.recorder.flush(), 1)
+        self.assertEqual(list(UserActivity.objects.order_by("timestamp").values_list("action", flat=True)),
+                         ["login", "logout"])
+        self.assertEqual(self.recorder._pending, [])
+
+    def test_a_locked_database_keeps_the_events_for_the_next_flush(self):
+        self.recorder.record(self.pat, "login")
+        with mock.patch.object(UserActivity.objects, "bulk_create", side_effect=OperationalError("locked")), \
+                self.assertLogs("home.activity", "ERROR"):
+            self.assertEqual(self.recorder.flush(), 0)
+        self.assertEqual(self.recorder.flush(), 1)
+        self.assertTrue(UserActivity.objects.filter(user=self.pat).exists())
+
+
+class ActivityLogTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser("admin", "admin@example.com", "pw")
+        self.pat = User.objects.create_user("pat", "Pat@Example.com", "pw")
+        self.client.force_login(self.admin)
+        start = timezone.make_aware(datetime(2030, 1, 1, 9))
+        for i in range(7):
+            UserActivity.objects.create(
+                user=self.pat if i % 2 else self.admin,
+                action="login" if i < 5 else "logout",
+                timestamp=start + timedelta(days=i),
+            )
+
+    def get_log(self, **params):
+        return self.client.get(reverse("activity_log"), params).json()
+
+    def test_cursor_pages_cover_every_row_once(self):
+        seen, cursor = [], None
+        while True:
+            data = self.get_log(limit=3, **({"cursor": cursor} if cursor else {}))
+            seen += [r["id"] for r in data["activities"]]
+            cursor = data["next_cursor"]
+            if not cursor:
+                break
+        self.assertEqual(seen, list(UserActivity.objects.order_by("-timestamp", "-id").values_list("id", flat=True)))
+
+    def test_filters(self):
+        self.assertEqual(len(self.get_log(action="logout")["activities"]), 2)
+        self.assertEqual({r["username"] for r in self.get_log(email="pat@example.com")["activities"]}, {"pat"})
+        self.assertEqual(len(self.get_log(user="pat", action="login")["activities"]), 2)
+        window = self.get_log(date_from="2030-01-02", date_to="2030-01-03")["activities"]
+        self.assertEqual([r["timestamp"] for r in window], ["03-01-2030 09:00:00", "02-01-2030 09:00:00"])
+
+    def test_bad_parameters_are_rejected(self):
+        for params in ({"action": "delete"}, {"date_from": "yesterday"}, {"cursor": "nope"}):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(reverse("activity_log"), params).status_code, 400)
+
+
+class AdminUserDirectoryTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser("admin", "admin@example.com", "pw")
+        self.client.force_login(self.admin)
+        for name, email in (("alice", "Alice@Example.com"), ("alfred", "fred@example.com"), ("bob", "bob@example.com")):
+            User.objects.create_user(name, email, "pw")
+        alice = User.objects.get(username="alice")
+        activity.update_summaries([
+            UserActivity(user=alice, action="login", timestamp=timezone.make_aware(datetime(2030, 1, 1, 9))),
+            UserActivity(user=alice, action="login", timestamp=timezone.make_aware(datetime(2030, 1, 2, 9))),
+        ])
+
+    def get_users(self, **params):
+        res = self.client.get(reverse("admin_users"), params)
+        self.assertEqual(res.status_code, 200)
+        return res.context["users"], res.context["next_cursor"]
+
+    def test_prefix_search(self):
+        users, _ = self.get_users(q="al")
+        self.assertEqual([u["username"] for u in users], ["alfred", "alice"])
+        users, _ = self.get_users(by="email", q="ALICE@")
+        self.assertEqual([u["username"] for u in users], ["alice"])
+        users, _ = self.get_users(q="Al")
+        self.assertEqual(users, [])
+
+    def test_rows_carry_activity_from_one_query(self):
+        with self.assertNumQueries(3):  # session, request user, the page
+            users, _ = self.get_users(q="al")
+        alice = users[1]
+        self.assertEqual(alice["login_count"], 2)
+        self.assertEqual(alice["last_login_at"], timezone.make_aware(datetime(2030, 1, 2, 9)))
+        self.assertEqual(users[0]["login_count"], 0)
+        self.assertIsNone(users[0]["last_login_at"])
+
+    def test_cursor_pages_cover_every_user_once(self):
+        for by in ("username", "email"):
+            seen, cursor = [], None
+            with mock.patch.object(views, "USER_DIRECTORY_PAGE_SIZE", 2):
+                while True:
+                    users, cursor = self.get_users(by=by, **({"cursor": cursor} if cursor else {}))
+                    seen += [u["id"] for u in users]
+                    if not cursor:
+                        break
+            expected = User.objects.order_by(Lower("email") if by == "email" else "username", "id")
+            self.assertEqual(seen, list(expected.values_list("id", flat=True)), by)
+
+    def test_bad_parameters_are_rejected(self):
+        for params in ({"by": "password"}, {"cursor": "nope"}):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(reverse("admin_users"), params).status_code, 400)
+
+
+class ActivityArchiveTests(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.archive_dir = Path(tmp.name)
+        override = self.settings(ACTIVITY_ARCHIVE_DIR=self.archive_dir)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.pat = User.objects.create_user("pat", "pat@example.com", "pw")
+        self.sam = User.objects.create_user("sam", "sam@example.com", "pw")
+        now = timezone.now()
+        for user, action, days_ago in [
+            (self.pat, "login", 800), (self.sam, "login", 790), (self.pat, "logout", 420),
+            (self.sam, "login", 10),
+        ]:
+            UserActivity.objects.create(user=user, action=action, timestamp=now - timedelta(days=days_ago))
+        self.months = sorted({f"{now - timedelta(days=d):%Y-%m}" for d in (800, 790, 420)})
+
+    def test_moves_old_rows_into_monthly_archives_in_chunks(self):
+        out = StringIO()
+        call_command("archive_activity", "--days=365", "--chunk-size=2", "--pause=0", stdout=out)
+
+        self.assertIn("Archived 3 activity rows", out.getvalue())
+        self.assertEqual(UserActivity.objects.count(), 1)
+        self.assertEqual(archive.archived_months(), self.months)
+        records = [r for m in self.months for r in archive.read_archived_activity(m)]
+        self.assertEqual([(r["username"], r["action"]) for r in records],
+                         [("pat", "login"), ("sam", "login"), ("pat", "logout")])
+
+    def test_reader_filters_and_skips_chunks_archived_twice(self):
+        call_command("archive_activity", "--days=365", "--pause=0", stdout=StringIO())
+        month = archive.archived_months()[-1]
+        first = list(archive.read_archived_activity(month))
+        archive.append_records(month, first)  # as if a run died before deleting
+
+        self.assertEqual(list(archive.read_archived_activity(month)), first)
+        self.assertEqual(list(archive.read_archived_activity(month, user="SAM@example.com", action="logout")), [])
+
+    def test_archive_endpoint_lists_months_and_streams_records(self):
+        call_command("archive_activity", "--days=365", "--pause=0", stdout=StringIO())
+        self.client.force_login(User.objects.create_superuser("admin", "admin@example.com", "pw"))
+        url = reverse("activity_archive")
+
+        self.assertEqual(self.client.get(url).json()["months"], self.months)
+        res = self.client.get(url, {"month": self.months[0], "user": "pat"})
+        lines = b"".join(res.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(x)["action"] for x in lines], ["login"])
+        self.assertEqual(self.client.get(url, {"month": "1999-01"}).status_code, 404)
+
+
+class CreateAppointmentContentionTests(TransactionTestCase):
+    CONTENDERS = 200
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def contend(self, overrides):
+        barrier = threading.Barrier(len(overrides))
+        statuses = []
+        lock = threading.Lock()
+
+        def book(fields):
+            client = Client()
+            barrier.wait()
+            try:
+                res = _post_booking(client, **fields)
+                with lock:
+                    statuses.append(res.status_code)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=book, args=(fields,)) for fields in overrides]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(len(statuses), len(overrides))
+        return statuses
+
+    def test_exactly_one_concurrent_booking_wins(self):
+        statuses = self.contend([{"first_name": f"Patient{i}"} for i in range(self.CONTENDERS)])
+        self.assertEqual(statuses.count(200), 1)
+        self.assertEqual(statuses.count(409), self.CONTENDERS - 1)
+        self.assertEqual(Appointment.objects.count(), 1)
+
+    def test_service_limit_holds_for_concurrent_bookings(self):
+        ServiceCapacity.objects.create(service="MMR Vaccine", daily_limit=3)
+        statuses = self.contend([
+            {"service": "MMR Vaccine", "time": f"{9 + i // 12:02d}:{i % 12 * 5:02d}"} for i in range(24)
+        ])
+        self.assertEqual(statuses.count(200), 3)
+        self.assertEqual(statuses.count(409), 21)
+        self.assertEqual(Appointment.objects.count(), 3)
+        self.assertEqual(ServiceDailyCount.objects.get(service="MMR Vaccine").booked, 3)
@@ -0,0 +1,159 @@
+import hashlib
+import json
+import math
+import threading
+import time
+from collections import Counter
+from functools import wraps
+from inspect import iscoroutinefunction
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import JsonResponse
+
+
+# the cache alias holding the windows, separate from "default" so a flood
+# of throttle keys can't evict the booking caches
+THROTTLE_CACHE = "throttle"
+
+# per-process totals of allowed and throttled requests, by scope
+_counters = Counter()
+_counters_lock = threading.Lock()
+
+
+def _count(name):
+    with _counters_lock:
+        _counters[name] += 1
+
+
+def counters():
+    """A snapshot of this process's throttle counters."""
+    with _counters_lock:
+        return dict(_counters)
+
+
+def post_field(name):
+    """Identifier from a form field, e.g. the email login_user receives."""
+    return lambda request: request.POST.get(name)
+
+
+def json_field(name):
+    """Identifier from a field of a JSON body, e.g. a booking's email."""
+    def identify(request):
+        try:
+            return json.loads(request.body).get(name)
+        except (ValueError, AttributeError):
+            return None
+    return identify
+
+
+def client_ip(request):
+    """
+    The client's address. Behind settings.TRUSTED_PROXIES proxies,
+    REMOTE_ADDR is the nearest proxy, and the client is the entry that many
+    places from the right of X-Forwarded-For: entries further left were
+    sent by the client and can say anything.
+    """
+    hops = getattr(settings, "TRUSTED_PROXIES", 0)
+    if hops:
+        forwarded = [a.strip() for a in request.META.get("HTTP_X_FORWARDED_FOR", "").split(",") if a.strip()]
+        if len(forwarded) >= hops:
+            return forwarded[-hops]
+    return request.META.get("REMOTE_ADDR", "")
+
+
+def _window_counts(cache, key, limit, period, now):
+    """
+    Sliding-window estimate for key: this window's count plus the previous
+    window's count weighted by how much of it still overlaps the last
+    `period` seconds. Returns (over_limit, cache_key, retry_after).
+    """
+    window = int(now // period)
+    current, previous = f"{key}:{window}", f"{key}:{window - 1}"
+    counts = cache.get_many([current, previous])
+    overlap = 1 - (now % period) / period
+    estimate = counts.get(previous, 0) * overlap + counts.get(current, 0)
+    retry_after = math.ceil(period - now % period)
+    return estimate >= limit, current, retry_after
+
+
+def _hit(cache, key, period):
+    # add() only sets a missing key, so concurrent first hits don't reset it
+    cache.add(key, 0, 2 * period)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # evicted between add and incr
+        cache.set(key, 1, 2 * period)
+
+
+def _rejection(retry_after):
+    res = JsonResponse(
+        {"status": "error", "message": "Too many requests. Please wait a moment and try again."},
+        status=429,
+    )
+    res["Retry-After"] = str(retry_after)
+    return res
+
+
+def check(request, scope, identifier=None):
+    """
+    Count a request against scope's per-IP and per-identifier windows from
+    settings.THROTTLE_RATES. Returns None to let it through, or a 429
+    response when either window is full. A full window isn't incremented,
+    so a rejection costs two cache reads and no writes.
+    """
+    rates = getattr(settings, "THROTTLE_RATES", {}).get(scope)
+    if not rates:
+        return None
+    cache = caches[THROTTLE_CACHE]
+    now = time.time()
+
+    keys = []
+    if rates.get("ip"):
+        keys.append(("ip", client_ip(request), rates["ip"]))
+    if rates.get("identifier") and identifier is not None:
+        value = identifier(request)
+        if value:
+            digest = hashlib.md5(str(value).strip().lower().encode()).hexdigest()
+            keys.append(("identifier", digest, rates["identifier"]))
+
+    hits = []
+    for kind, value, (limit, period) in keys:
+        over, key, retry_after = _window_counts(cache, f"throttle:{scope}:{kind}:{value}", limit, period, now)
+        if over:
+            _count(f"{scope}.throttled.{kind}")
+            return _rejection(retry_after)
+        hits.append((key, period))
+    for key, period in hits:
+        _hit(cache, key, period)
+    _count(f"{scope}.allowed")
+    return None
+
+
+def throttle(scope, identifier=None, methods=("POST",)):
+    """
+    Decorator applying check() to a view, sync or async, before any of the
+    view's own work. Only requests with one of `methods` are counted.
+
+    The cache calls are made directly even from async views: the throttle
+    cache is local memory (or local files), and a thread hop per request
+    would cost more than the lookup itself.
+    """
+    def decorator(view):
+        if iscoroutinefunction(view):
+            async def wrapper(request, *args, **kwargs):
+                if request.method in methods:
+                    rejected = check(request, scope, identifier)
+                    if rejected:
+                        return rejected
+                return await view(request, *args, **kwargs)
+        else:
+            def wrapper(request, *args, **kwargs):
+                if request.method in methods:
+                    rejected = check(request, scope, identifier)
+                    if rejected:
+                        return rejected
+                return view(request, *args, **kwargs)
+        return wraps(view)(wrapper)
+    return decorator
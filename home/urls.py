@@ -19,15 +19,25 @@ urlpatterns = [
     # ================= APPOINTMENTS =================
     path("appointments/create/", views.create_appointment, name="create_appointment"),
     path("appointments/booked/", views.booked_slots, name="booked_slots"),
+    path("appointments/booked/range/", views.booked_slots_range, name="booked_slots_range"),
+    path("appointments/events/", views.slot_events, name="slot_events"),
+    path("appointments/availability/", views.availability, name="availability"),
+    path("appointments/next-available/", views.next_available, name="next_available"),
 
     # ================= ADMIN =================
     path("admin-login/", views.admin_login, name="admin_login"),
     path("admin-dashboard/", views.admin_dashboard, name="admin_dashboard"),
     path("admin-dashboard/appointments/", views.admin_appointments, name="admin_appointments"),
+    path("admin-dashboard/appointments/export/", views.export_appointments, name="export_appointments"),
+    path("admin-dashboard/users/", views.admin_users, name="admin_users"),
     path("admin-dashboard/user-history/", views.user_history, name="user_history"),
     path("admin-dashboard/activity-log/", views.activity_log, name="activity_log"),
+    path("admin-dashboard/activity-archive/", views.activity_archive, name="activity_archive"),
+    path("admin-dashboard/throttle-stats/", views.throttle_stats, name="throttle_stats"),
     path("admin-dashboard/reports/", views.admin_reports, name="admin_reports"),
     path("admin-dashboard/reports/data/", views.admin_reports_data, name="admin_reports_data"),
+    path("admin-dashboard/reports/export/", views.admin_reports_export, name="admin_reports_export"),
+    path("admin-dashboard/reports/heatmap/", views.admin_reports_heatmap, name="admin_reports_heatmap"),
 
     # ================= SERVICES =================
     path("pharmacy-first/", views.pharmacy_first, name="pharmacy_first"),
@@ -1,17 +1,40 @@
+import asyncio
+import base64
+import hashlib
 import json
-from datetime import datetime, timedelta, time
+from datetime import datetime, timedelta
+from itertools import islice
 
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.shortcuts import render, get_object_or_404, redirect
-from django.contrib.auth import authenticate, login, logout
+from django.contrib.auth import aauthenticate, alogin, authenticate, login, logout
 from django.contrib.auth.models import User
-from django.http import JsonResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.contrib import messages
+from django.core.exceptions import ValidationError
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_GET
-from django.db.models import Count
-
-from .models import Branch, UserActivity, Appointment
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q, Value
+from django.db.models.functions import Lower
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils import timezone
+from django.utils.http import http_date, quote_etag
+
+from .models import Branch, UserActivity, UserActivitySummary, Appointment
+from .exports import (
+    EXPORT_FORMATS, REPORT_EXPORT_FORMATS, XLSX_CONTENT_TYPE,
+    appointment_row, stream_appointments, stream_csv_rows, stream_xlsx_rows,
+)
+from . import archive, events, reports, schedule
+from .activity import record_activity
+from .backends import with_email_lower
+from .hashing import amake_password
+from .throttle import client_ip, counters as throttle_counters, json_field, post_field, throttle
+from .slots import abooked_times, ainvalidate_booked_times, booked_times_range
 
 
 # =========================
@@ -21,10 +44,53 @@ def is_superuser(user):
     return user.is_authenticated and user.is_superuser
 
 
+# chunks pulled from a sync stream per thread hop under ASGI
+STREAM_HOP_CHUNKS = 200
+
+
+async def _pull(chunks):
+    chunks = iter(chunks)
+    take = sync_to_async(lambda: list(islice(chunks, STREAM_HOP_CHUNKS)))
+    try:
+        while batch := await take():
+            for chunk in batch:
+                yield chunk
+    finally:
+        close = getattr(chunks, "close", None)
+        if close is not None:
+            await sync_to_async(close)()
+
+
+def _streaming_response(request, chunks, **kwargs):
+    """
+    StreamingHttpResponse over a sync generator that stays lazy under ASGI.
+
+    Given a sync iterator, an ASGI response reads it into a list before
+    sending a byte; this pulls it STREAM_HOP_CHUNKS at a time instead, on
+    the sync thread the generator's ORM cursor belongs to.
+    """
+    if isinstance(request, ASGIRequest):
+        chunks = _pull(chunks)
+    return StreamingHttpResponse(chunks, **kwargs)
+
+
 # =========================
 # ✅ AUTH
 # =========================
-def signup_user(request):
+# signup and login are async so the password hash runs on home.hashing's
+# pool; under ASGI, sync views all share one thread and would queue behind it.
+EMAIL_BACKEND = "home.backends.EmailBackend"
+
+
+@sync_to_async
+def _create_account(**fields):
+    # one INSERT in its own savepoint, as _claim_slot does for bookings
+    with transaction.atomic():
+        return User.objects.create(**fields)
+
+
+@throttle("signup", identifier=post_field("email"))
+async def signup_user(request):
     if request.method == "POST":
         username = request.POST.get("username")
         email = request.POST.get("email")
@@ -33,24 +99,34 @@ def signup_user(request):
         if not username or not email or not password:
             return JsonResponse({"status": "error", "message": "All fields are required."})
 
-        if User.objects.filter(username=username).exists():
-            return JsonResponse({"status": "error", "message": "Username already exists."})
-
-        if User.objects.filter(email=email).exists():
+        # The INSERT is the check: the unique username and LOWER(email)
+        # indexes reject a taken account, so two signups can't race past an
+        # exists() query. Which one failed is only looked up on that path.
+        # The hash runs on the pool first, so a taken email costs as long as
+        # a new one.
+        username = User.normalize_username(username)
+        try:
+            user = await _create_account(
+                username=username,
+                email=User.objects.normalize_email(email),
+                password=await amake_password(password),
+            )
+        except IntegrityError:
+            if await User.objects.filter(username=username).aexists():
+                return JsonResponse({"status": "error", "message": "Username already exists."})
             return JsonResponse({"status": "error", "message": "Email already registered."})
 
-        user = User.objects.create_user(username=username, email=email, password=password)
-        user.save()
-        login(request, user)
+        await alogin(request, user, backend=EMAIL_BACKEND)
 
-        UserActivity.objects.create(user=user, action="signup")
+        record_activity(user, "signup")
         messages.success(request, "Account created successfully! 🎉")
         return JsonResponse({"status": "ok", "message": "Account created successfully!"})
 
     return JsonResponse({"status": "error", "message": "Invalid request."})
 
 
-def login_user(request):
+@throttle("login", identifier=post_field("username"))
+async def login_user(request):
     if request.method == "POST":
         email = request.POST.get("username")  # frontend field is "username", but contains email
         password = request.POST.get("password")
@@ -58,17 +134,11 @@ def login_user(request):
         if not email or not password:
             return JsonResponse({"status": "error", "message": "Email and password required."})
 
-        try:
-            user_obj = User.objects.get(email=email)
-            username = user_obj.username
-        except User.DoesNotExist:
-            return JsonResponse({"status": "error", "message": "Invalid email or password."})
-
-        user = authenticate(request, username=username, password=password)
+        user = await aauthenticate(request, email=email, password=password)
 
         if user is not None:
-            login(request, user)
-            UserActivity.objects.create(user=user, action="login")
+            await alogin(request, user)
+            record_activity(user, "login")
             messages.success(request, f"Welcome back, {user.username}! 👋")
             return JsonResponse({"status": "ok", "message": "Login successful!"})
         else:
@@ -79,7 +149,7 @@ def login_user(request):
 
 def logout_user(request):
     if request.user.is_authenticated:
-        UserActivity.objects.create(user=request.user, action="logout")
+        record_activity(request.user, "logout")
     logout(request)
     messages.info(request, "You’ve been logged out successfully.")
     return redirect("index")
@@ -141,11 +211,85 @@ def admin_login(request):
 @login_required(login_url='admin_login')
 @user_passes_test(lambda u: u.is_superuser, login_url='admin_login')
 def admin_dashboard(request):
-    users = User.objects.all().order_by('-date_joined')
-    activities = UserActivity.objects.select_related('user').order_by('-timestamp')[:50]
     return render(request, "home/admin_dashboard.html", {
+        'calendar_hours': schedule.calendar_hours(),
+    })
+
+
+USER_DIRECTORY_PAGE_SIZE = 50
+
+# sorts after any string a prefix can start, so [q, q + this) is "starts with q"
+_PREFIX_END = "\U0010ffff"
+
+
+def _user_directory_page(request):
+    """
+    One page of users for the admin directory, searched by username prefix
+    (case-sensitive, like usernames) or email prefix (case-insensitive) and
+    ordered by the searched column, so both the search and the keyset
+    cursor run on an index: auth_user's username index or
+    auth_user_email_lower_uniq, which leaves out accounts without an email.
+    Each row carries its login count, last login and last activity from the
+    per-user summary, joined in the same query.
+    Returns (rows, next_cursor, None) or (None, None, error_response).
+    """
+    by = request.GET.get("by", "username")
+    if by not in ("username", "email"):
+        return None, None, HttpResponse("Unknown search field", status=400)
+    key = "username" if by == "username" else "email_lower"
+
+    qs = User.objects.all()
+    if by == "email":
+        qs = with_email_lower(qs)
+
+    q = request.GET.get("q", "").strip()
+    if q:
+        low, high = q, q + _PREFIX_END
+        if by == "email":
+            # lowered by SQLite, exactly as the index is
+            low, high = Lower(Value(low)), Lower(Value(high))
+        # a range rather than startswith, whose LIKE can't use the index
+        qs = qs.filter(**{f"{key}__gte": low, f"{key}__lt": high})
+
+    cursor = request.GET.get("cursor")
+    if cursor:
+        try:
+            after, pk = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            pk = int(pk)
+        except (ValueError, TypeError, UnicodeDecodeError):
+            return None, None, HttpResponse("Invalid cursor", status=400)
+        qs = qs.filter(Q(**{f"{key}__gt": after}) | Q(**{key: after, "id__gt": pk}))
+
+    page = list(
+        qs.order_by(key, "id").values(
+            "id", "username", "email", "date_joined", key,
+            login_count=F("activity_summary__login_count"),
+            last_login_at=F("activity_summary__last_login_at"),
+            last_action_at=F("activity_summary__last_action_at"),
+        )[:USER_DIRECTORY_PAGE_SIZE + 1]
+    )
+    next_cursor = None
+    if len(page) > USER_DIRECTORY_PAGE_SIZE:
+        page = page[:USER_DIRECTORY_PAGE_SIZE]
+        last = page[-1]
+        next_cursor = base64.urlsafe_b64encode(json.dumps([last[key], last["id"]]).encode()).decode()
+    for row in page:
+        row["login_count"] = row["login_count"] or 0
+    return page, next_cursor, None
+
+
+@login_required(login_url='admin_login')
+@user_passes_test(is_superuser, login_url='admin_login')
+def admin_users(request):
+    users, next_cursor, error = _user_directory_page(request)
+    if error:
+        return error
+    return render(request, "home/partials/admin_users.html", {
         'users': users,
-        'activities': activities,
+        'next_cursor': next_cursor,
+        'q': request.GET.get("q", "").strip(),
+        'by': request.GET.get("by", "username"),
+        'page_size': USER_DIRECTORY_PAGE_SIZE,
     })
 
 
@@ -155,99 +299,298 @@ def admin_reports(request):
     return render(request, "home/partials/admin_reports.html")
 
 
-def _generate_daily_slots(start_t=time(9, 0), end_t=time(15, 0), step_minutes=60):
-    slots = []
-    cur = datetime.combine(datetime.today().date(), start_t)
-    end = datetime.combine(datetime.today().date(), end_t)
-    while cur <= end:
-        slots.append(cur.time().strftime("%H:%M"))
-        cur += timedelta(minutes=step_minutes)
-    return slots
+@login_required(login_url='admin_login')
+@user_passes_test(is_superuser, login_url='admin_login')
+def admin_reports_data(request):
+    window, error = _parse_report_series_window(request)
+    if error:
+        return error
+    start_date, end_date, bucket = window
+
+    series = reports.report_series(start_date, end_date, bucket)
+
+    return JsonResponse({
+        "status": "ok",
+        "labels": series["labels"],
+        "booked": series["booked"],
+        "open": series["open"],
+        "bucket": bucket,
+        "start": start_date.isoformat(),
+        "end": end_date.isoformat(),
+        "days": (end_date - start_date).days + 1,
+        "total_slots_per_day": schedule.slots_per_day()
+    })
+
+
+def _parse_report_series_window(request):
+    """
+    Read the chart window for the report series: either start/end or the
+    next `days` days (clamped), plus bucket=day|week|month.
+    Returns ((start, end, bucket), None) or (None, error_response).
+    """
+    bucket = request.GET.get("bucket", "day")
+    if bucket not in reports.REPORT_BUCKETS:
+        return None, JsonResponse(
+            {"status": "error", "message": f"bucket must be one of {', '.join(reports.REPORT_BUCKETS)}"},
+            status=400
+        )
+    max_days = reports.REPORT_MAX_DAYS if bucket == "day" else reports.REPORT_HISTORY_MAX_DAYS
+
+    if request.GET.get("start") or request.GET.get("end"):
+        window, error = _parse_report_window(request, default_days=30, max_days=max_days)
+        if error:
+            return None, error
+        return (*window, bucket), None
+
+    try:
+        days = int(request.GET.get("days", 30))
+    except ValueError:
+        return None, JsonResponse({"status": "error", "message": "days must be a whole number"}, status=400)
+    days = min(max(days, 1), max_days)
+    start = datetime.today().date()
+    return (start, start + timedelta(days=days - 1), bucket), None
 
 
 @login_required(login_url='admin_login')
 @user_passes_test(is_superuser, login_url='admin_login')
-def admin_reports_data(request):
-    days = int(request.GET.get("days", 30))
-    today = datetime.today().date()
+def admin_reports_export(request):
+    fmt = request.GET.get("format", "csv")
+    if fmt not in REPORT_EXPORT_FORMATS:
+        return JsonResponse({"status": "error", "message": "format must be csv or xlsx"}, status=400)
+    window, error = _parse_report_series_window(request)
+    if error:
+        return error
+    start, end, bucket = window
+
+    rows = reports.report_rows(start, end, bucket)
+    filename = f"bookings_{start}_{end}_{bucket}.{fmt}"
+    if fmt == "csv":
+        response = _streaming_response(request, stream_csv_rows(rows), content_type="text/csv")
+    else:
+        response = _streaming_response(
+            request, stream_xlsx_rows(rows, sheet_name="Bookings"), content_type=XLSX_CONTENT_TYPE
+        )
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
 
-    start_date = today
-    end_date = today + timedelta(days=days - 1)
 
-    qs = (
-        Appointment.objects
-        .filter(date__range=[start_date, end_date])
-        .values("date")
-        .annotate(booked=Count("id"))
-        .order_by("date")
-    )
+def _parse_report_window(request, default_days, max_days=reports.REPORT_HISTORY_MAX_DAYS):
+    """
+    Read start/end (YYYY-MM-DD) for the aggregate reports; the default is
+    the default_days up to and including today.
+    Returns ((start, end), None) or (None, error_response).
+    """
+    today = datetime.today().date()
+    try:
+        start = datetime.strptime(request.GET["start"], "%Y-%m-%d").date() if request.GET.get("start") else None
+        end = datetime.strptime(request.GET["end"], "%Y-%m-%d").date() if request.GET.get("end") else today
+    except ValueError:
+        return None, JsonResponse({"status": "error", "message": "Invalid start or end (YYYY-MM-DD)"}, status=400)
+    if start is None:
+        start = end - timedelta(days=default_days - 1)
+
+    if end < start:
+        return None, JsonResponse({"status": "error", "message": "end must not be before start"}, status=400)
+    if (end - start).days + 1 > max_days:
+        return None, JsonResponse(
+            {"status": "error", "message": f"Range is limited to {max_days} days"},
+            status=400
+        )
+    return (start, end), None
 
-    booked_map = {x["date"]: int(x["booked"]) for x in qs}
-    total_slots = len(_generate_daily_slots())
 
-    labels, booked_series, open_series = [], [], []
-    d = start_date
-    while d <= end_date:
-        labels.append(d.strftime("%d-%m-%Y"))
-        booked_count = int(booked_map.get(d, 0))
-        booked_series.append(booked_count)
-        open_series.append(max(total_slots - booked_count, 0))
-        d += timedelta(days=1)
+@login_required(login_url='admin_login')
+@user_passes_test(is_superuser, login_url='admin_login')
+def admin_reports_heatmap(request):
+    window, error = _parse_report_window(request, default_days=90)
+    if error:
+        return error
+    start, end = window
 
     return JsonResponse({
         "status": "ok",
-        "labels": labels,
-        "booked": booked_series,
-        "open": open_series,
-        "total_slots_per_day": total_slots
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "heatmap": reports.booking_heatmap(start, end),
+        "lead_time_days": reports.lead_times(start, end),
     })
 
 
-@login_required(login_url='admin_login')
-@user_passes_test(is_superuser, login_url='admin_login')
-def user_history(request):
-    activities = UserActivity.objects.filter(action="login").select_related("user").order_by("-timestamp")[:200]
-    data = [{
+ACTIVITY_LOG_DEFAULT_LIMIT = 200
+ACTIVITY_LOG_MAX_LIMIT = 500
+
+
+def _activity_page(request):
+    """
+    One page of activity, newest first, filtered by action, user (username),
+    email and date_from/date_to (YYYY-MM-DD), and paged by a keyset cursor
+    on (timestamp, id).
+    Returns (rows, next_cursor, None) or (None, None, error_response).
+    """
+    qs = UserActivity.objects.all()
+
+    action = request.GET.get("action")
+    if action:
+        if action not in dict(UserActivity.ACTION_CHOICES):
+            return None, None, JsonResponse({"status": "error", "message": "Unknown action"}, status=400)
+        qs = qs.filter(action=action)
+
+    username = request.GET.get("user", "").strip()
+    email = request.GET.get("email", "").strip()
+    if username or email:
+        # resolve the account first so the activity query stays on the
+        # (user, timestamp) index instead of joining auth_user
+        users = User.objects.all()
+        if username:
+            users = users.filter(username=username)
+        if email:
+            # LOWER(email) = LOWER(...) rather than iexact's LIKE, so the
+            # lookup can use auth_user_email_lower_uniq
+            users = with_email_lower(users).filter(email_lower=Lower(Value(email)))
+        qs = qs.filter(user_id__in=list(users.values_list("id", flat=True)))
+
+    try:
+        if request.GET.get("date_from"):
+            d = datetime.strptime(request.GET["date_from"], "%Y-%m-%d")
+            qs = qs.filter(timestamp__gte=timezone.make_aware(d))
+        if request.GET.get("date_to"):
+            d = datetime.strptime(request.GET["date_to"], "%Y-%m-%d") + timedelta(days=1)
+            qs = qs.filter(timestamp__lt=timezone.make_aware(d))
+    except ValueError:
+        return None, None, JsonResponse(
+            {"status": "error", "message": "Invalid date_from or date_to (YYYY-MM-DD)"}, status=400
+        )
+
+    cursor = request.GET.get("cursor")
+    if cursor:
+        try:
+            ts, pk = _decode_cursor(cursor)
+        except (ValueError, UnicodeDecodeError):
+            return None, None, JsonResponse({"status": "error", "message": "Invalid cursor"}, status=400)
+        qs = qs.filter(Q(timestamp__lt=ts) | Q(timestamp=ts, id__lt=pk))
+
+    try:
+        limit = min(max(int(request.GET.get("limit", ACTIVITY_LOG_DEFAULT_LIMIT)), 1), ACTIVITY_LOG_MAX_LIMIT)
+    except ValueError:
+        limit = ACTIVITY_LOG_DEFAULT_LIMIT
+
+    page = list(qs.select_related("user").order_by("-timestamp", "-id")[:limit + 1])
+    next_cursor = None
+    if len(page) > limit:
+        page = page[:limit]
+        next_cursor = _encode_cursor(page[-1].timestamp, page[-1].id)
+
+    rows = [{
+        "id": act.id,
         "username": act.user.username,
         "email": act.user.email,
+        "action": act.action,
         "timestamp": act.timestamp.strftime("%d-%m-%Y %H:%M:%S"),
-    } for act in activities]
-    return JsonResponse({"status": "ok", "history": data})
+    } for act in page]
+    return rows, next_cursor, None
+
+
+USER_HISTORY_MAX_LIMIT = 500
 
 
 @login_required(login_url='admin_login')
 @user_passes_test(is_superuser, login_url='admin_login')
-def activity_log(request):
-    activities = UserActivity.objects.select_related('user').order_by('-timestamp')[:200]
+def user_history(request):
+    """
+    Users by most recent activity, from the per-user summary table: one
+    indexed query, paged by a keyset cursor on (last_action_at, user id).
+    """
+    qs = UserActivitySummary.objects.select_related("user")
+
+    cursor = request.GET.get("cursor")
+    if cursor:
+        try:
+            ts, pk = _decode_cursor(cursor)
+        except (ValueError, UnicodeDecodeError):
+            return JsonResponse({"status": "error", "message": "Invalid cursor"}, status=400)
+        qs = qs.filter(Q(last_action_at__lt=ts) | Q(last_action_at=ts, user_id__lt=pk))
+
+    try:
+        limit = min(max(int(request.GET.get("limit", ACTIVITY_LOG_DEFAULT_LIMIT)), 1), USER_HISTORY_MAX_LIMIT)
+    except ValueError:
+        limit = ACTIVITY_LOG_DEFAULT_LIMIT
+
+    page = list(qs.order_by("-last_action_at", "-user_id")[:limit + 1])
+    next_cursor = None
+    if len(page) > limit:
+        page = page[:limit]
+        next_cursor = _encode_cursor(page[-1].last_action_at, page[-1].user_id)
+
+    fmt = "%d-%m-%Y %H:%M:%S"
     data = [{
-        "username": act.user.username,
-        "email": act.user.email,
-        "action": act.action,
-        "timestamp": act.timestamp.strftime("%d-%m-%Y %H:%M:%S"),
-    } for act in activities]
-    return JsonResponse({"status": "ok", "activities": data})
-
-
-@login_required(login_url='login')
-@user_passes_test(is_superuser, login_url='login')
-def dashboard(request):
-    filter_action = request.GET.get("action")
-    users = User.objects.all().order_by('-date_joined')
-    activities = UserActivity.objects.select_related('user').order_by('-timestamp')
-    if filter_action in ["login", "signup", "logout"]:
-        activities = activities.filter(action=filter_action)
-    return render(request, 'home/dashboard.html', {
-        'users': users,
-        'activities': activities[:50],
-        'filter_action': filter_action,
+        "username": s.user.username,
+        "email": s.user.email,
+        "timestamp": s.last_login_at.strftime(fmt) if s.last_login_at else None,
+        "login_count": s.login_count,
+        "last_action": s.last_action,
+        "last_action_at": s.last_action_at.strftime(fmt),
+        "signup_at": s.signup_at.strftime(fmt),
+    } for s in page]
+    return JsonResponse({"status": "ok", "history": data, "next_cursor": next_cursor})
+
+
+@login_required(login_url='admin_login')
+@user_passes_test(is_superuser, login_url='admin_login')
+def throttle_stats(request):
+    """This worker's allowed/throttled counts per scope, and the configured rates."""
+    return JsonResponse({
+        "status": "ok",
+        "counters": throttle_counters(),
+        "rates": {scope: {k: list(v) for k, v in r.items()} for scope, r in settings.THROTTLE_RATES.items()},
     })
 
 
+@login_required(login_url='admin_login')
+@user_passes_test(is_superuser, login_url='admin_login')
+def activity_log(request):
+    rows, next_cursor, error = _activity_page(request)
+    if error:
+        return error
+    return JsonResponse({"status": "ok", "activities": rows, "next_cursor": next_cursor})
+
+
+@login_required(login_url='admin_login')
+@user_passes_test(is_superuser, login_url='admin_login')
+def activity_archive(request):
+    """
+    Archived activity for auditors. Without month: the archived months.
+    With month=YYYY-MM (and optionally action, user): that month's records
+    as NDJSON, streamed straight from the archive file.
+    """
+    month = request.GET.get("month")
+    if not month:
+        return JsonResponse({"status": "ok", "months": archive.archived_months()})
+
+    try:
+        datetime.strptime(month, "%Y-%m")
+    except ValueError:
+        return JsonResponse({"status": "error", "message": "Invalid month (YYYY-MM)"}, status=400)
+    if month not in archive.archived_months():
+        return JsonResponse({"status": "error", "message": f"No archive for {month}"}, status=404)
+
+    records = archive.read_archived_activity(
+        month, action=request.GET.get("action") or None, user=request.GET.get("user") or None
+    )
+    response = _streaming_response(
+        request, (json.dumps(r) + "\n" for r in records), content_type="application/x-ndjson"
+    )
+    response["Content-Disposition"] = f'attachment; filename="activity-{month}.jsonl"'
+    return response
+
+
 # =========================
 # ✅ APPOINTMENTS
 # =========================
+# The two booking endpoints are async views: under an ASGI server they await
+# the cache and the async ORM instead of holding a worker thread, and under
+# WSGI Django still runs them, one event loop per request.
 @require_GET
-def booked_slots(request):
+async def booked_slots(request):
     date_str = request.GET.get("date")
     if not date_str:
         return JsonResponse({"status": "error", "message": "date is required"}, status=400)
@@ -257,12 +600,207 @@ def booked_slots(request):
     except ValueError:
         return JsonResponse({"status": "error", "message": "Invalid date format (YYYY-MM-DD)"}, status=400)
 
-    times = list(Appointment.objects.filter(date=d).values_list("time", flat=True))
-    return JsonResponse({"status": "ok", "times": times})
+    entry = await abooked_times(d)
+    etag = quote_etag(entry["etag"])
+    last_modified = entry["last_modified"]
+
+    not_modified = get_conditional_response(
+        request,
+        etag=etag,
+        last_modified=int(last_modified.timestamp()) if last_modified else None,
+    )
+    if not_modified is not None:
+        return not_modified
+
+    response = JsonResponse({"status": "ok", "times": entry["times"]})
+    response["ETag"] = etag
+    if last_modified:
+        response["Last-Modified"] = http_date(last_modified.timestamp())
+    # let the browser keep a copy but revalidate it on every date change
+    patch_cache_control(response, no_cache=True)
+    return response
+
+
+# dates one event stream may watch (a six-week calendar page)
+SLOT_EVENTS_MAX_DATES = 42
+
+# seconds between keepalive comments, so dead connections get noticed
+SLOT_EVENTS_KEEPALIVE = 15
+
+
+@require_GET
+async def slot_events(request):
+    """
+    Server-Sent Events stream of "slot-taken" events for the requested
+    dates (?date=YYYY-MM-DD, repeatable), so open booking modals can grey
+    out a slot the moment someone else books it.
+
+    Needs ASGI: a WSGI worker would have to hold a thread per stream, so
+    there the view answers 204, which tells EventSource not to reconnect.
+    """
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+
+    try:
+        dates = {datetime.strptime(x, "%Y-%m-%d").date() for x in request.GET.getlist("date")}
+    except ValueError:
+        return JsonResponse({"status": "error", "message": "Invalid date format (YYYY-MM-DD)"}, status=400)
+    if not dates or len(dates) > SLOT_EVENTS_MAX_DATES:
+        return JsonResponse(
+            {"status": "error", "message": f"Pass between 1 and {SLOT_EVENTS_MAX_DATES} dates"},
+            status=400
+        )
+
+    client = client_ip(request)
+    queue = events.slot_events.subscribe(dates, client)
+    if queue is None:
+        return JsonResponse({"status": "error", "message": "Too many open event streams"}, status=503)
+
+    async def stream():
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), SLOT_EVENTS_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"event: slot-taken\ndata: {json.dumps(event)}\n\n"
+        finally:
+            events.slot_events.unsubscribe(queue, dates, client)
+
+    response = StreamingHttpResponse(stream(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"  # stop nginx holding events back
+    return response
+
+
+# longest window one range request may ask for
+BOOKED_RANGE_MAX_DAYS = 92
+
+
+def _parse_booking_window(request):
+    """
+    Read month (YYYY-MM) or start/end (YYYY-MM-DD) from the query string.
+    Returns ((start, end), None) or (None, error_response).
+    """
+    month_str = request.GET.get("month")
+    try:
+        if month_str:
+            start = datetime.strptime(month_str, "%Y-%m").date()
+            end = (start.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)
+        else:
+            start = datetime.strptime(request.GET.get("start", ""), "%Y-%m-%d").date()
+            end = datetime.strptime(request.GET.get("end", ""), "%Y-%m-%d").date()
+    except ValueError:
+        return None, JsonResponse(
+            {"status": "error", "message": "Pass month (YYYY-MM) or start and end (YYYY-MM-DD)"},
+            status=400
+        )
+
+    if end < start:
+        return None, JsonResponse({"status": "error", "message": "end must not be before start"}, status=400)
+    if (end - start).days + 1 > BOOKED_RANGE_MAX_DAYS:
+        return None, JsonResponse(
+            {"status": "error", "message": f"Range is limited to {BOOKED_RANGE_MAX_DAYS} days"},
+            status=400
+        )
+    return (start, end), None
+
+
+def _revalidated_json(request, payload):
+    """JsonResponse with an ETag over the payload, or a 304 if the client has it."""
+    etag = quote_etag(hashlib.md5(json.dumps(payload, sort_keys=True).encode()).hexdigest())
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        return not_modified
+
+    response = JsonResponse(payload)
+    response["ETag"] = etag
+    patch_cache_control(response, no_cache=True)
+    return response
+
+
+@require_GET
+def booked_slots_range(request):
+    window, error = _parse_booking_window(request)
+    if error:
+        return error
+    start, end = window
+
+    return _revalidated_json(request, {
+        "status": "ok",
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "days": booked_times_range(start, end),
+    })
+
+
+@require_GET
+def availability(request):
+    """
+    Opening-schedule slots with booked and free times per day, for the
+    booking modal. Pass service (repeatable) to honour per-service limits.
+    """
+    window, error = _parse_booking_window(request)
+    if error:
+        return error
+    start, end = window
+
+    services = [s for s in request.GET.getlist("service") if s]
+    return _revalidated_json(request, {
+        "status": "ok",
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "days": schedule.availability(start, end, services),
+    })
+
+
+NEXT_AVAILABLE_MAX = 50
+
+
+@require_GET
+def next_available(request):
+    """
+    GET ?service=...&from=YYYY-MM-DD&n=10 -> the next n free slots for the
+    services (repeatable), starting today if from is omitted.
+    """
+    today = timezone.localdate()
+    from_str = request.GET.get("from")
+    try:
+        start = datetime.strptime(from_str, "%Y-%m-%d").date() if from_str else today
+        n = min(max(int(request.GET.get("n", 10)), 1), NEXT_AVAILABLE_MAX)
+    except ValueError:
+        return JsonResponse({"status": "error", "message": "Invalid from (YYYY-MM-DD) or n"}, status=400)
+
+    if start < today:
+        start = today
+    found = schedule.next_free_slots(
+        start, n,
+        services=[x for x in request.GET.getlist("service") if x],
+        now=timezone.localtime() if start == today else None,
+    )
+    return JsonResponse({
+        "status": "ok",
+        "slots": [{"date": d.isoformat(), "time": t} for d, t in found],
+    })
+
+
+@sync_to_async
+def _claim_slot(**fields):
+    # acreate() can't open a savepoint, and without one a rejected INSERT
+    # would break any surrounding transaction; this is the same thread hop
+    # acreate() makes internally. The service limits are checked in the same
+    # transaction, so a full service rolls the INSERT back.
+    with transaction.atomic():
+        appt = Appointment.objects.create(**fields)
+        schedule.claim_capacity(appt.date, appt.service)
+        return appt
 
 
 @csrf_exempt
-def create_appointment(request):
+@throttle("booking", identifier=json_field("email"))
+async def create_appointment(request):
     if request.method != "POST":
         return JsonResponse({"status": "error", "message": "Invalid request"}, status=405)
 
@@ -271,61 +809,145 @@ def create_appointment(request):
     except Exception:
         return JsonResponse({"status": "error", "message": "Invalid JSON"}, status=400)
 
-    required = [
-        "service", "date", "time",
-        "first_name", "last_name", "dob",
-        "postcode", "email", "phone", "nhs_number"
-    ]
-    for f in required:
+    for f in Appointment.BOOKING_REQUIRED_FIELDS:
         if not data.get(f):
             return JsonResponse({"status": "error", "message": f"{f} is required"}, status=400)
 
-    if Appointment.objects.filter(date=data["date"], time=data["time"]).exists():
+    try:
+        appt_date = datetime.strptime(str(data["date"]), "%Y-%m-%d").date()
+        appt_time = Appointment._meta.get_field("time").to_python(data["time"])
+    except (ValueError, TypeError, ValidationError):
+        return JsonResponse({"status": "error", "message": "Invalid date or time"}, status=400)
+
+    if not await sync_to_async(schedule.is_open_slot)(appt_date, appt_time):
+        return JsonResponse(
+            {"status": "error", "message": "This time is outside our opening hours. Please choose another time."},
+            status=400
+        )
+
+    # The INSERT itself claims the slot: the unique (date, time) constraint
+    # rejects a second booking, and the service limits are claimed in the
+    # same transaction, so there is no check-then-create race.
+    try:
+        appt = await _claim_slot(
+            service=data["service"],
+            date=appt_date,
+            time=appt_time,
+            first_name=data["first_name"],
+            last_name=data["last_name"],
+            dob=data["dob"],
+            postcode=data["postcode"],
+            email=data["email"],
+            phone=data["phone"],
+            nhs_number=data["nhs_number"],
+            note=data.get("note", "")
+        )
+    except IntegrityError:
         return JsonResponse(
             {"status": "error", "message": "This time slot is already booked. Please choose another time."},
             status=409
         )
+    except schedule.ServiceFull as full:
+        return JsonResponse(
+            {"status": "error", "message": f"{full.service} is fully booked on this day. Please choose another date."},
+            status=409
+        )
 
-    appt = Appointment.objects.create(
-        service=data["service"],
-        date=data["date"],
-        time=data["time"],
-        first_name=data["first_name"],
-        last_name=data["last_name"],
-        dob=data["dob"],
-        postcode=data["postcode"],
-        email=data["email"],
-        phone=data["phone"],
-        nhs_number=data["nhs_number"],
-        note=data.get("note", "")
-    )
-
+    await ainvalidate_booked_times(appt.date)
+    events.publish_slot_taken(appt.date, appt.time)
     return JsonResponse({"status": "ok", "id": appt.id})
 
 
+def _encode_cursor(created_at, pk):
+    raw = f"{created_at.isoformat()}|{pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def _decode_cursor(cursor):
+    raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+    created_at, pk = raw.split("|")
+    return datetime.fromisoformat(created_at), int(pk)
+
+
+ADMIN_APPOINTMENTS_MAX_LIMIT = 500
+
+
 @login_required(login_url='admin_login')
 @user_passes_test(is_superuser, login_url='admin_login')
 def admin_appointments(request):
-    qs = Appointment.objects.all().order_by("-created_at")[:500]
-    data = []
-    for a in qs:
-        data.append({
-            "id": a.id,
-            "name": f"{a.first_name} {a.last_name}",
-            "first_name": a.first_name,
-            "last_name": a.last_name,
-            "service": a.service,
-            "date": a.date.strftime("%d-%m-%Y"),
-            "time": a.time.strftime("%H:%M"),
-            "dob": a.dob,
-            "postcode": a.postcode,
-            "email": a.email,
-            "phone": a.phone,
-            "nhs": a.nhs_number,
-            "note": a.note or "",
-            "created_at": a.created_at.strftime("%d-%m-%Y %H:%M:%S"),
-        })
-    return JsonResponse({"status": "ok", "appointments": data})
+    """
+    Newest-first appointments, filtered server-side and paged by a keyset
+    cursor on (created_at, id) so deep pages cost the same as the first.
+
+    Query params: service (repeatable, matches any of the booked services),
+    date_from / date_to (YYYY-MM-DD, appointment date), q (name, email,
+    phone, NHS number or postcode), limit (max 500), cursor.
+    """
+    qs = Appointment.objects.all()
+
+    services = [s for s in request.GET.getlist("service") if s]
+    if services:
+        service_q = Q()
+        for s in services:
+            service_q |= Q(service__icontains=s)
+        qs = qs.filter(service_q)
+
+    try:
+        date_from = request.GET.get("date_from")
+        if date_from:
+            qs = qs.filter(date__gte=datetime.strptime(date_from, "%Y-%m-%d").date())
+        date_to = request.GET.get("date_to")
+        if date_to:
+            qs = qs.filter(date__lte=datetime.strptime(date_to, "%Y-%m-%d").date())
+    except ValueError:
+        return JsonResponse({"status": "error", "message": "Invalid date format (YYYY-MM-DD)"}, status=400)
+
+    text = (request.GET.get("q") or "").strip()
+    if text:
+        qs = qs.filter(
+            Q(first_name__icontains=text) | Q(last_name__icontains=text)
+            | Q(email__icontains=text) | Q(phone__icontains=text)
+            | Q(nhs_number__icontains=text) | Q(postcode__icontains=text)
+        )
+
+    cursor = request.GET.get("cursor")
+    if cursor:
+        try:
+            created_at, pk = _decode_cursor(cursor)
+        except (ValueError, UnicodeDecodeError):
+            return JsonResponse({"status": "error", "message": "Invalid cursor"}, status=400)
+        qs = qs.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+
+    try:
+        limit = min(max(int(request.GET.get("limit", ADMIN_APPOINTMENTS_MAX_LIMIT)), 1), ADMIN_APPOINTMENTS_MAX_LIMIT)
+    except ValueError:
+        limit = ADMIN_APPOINTMENTS_MAX_LIMIT
+
+    # fetch one extra row to know whether another page exists
+    page = list(qs.order_by("-created_at", "-id")[:limit + 1])
+    next_cursor = None
+    if len(page) > limit:
+        page = page[:limit]
+        next_cursor = _encode_cursor(page[-1].created_at, page[-1].id)
+
+    return JsonResponse({
+        "status": "ok",
+        "appointments": [appointment_row(a) for a in page],
+        "next_cursor": next_cursor,
+    })
+
+
+@login_required(login_url='admin_login')
+@user_passes_test(is_superuser, login_url='admin_login')
+def export_appointments(request):
+    fmt = request.GET.get("format", "csv")
+    if fmt not in EXPORT_FORMATS:
+        return JsonResponse({"status": "error", "message": "format must be csv or ndjson"}, status=400)
+
+    content_type = "text/csv" if fmt == "csv" else "application/x-ndjson"
+    response = _streaming_response(request, stream_appointments(fmt), content_type=content_type)
+    response["Content-Disposition"] = f'attachment; filename="appointments.{fmt}"'
+    return response
 
 
 # =========================
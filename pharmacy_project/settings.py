@@ -37,7 +37,7 @@ INSTALLED_APPS = [
 # ==========================================
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'home.middleware.AsyncWhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -80,10 +80,58 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # wait for the write lock instead of failing straight away when
+        # several bookings land at once
+        'OPTIONS': {
+            'timeout': 20,
+            'transaction_mode': 'IMMEDIATE',
+        },
+        # file-backed so concurrent test threads get real locking
+        'TEST': {
+            'NAME': BASE_DIR / 'test_db.sqlite3',
+        },
     }
 }
 
 
+# ==========================================
+# CACHE
+# ==========================================
+# per-process memory cache; used for hot read paths like booked slots
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'pharmacy-default',
+        'OPTIONS': {
+            'MAX_ENTRIES': 5000,
+        },
+    },
+    # sliding-window counters for home.throttle, kept apart so they can't
+    # push booking entries out of "default"
+    'throttle': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'pharmacy-throttle',
+        'OPTIONS': {
+            'MAX_ENTRIES': 20000,
+        },
+    },
+}
+
+# (requests, seconds) allowed per client IP and per identifier (the email
+# being logged in, signed up or booked for); a scope left out isn't throttled
+THROTTLE_RATES = {
+    'login': {'ip': (20, 60), 'identifier': (5, 60)},
+    'signup': {'ip': (5, 600), 'identifier': (3, 600)},
+    'booking': {'ip': (20, 60), 'identifier': (10, 600)},
+}
+
+# proxies in front of the app that append the client's address to
+# X-Forwarded-For (Render's load balancer is one); home.throttle.client_ip
+# reads the address that many entries from the right. 0 when clients
+# connect directly, or anyone could pick their own address.
+TRUSTED_PROXIES = 1
+
+
 # ==========================================
 # PASSWORD VALIDATION
 # ==========================================
@@ -118,11 +166,40 @@ STATICFILES_DIRS = [
 STATIC_ROOT = BASE_DIR / "staticfiles"
 
 
+# ==========================================
+# ACTIVITY ARCHIVE
+# ==========================================
+# archive_activity moves old UserActivity rows here as one gzipped JSONL
+# file per month (activity-YYYY-MM.jsonl.gz)
+ACTIVITY_ARCHIVE_DIR = BASE_DIR / "archive" / "activity"
+
+
 # ==========================================
 # LOGIN / AUTH SETTINGS
 # ==========================================
 LOGIN_URL = '/login/'
 
+# login_user signs in by email; admin_login still uses the username
+AUTHENTICATION_BACKENDS = [
+    'home.backends.EmailBackend',
+    'django.contrib.auth.backends.ModelBackend',
+]
+
+# New and changed passwords use scrypt (hashlib's, memory-hard, cheaper in
+# CPU than PBKDF2 at 1,000,000 rounds). Existing PBKDF2 hashes still verify
+# and are re-hashed with scrypt on the next successful login.
+PASSWORD_HASHERS = [
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+]
+
+# threads running password hashes for login/signup (home.hashing);
+# None means one per core, at most 4
+PASSWORD_HASHING_WORKERS = None
+
 
 # ==========================================
 # DEFAULT PRIMARY KEY FIELD TYPE
@@ -1,6 +1,8 @@
 console.log("ADMIN DASHBOARD JS LOADED ✅");
 
 let ALL_APPOINTMENTS = [];
+let NEXT_CURSOR = null;   // keyset cursor for the next page (list view)
+let SEARCH_TEXT = "";
 
 // view state
 let currentView = "week"; // week | month | day | list
@@ -157,6 +159,81 @@ function sameDate(a, b) {
     && a.getDate() === b.getDate();
 }
 
+function toISODate(d) {
+  return `${d.getFullYear()}-${String(d.getMonth() + 1).padStart(2, "0")}-${String(d.getDate()).padStart(2, "0")}`;
+}
+
+/* ================= SERVER FETCH ================= */
+
+// date window the current view shows (null = list view, no window)
+function visibleRange() {
+  if (currentView === "week") {
+    const start = addDays(startOfWeek(new Date()), offset * 7);
+    return [start, addDays(start, 6)];
+  }
+  if (currentView === "month") {
+    const base = startOfMonth(new Date());
+    const monthStart = new Date(base.getFullYear(), base.getMonth() + offset, 1);
+    const start = startOfWeek(monthStart);
+    return [start, addDays(start, 41)];
+  }
+  if (currentView === "day") {
+    const d = addDays(startOfDay(new Date()), offset);
+    return [d, d];
+  }
+  return null;
+}
+
+function appointmentsQuery(cursor) {
+  const params = new URLSearchParams();
+  FILTER_SELECTED_SERVICES.forEach(s => params.append("service", s));
+
+  const range = visibleRange();
+  if (range) {
+    params.set("date_from", toISODate(range[0]));
+    params.set("date_to", toISODate(range[1]));
+  }
+  if (SEARCH_TEXT) params.set("q", SEARCH_TEXT);
+  if (cursor) params.set("cursor", cursor);
+  return params;
+}
+
+// ✅ calendar views load every page of their window; list view loads one page at a time
+async function loadAppointments(append = false) {
+  const calendarView = currentView !== "list";
+  let cursor = append ? NEXT_CURSOR : null;
+  let rows = append ? ALL_APPOINTMENTS.slice() : [];
+
+  try {
+    do {
+      const res = await fetch(`/admin-dashboard/appointments/?${appointmentsQuery(cursor)}`);
+      const data = await res.json();
+      if (data.status !== "ok") return;
+
+      rows = rows.concat(data.appointments || []);
+      cursor = data.next_cursor || null;
+    } while (calendarView && cursor);
+  } catch (err) {
+    console.error("APPOINTMENTS FETCH ERROR:", err);
+    return;
+  }
+
+  ALL_APPOINTMENTS = rows;
+  NEXT_CURSOR = cursor;
+  render();
+}
+
+// ✅ hour rows from the booking schedule (rendered by the server)
+function calendarHours() {
+  const el = document.getElementById("calendar-hours");
+  try {
+    return el ? JSON.parse(el.textContent) : [];
+  } catch (e) {
+    console.warn("Bad calendar-hours JSON", e);
+    return [];
+  }
+}
+
 /* ================= UI HELPERS ================= */
 
 function escapeHtml(str) {
@@ -252,6 +329,20 @@ document.addEventListener("DOMContentLoaded", () => {
 
   initServicesFilterDropdown();
 
+  // ✅ Text search (server-side, debounced)
+  const searchInput = document.getElementById("apSearchInput");
+  if (searchInput) {
+    let searchTimer = null;
+    searchInput.addEventListener("input", () => {
+      clearTimeout(searchTimer);
+      searchTimer = setTimeout(() => {
+        SEARCH_TEXT = searchInput.value.trim();
+        closeDetailPanel();
+        loadAppointments();
+      }, 300);
+    });
+  }
+
   // ✅ DETAIL PANEL CLOSE BUTTON
   const closeBtn = document.getElementById("apDetailCloseBtn");
   if (closeBtn) closeBtn.addEventListener("click", () => closeDetailPanel());
@@ -275,8 +366,10 @@ document.addEventListener("DOMContentLoaded", () => {
       UI_SELECTED_SERVICES.clear();
       const label = document.getElementById("servicesFilterLabel");
       if (label) label.textContent = "All";
+      SEARCH_TEXT = "";
+      if (searchInput) searchInput.value = "";
       closeDetailPanel();
-      render();
+      loadAppointments();
     });
   }
 
@@ -298,25 +391,17 @@ document.addEventListener("DOMContentLoaded", () => {
       currentView = btn.dataset.view || "week";
       offset = 0;
       closeDetailPanel();
-      render();
+      loadAppointments();
     });
   });
 
   // nav
-  if (btnPrev) btnPrev.addEventListener("click", () => { offset -= 1; closeDetailPanel(); render(); });
-  if (btnNext) btnNext.addEventListener("click", () => { offset += 1; closeDetailPanel(); render(); });
-  if (btnThis) btnThis.addEventListener("click", () => { offset = 0; closeDetailPanel(); render(); });
+  if (btnPrev) btnPrev.addEventListener("click", () => { offset -= 1; closeDetailPanel(); loadAppointments(); });
+  if (btnNext) btnNext.addEventListener("click", () => { offset += 1; closeDetailPanel(); loadAppointments(); });
+  if (btnThis) btnThis.addEventListener("click", () => { offset = 0; closeDetailPanel(); loadAppointments(); });
 
   // fetch appointments
-  fetch("/admin-dashboard/appointments/")
-    .then(res => res.json())
-    .then(data => {
-      console.log("APPOINTMENTS API RESPONSE:", data);
-      if (data.status !== "ok") return;
-      ALL_APPOINTMENTS = data.appointments || [];
-      render();
-    })
-    .catch(err => console.error("APPOINTMENTS FETCH ERROR:", err));
+  loadAppointments();
 });
 
 /* ============================ SERVICES FILTER DROPDOWN ============================ */
@@ -407,7 +492,7 @@ function initServicesFilterDropdown() {
     FILTER_SELECTED_SERVICES = new Set(UI_SELECTED_SERVICES);
     closeDD();
     closeDetailPanel();
-    render();
+    loadAppointments();
   });
 
   label.textContent = "All";
@@ -548,15 +633,7 @@ function renderDay() {
 
   setRangeText(`${dayDate.getDate()} ${monthShort(dayDate.getMonth())}, ${dayDate.getFullYear()}`);
 
-  const slots = [
-    { label: "9 AM",  time: "09:00" },
-    { label: "10 AM", time: "10:00" },
-    { label: "11 AM", time: "11:00" },
-    { label: "12 PM", time: "12:00" },
-    { label: "1 PM",  time: "13:00" },
-    { label: "2 PM",  time: "14:00" },
-    { label: "3 PM",  time: "15:00" },
-  ];
+  const slots = calendarHours();
 
   dayBox.innerHTML = `
     <div class="ap-cal-head" id="apDayHead">
@@ -683,6 +760,20 @@ function renderList() {
 
     body.appendChild(row);
   });
+
+  // ✅ next page from the server (keyset cursor)
+  if (NEXT_CURSOR) {
+    const more = document.createElement("button");
+    more.type = "button";
+    more.className = "ap-btn light";
+    more.textContent = "Load more";
+    more.addEventListener("click", (e) => {
+      e.stopPropagation();
+      more.disabled = true;
+      loadAppointments(true);
+    });
+    body.appendChild(more);
+  }
 }
 
 /* ================= PRINT HELPERS ================= */
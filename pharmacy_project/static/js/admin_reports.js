@@ -61,8 +61,38 @@ function buildDonutChart(ctx, bookedTotal, openTotal) {
   });
 }
 
-async function loadReports(days = 30) {
-  const res = await fetch(`/admin-dashboard/reports/data/?days=${days}`);
+function toISODate(d) {
+  const y = d.getFullYear();
+  const m = String(d.getMonth() + 1).padStart(2, "0");
+  const day = String(d.getDate()).padStart(2, "0");
+  return `${y}-${m}-${day}`;
+}
+
+// "30" = the next 30 days by day; "past:365:week" = the last 365 days by week
+function reportQuery(choice) {
+  const [kind, days, bucket] = String(choice).split(":");
+  if (kind !== "past") return new URLSearchParams({ days: kind });
+
+  const end = new Date();
+  const start = new Date();
+  start.setDate(end.getDate() - Number(days) + 1);
+  return new URLSearchParams({ start: toISODate(start), end: toISODate(end), bucket });
+}
+
+function updateExportLinks(query) {
+  for (const [id, format] of [["rpExportCsv", "csv"], ["rpExportXlsx", "xlsx"]]) {
+    const link = document.getElementById(id);
+    if (!link) continue;
+    const params = new URLSearchParams(query);
+    params.set("format", format);
+    link.href = `/admin-dashboard/reports/export/?${params}`;
+  }
+}
+
+async function loadReports(choice = "30") {
+  const query = reportQuery(choice);
+  updateExportLinks(query);
+  const res = await fetch(`/admin-dashboard/reports/data/?${query}`);
   const data = await res.json();
 
   if (data.status !== "ok") return;
@@ -78,11 +108,13 @@ async function loadReports(days = 30) {
   const totalBooked = booked.reduce((a, b) => a + (Number(b) || 0), 0);
   const totalOpen = open.reduce((a, b) => a + (Number(b) || 0), 0);
 
+  const bucket = data.bucket || "day";
   const avgBooked = booked.length ? (totalBooked / booked.length).toFixed(1) : "0";
   const slotsPerDay = data.total_slots_per_day ?? "—";
 
-  if (meta1) meta1.textContent = `Total: ${totalBooked} • Avg/day: ${avgBooked}`;
-  if (meta2) meta2.textContent = `Slots/day: ${slotsPerDay} • Last ${days} days`;
+  document.querySelectorAll(".rpBucket").forEach((el) => { el.textContent = bucket; });
+  if (meta1) meta1.textContent = `Total: ${totalBooked} • Avg/${bucket}: ${avgBooked}`;
+  if (meta2) meta2.textContent = `Slots/day: ${slotsPerDay} • ${data.start} to ${data.end}`;
   if (meta3) meta3.textContent = `Booked: ${totalBooked} • Open: ${totalOpen}`;
 
   // destroy old charts
@@ -111,13 +143,66 @@ async function loadReports(days = 30) {
   }
 }
 
+function escapeHtml(text) {
+  const div = document.createElement("div");
+  div.textContent = text;
+  return div.innerHTML;
+}
+
+function renderHeatmap(box, heatmap) {
+  const { weekdays, hours, services } = heatmap;
+  if (!services.length) {
+    box.innerHTML = '<div class="rp-card-sub">No bookings in this period.</div>';
+    return;
+  }
+
+  const max = Math.max(1, ...services.flatMap((s) => s.cells.flat()));
+  const head = hours.map((h) => `<th>${String(h).padStart(2, "0")}:00</th>`).join("");
+
+  box.innerHTML = services.map((s) => {
+    const rows = s.cells.map((row, wd) => {
+      const cells = row.map((n) => {
+        const alpha = n ? (0.15 + 0.85 * n / max).toFixed(2) : 0;
+        return `<td style="background: rgba(37, 99, 235, ${alpha});">${n || ""}</td>`;
+      }).join("");
+      return `<tr><th>${weekdays[wd]}</th>${cells}</tr>`;
+    }).join("");
+
+    return `<table>
+      <caption class="rp-card-title">${escapeHtml(s.service)} (${s.total})</caption>
+      <tr><th></th>${head}</tr>
+      ${rows}
+    </table>`;
+  }).join("");
+}
+
+async function loadHeatmap() {
+  const box = document.getElementById("rpHeatmap");
+  if (!box) return;
+
+  const res = await fetch("/admin-dashboard/reports/heatmap/");
+  const data = await res.json();
+  if (data.status !== "ok") return;
+
+  renderHeatmap(box, data.heatmap);
+
+  const lead = data.lead_time_days;
+  const meta = document.getElementById("rpLeadTime");
+  if (meta) {
+    meta.textContent = lead.count
+      ? `Booked ahead: median ${lead.p50} days • 90% within ${lead.p90} days`
+      : "Booked ahead: —";
+  }
+}
+
 document.addEventListener("DOMContentLoaded", () => {
   const sel = document.getElementById("rpDays");
-  loadReports(sel ? Number(sel.value) : 30);
+  loadReports(sel ? sel.value : "30");
+  loadHeatmap();
 
   if (sel) {
     sel.addEventListener("change", () => {
-      loadReports(Number(sel.value));
+      loadReports(sel.value);
     });
   }
 });
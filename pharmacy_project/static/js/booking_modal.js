@@ -82,6 +82,12 @@ document.addEventListener("DOMContentLoaded", () => {
   // ✅ Booked times for currently selected date
   let BOOKED_TIMES = new Set();
 
+  // ✅ Booked times per ISO date, prefetched a month at a time
+  const BOOKED_BY_DATE = new Map();
+
+  // ✅ Schedule per ISO date: { slots: ["09:00", ...], full: bool } (from /appointments/availability/)
+  const DAY_INFO = new Map();
+
   // ✅ UPDATED SERVICES LIST (Vaccines added)
   const SERVICES = Array.isArray(window.BOOKING_SERVICES) && window.BOOKING_SERVICES.length
     ? window.BOOKING_SERVICES
@@ -182,28 +188,117 @@ document.addEventListener("DOMContentLoaded", () => {
     return `${y}-${m}-${d}`;
   }
 
-  // ✅ Fetch booked slots from backend
-  async function fetchBookedSlots(dateObj) {
+  function toHHMMSet(times) {
+    const out = new Set();
+    (times || []).forEach(t => {
+      const hhmm = String(t).slice(0, 5);
+      if (hhmm && hhmm.includes(":")) out.add(hhmm);
+    });
+    return out;
+  }
+
+  // ✅ Load schedule + booked slots for a window in one request
+  async function fetchAvailability(params) {
+    state.services.forEach(s => params.append("service", s));
+
+    try {
+      const res = await fetch(`/appointments/availability/?${params}`, { cache: "no-cache" });
+      const data = await res.json();
+
+      if (res.ok && data.status === "ok" && data.days) {
+        Object.entries(data.days).forEach(([dateStr, day]) => {
+          const booked = toHHMMSet(day.booked);
+          DAY_INFO.set(dateStr, {
+            slots: day.slots || [],
+            full: !(day.free || []).length && booked.size < (day.slots || []).length,
+          });
+          BOOKED_BY_DATE.set(dateStr, booked);
+        });
+      }
+    } catch (e) {
+      console.warn("Availability fetch failed:", e);
+    }
+  }
+
+  // ✅ Prefetch a whole month in one request
+  function prefetchBookedMonth(year, month) {
+    const monthStr = `${year}-${String(month + 1).padStart(2, "0")}`;
+    return fetchAvailability(new URLSearchParams({ month: monthStr }));
+  }
+
+  // ✅ Fetch booked slots from backend (prefetched month first unless fresh)
+  async function fetchBookedSlots(dateObj, fresh = false) {
     BOOKED_TIMES = new Set();
     if (!dateObj) return;
 
     const dateStr = toISODateOnly(dateObj);
 
+    if (!DAY_INFO.has(dateStr)) {
+      await fetchAvailability(new URLSearchParams({ start: dateStr, end: dateStr }));
+    }
+
+    if (!fresh && BOOKED_BY_DATE.has(dateStr)) {
+      BOOKED_TIMES = new Set(BOOKED_BY_DATE.get(dateStr));
+      return;
+    }
+
     try {
-      const res = await fetch(`/appointments/booked/?date=${encodeURIComponent(dateStr)}`);
+      // "no-cache" revalidates with ETag, so unchanged days come back as 304
+      const res = await fetch(`/appointments/booked/?date=${encodeURIComponent(dateStr)}`, { cache: "no-cache" });
       const data = await res.json();
 
       if (res.ok && data.status === "ok" && Array.isArray(data.times)) {
-        data.times.forEach(t => {
-          const hhmm = String(t).slice(0, 5);
-          if (hhmm && hhmm.includes(":")) BOOKED_TIMES.add(hhmm);
-        });
+        BOOKED_TIMES = toHHMMSet(data.times);
+        BOOKED_BY_DATE.set(dateStr, new Set(BOOKED_TIMES));
       }
     } catch (e) {
       console.warn("Booked slots fetch failed:", e);
     }
   }
 
+  // ✅ Live "slot taken" pushes for the open day (SSE); 409 on submit stays the fallback
+  let slotEvents = null;
+  let watchedDate = null;
+
+  function stopWatchingSlots() {
+    if (slotEvents) slotEvents.close();
+    slotEvents = null;
+    watchedDate = null;
+  }
+
+  function watchSlots(dateObj) {
+    if (!window.EventSource || !dateObj) return;
+    const dateStr = toISODateOnly(dateObj);
+    if (dateStr === watchedDate) return;
+
+    stopWatchingSlots();
+    watchedDate = dateStr;
+    slotEvents = new EventSource(`/appointments/events/?date=${encodeURIComponent(dateStr)}`);
+
+    slotEvents.addEventListener("slot-taken", (e) => {
+      let ev;
+      try {
+        ev = JSON.parse(e.data);
+      } catch (err) {
+        return;
+      }
+
+      const taken = BOOKED_BY_DATE.get(ev.date) || new Set();
+      taken.add(ev.time);
+      BOOKED_BY_DATE.set(ev.date, taken);
+
+      if (!state.date || toISODateOnly(state.date) !== ev.date || stepIndex === 4) return;
+      BOOKED_TIMES.add(ev.time);
+
+      if (state.time === ev.time) {
+        state.time = null;
+        Swal.fire("Slot just taken", "Someone has just booked this time. Please choose another.", "info");
+        showStep(1);
+      }
+      renderTimeSlots();
+    });
+  }
+
   // ---------- UI ----------
   function showStep(i) {
     stepIndex = i;
@@ -231,8 +326,11 @@ document.addEventListener("DOMContentLoaded", () => {
   }
 
   function resetAll() {
+    stopWatchingSlots();
     state = { services: [], date: null, time: null, account: "guest" };
     BOOKED_TIMES = new Set();
+    BOOKED_BY_DATE.clear();
+    DAY_INFO.clear();
     if (serviceSearch) serviceSearch.value = "";
     renderServices("");
     clearSelectionUI();
@@ -300,6 +398,8 @@ document.addEventListener("DOMContentLoaded", () => {
     ];
     calMonthLabel.textContent = `${monthNames[month]} ${year}`;
 
+    prefetchBookedMonth(year, month).then(() => markClosedDays(year, month));
+
     const first = new Date(year, month, 1);
     const last = new Date(year, month + 1, 0);
     const daysInMonth = last.getDate();
@@ -320,12 +420,14 @@ document.addEventListener("DOMContentLoaded", () => {
       const cell = document.createElement("div");
       cell.className = "cal-day";
       cell.textContent = day;
+      cell.dataset.date = toISODateOnly(dateObj);
 
       if (isPastDate(dateObj)) {
         cell.classList.add("disabled");
         cell.title = "Past date (disabled)";
       } else {
         cell.addEventListener("click", async () => {
+          if (cell.classList.contains("disabled")) return;
           calGrid.querySelectorAll(".cal-day").forEach(x => x.classList.remove("selected"));
           cell.classList.add("selected");
 
@@ -344,30 +446,57 @@ document.addEventListener("DOMContentLoaded", () => {
     }
   }
 
-  function makeSlots(startHHMM, count, stepMin) {
-    const [hh, mm] = startHHMM.split(":").map(Number);
-    const out = [];
-    let total = hh * 60 + mm;
-    for (let i = 0; i < count; i++) {
-      const h = Math.floor(total / 60);
-      const m = total % 60;
-      out.push(`${String(h).padStart(2, "0")}:${String(m).padStart(2, "0")}`);
-      total += stepMin;
-    }
-    return out;
+  // ✅ grey out days the schedule has no free slots for (closed / fully booked)
+  function markClosedDays(year, month) {
+    if (!calGrid || year !== currentYear || month !== currentMonth) return;
+
+    calGrid.querySelectorAll(".cal-day[data-date]").forEach(cell => {
+      const info = DAY_INFO.get(cell.dataset.date);
+      if (!info || cell.classList.contains("disabled")) return;
+
+      const booked = BOOKED_BY_DATE.get(cell.dataset.date) || new Set();
+      if (!info.slots.length) {
+        cell.classList.add("disabled");
+        cell.title = "Closed";
+      } else if (info.full || booked.size >= info.slots.length) {
+        cell.classList.add("disabled");
+        cell.title = "Fully booked";
+      }
+    });
+  }
+
+  // ✅ slots for the selected day, grouped by hour
+  function slotGroups(dateObj) {
+    const info = dateObj ? DAY_INFO.get(toISODateOnly(dateObj)) : null;
+    const groups = [];
+    (info ? info.slots : []).forEach(t => {
+      const hour = `${t.slice(0, 2)}:00`;
+      let g = groups.find(x => x.hour === hour);
+      if (!g) {
+        g = { hour, slots: [] };
+        groups.push(g);
+      }
+      g.slots.push(t);
+    });
+    return groups;
   }
 
   function renderTimeSlots() {
     if (!timeGroups) return;
     timeGroups.innerHTML = "";
+    if (state.date && !isPastDate(state.date)) watchSlots(state.date);
 
     const dateOk = state.date && !isPastDate(state.date);
 
-    const groups = [
-      { hour: "09:00", slots: makeSlots("09:00", 12, 5) },
-      { hour: "10:00", slots: makeSlots("10:00", 12, 5) },
-      { hour: "11:00", slots: makeSlots("11:00", 12, 5) },
-    ];
+    const groups = slotGroups(state.date);
+    const dayInfo = state.date ? DAY_INFO.get(toISODateOnly(state.date)) : null;
+    const dayFull = !!(dayInfo && dayInfo.full);
+
+    if (state.date && !groups.length) {
+      timeGroups.innerHTML = `<div class="muted">No appointments available on this day.</div>`;
+      showNextAvailable(state.date);
+      return;
+    }
 
     groups.forEach(g => {
       const group = document.createElement("div");
@@ -392,12 +521,14 @@ document.addEventListener("DOMContentLoaded", () => {
         b.className = "slot";
         b.textContent = hhmm;
 
-        if (!dateOk || isBooked) {
+        if (!dateOk || isBooked || dayFull) {
           b.disabled = true;
           b.classList.add("disabled");
           if (isBooked) {
             b.classList.add("booked");
             b.title = "Already booked";
+          } else if (dayFull) {
+            b.title = "Fully booked for this service";
           }
         } else {
           b.addEventListener("click", () => {
@@ -413,6 +544,65 @@ document.addEventListener("DOMContentLoaded", () => {
 
       timeGroups.appendChild(group);
     });
+
+    const allTaken = groups.every(g => g.slots.every(t => BOOKED_TIMES.has(t)));
+    if (state.date && dateOk && (dayFull || allTaken)) showNextAvailable(state.date);
+  }
+
+  // ✅ Day is full: offer the next free slots from the server instead of day-by-day clicking
+  async function showNextAvailable(fromDate) {
+    const params = new URLSearchParams({ from: toISODateOnly(fromDate), n: "3" });
+    state.services.forEach(s => params.append("service", s));
+
+    let slots = [];
+    try {
+      const res = await fetch(`/appointments/next-available/?${params}`);
+      const data = await res.json();
+      if (res.ok && data.status === "ok") slots = data.slots || [];
+    } catch (e) {
+      console.warn("Next available fetch failed:", e);
+      return;
+    }
+    if (!slots.length || !timeGroups) return;
+
+    const box = document.createElement("div");
+    box.className = "time-group";
+    box.innerHTML = `
+      <div class="time-group-head">
+        <i class="bi bi-lightning"></i>
+        <strong>Next available</strong>
+      </div>
+      <div class="slots"></div>
+    `;
+
+    const wrap = box.querySelector(".slots");
+    slots.forEach(s => {
+      const [y, m, d] = s.date.split("-").map(Number);
+      const dateObj = new Date(y, m - 1, d);
+      dateObj.setHours(0, 0, 0, 0);
+
+      const b = document.createElement("button");
+      b.type = "button";
+      b.className = "slot";
+      b.textContent = `${formatChipDate(dateObj)}, ${s.time}`;
+      b.addEventListener("click", async () => {
+        state.date = dateObj;
+        state.time = s.time;
+        currentYear = dateObj.getFullYear();
+        currentMonth = dateObj.getMonth();
+        buildCalendar(currentYear, currentMonth);
+
+        await fetchBookedSlots(state.date);
+        renderTimeSlots();
+
+        const btn = [...timeGroups.querySelectorAll(".slot")].find(x => x.textContent.trim() === s.time);
+        if (btn) btn.classList.add("selected");
+        showStep(1);
+      });
+      wrap.appendChild(b);
+    });
+
+    timeGroups.appendChild(box);
   }
 
   function canGoNext() {
@@ -524,6 +714,7 @@ document.addEventListener("DOMContentLoaded", () => {
   });
 
   if (btnClose) btnClose.addEventListener("click", () => bookingModal.hide());
+  modalEl.addEventListener("hidden.bs.modal", () => stopWatchingSlots());
   if (btnBack) btnBack.addEventListener("click", () => { if (stepIndex > 0) showStep(stepIndex - 1); });
 
   if (btnNext) {
@@ -532,6 +723,13 @@ document.addEventListener("DOMContentLoaded", () => {
         Swal.fire("Select Required", "Please complete this step first.", "info");
         return;
       }
+
+      // ✅ services chosen: reload availability so per-service limits apply
+      if (stepIndex === 0) {
+        BOOKED_BY_DATE.clear();
+        DAY_INFO.clear();
+        buildCalendar(currentYear, currentMonth);
+      }
       showStep(stepIndex + 1);
     });
   }
@@ -566,13 +764,14 @@ document.addEventListener("DOMContentLoaded", () => {
         if (!res.ok || data.status !== "ok") {
           Swal.fire("Error", data.message || "Could not save appointment.", "error");
           if (state.date) {
-            await fetchBookedSlots(state.date);
+            await fetchBookedSlots(state.date, true);
             renderTimeSlots();
           }
           return;
         }
 
         BOOKED_TIMES.add(String(state.time).slice(0,5));
+        BOOKED_BY_DATE.set(toISODateOnly(state.date), new Set(BOOKED_TIMES));
         renderTimeSlots();
 
         const fullName = `${payload.first_name} ${payload.last_name}`.trim();